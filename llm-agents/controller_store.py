@@ -0,0 +1,191 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from langgraph.checkpoint.memory import InMemorySaver
+
+
+CONTROLLER_DB = os.getenv("CONTROLLER_DB", os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '..', 'results', 'controller.sqlite')
+))
+# Seconds of event history restored into the temporal rule engine on restart
+STORE_EVENT_RETENTION = float(os.getenv("STORE_EVENT_RETENTION", str(24 * 3600)))
+# Seconds finished automation runs are kept (their keys stop repeats across restarts)
+STORE_ACTION_RETENTION = float(os.getenv("STORE_ACTION_RETENTION", str(7 * 24 * 3600)))
+# Seconds between deletes of expired automation runs
+ACTION_PRUNE_INTERVAL = 60.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rules (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, controller TEXT, text TEXT, compiled TEXT,
+    created_at REAL, active INTEGER DEFAULT 1
+);
+CREATE TABLE IF NOT EXISTS subscriptions (
+    controller TEXT, uri TEXT, name TEXT, PRIMARY KEY (controller, uri)
+);
+CREATE TABLE IF NOT EXISTS cursors (
+    controller TEXT, uri TEXT, timestamp TEXT, updated_at REAL, PRIMARY KEY (controller, uri)
+);
+CREATE TABLE IF NOT EXISTS events (
+    controller TEXT, name TEXT, at REAL, data TEXT
+);
+CREATE INDEX IF NOT EXISTS events_by_time ON events (controller, at);
+CREATE TABLE IF NOT EXISTS actions (
+    controller TEXT, key TEXT, description TEXT, status TEXT, started_at REAL, finished_at REAL,
+    PRIMARY KEY (controller, key)
+);
+"""
+
+
+def connect(path: str = CONTROLLER_DB) -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    # WAL keeps committed transactions durable across process crashes with NORMAL sync
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def event_time(timestamp: str) -> float:
+    """Epoch seconds of an ISO timestamp from the WoT MCP event buffer."""
+    return datetime.fromisoformat(timestamp.replace("Z", "+00:00")).timestamp()
+
+
+class ControllerStore:
+    """
+    Durable state of a controller in a local SQLite file (WAL journal), so a restart resumes
+    where the previous run stopped:
+    - rules, with their compiled local form, so nothing is sent to the LLM again;
+    - the subscribed resources;
+    - per event resource, the timestamp of the last event that was fully processed;
+    - recent events, to rebuild the temporal rule engine's history;
+    - automation side effects, keyed so an automation is never run twice.
+    Several controllers can share a file (and a connection); every row is scoped by the
+    controller name.
+    """
+    def __init__(self, path: str = CONTROLLER_DB, controller: str = "reactive",
+                 connection: Optional[sqlite3.Connection] = None):
+        self.path = path
+        self.controller = controller
+        self.conn = connection or connect(path)
+        self._owns_connection = connection is None
+        self._events: List[tuple] = []
+        self._pruned_at = 0.0
+        self._lock = threading.Lock()
+
+    def add_rule(self, text: str, compiled: Optional[Dict] = None) -> int:
+        with self._lock, self.conn:
+            cursor = self.conn.execute(
+                "INSERT INTO rules (controller, text, compiled, created_at) VALUES (?, ?, ?, ?)",
+                (self.controller, text, json.dumps(compiled) if compiled else None, time.time()))
+        return cursor.lastrowid
+
+    def rules(self) -> List[Dict]:
+        """Active rules in the order they were added: {id, text, compiled}."""
+        rows = self.conn.execute(
+            "SELECT id, text, compiled FROM rules WHERE controller = ? AND active = 1 ORDER BY id",
+            (self.controller,)).fetchall()
+        return [{"id": id, "text": text, "compiled": json.loads(compiled) if compiled else None}
+                for id, text, compiled in rows]
+
+    def remove_rule(self, rule_id: int):
+        with self._lock, self.conn:
+            self.conn.execute("UPDATE rules SET active = 0 WHERE controller = ? AND id = ?", (self.controller, rule_id))
+
+    def set_subscriptions(self, resources: Dict[str, str]):
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM subscriptions WHERE controller = ?", (self.controller,))
+            self.conn.executemany("INSERT INTO subscriptions VALUES (?, ?, ?)",
+                                  [(self.controller, uri, name) for uri, name in resources.items()])
+
+    def subscriptions(self) -> Dict[str, str]:
+        rows = self.conn.execute("SELECT uri, name FROM subscriptions WHERE controller = ?", (self.controller,))
+        return dict(rows.fetchall())
+
+    def cursors(self) -> Dict[str, str]:
+        """Event resource URI -> timestamp of its last processed event."""
+        rows = self.conn.execute("SELECT uri, timestamp FROM cursors WHERE controller = ?", (self.controller,))
+        return dict(rows.fetchall())
+
+    def set_cursors(self, cursors: Dict[str, str]):
+        if not cursors:
+            return
+        now = time.time()
+        with self._lock, self.conn:
+            self.conn.executemany(
+                "INSERT INTO cursors VALUES (?, ?, ?, ?) ON CONFLICT (controller, uri) DO UPDATE SET "
+                "timestamp = max(timestamp, excluded.timestamp), updated_at = excluded.updated_at",
+                [(self.controller, uri, timestamp, now) for uri, timestamp in cursors.items()])
+
+    def log_event(self, name: str, at: float, data: Any = None):
+        """Buffer an event for the history; written by flush()."""
+        with self._lock:
+            self._events.append((self.controller, name, at, json.dumps(data) if data is not None else None))
+
+    def flush(self, retention: float = STORE_EVENT_RETENTION, action_retention: float = STORE_ACTION_RETENTION):
+        """Write buffered events and delete expired events and finished automation runs."""
+        with self._lock:
+            now = time.time()
+            prune = now - self._pruned_at >= ACTION_PRUNE_INTERVAL
+            if not self._events and not prune:
+                return
+            events, self._events = self._events, []
+            with self.conn:
+                if events:
+                    self.conn.executemany("INSERT INTO events VALUES (?, ?, ?, ?)", events)
+                    self.conn.execute("DELETE FROM events WHERE controller = ? AND at < ?",
+                                      (self.controller, now - retention))
+                if prune:
+                    # Interrupted runs ('started') are kept: they are reported at the next start
+                    self.conn.execute("DELETE FROM actions WHERE controller = ? AND status != 'started' "
+                                      "AND finished_at < ?", (self.controller, now - action_retention))
+                    self._pruned_at = now
+
+    def recent_events(self, since: float) -> List[Tuple[str, float, Any]]:
+        rows = self.conn.execute(
+            "SELECT name, at, data FROM events WHERE controller = ? AND at >= ? ORDER BY at",
+            (self.controller, since)).fetchall()
+        return [(name, at, json.loads(data) if data is not None else None) for name, at, data in rows]
+
+    def begin_action(self, key: str, description: str = "") -> bool:
+        """Claim an automation run; False if it was already started (before a restart, too)."""
+        with self._lock, self.conn:
+            cursor = self.conn.execute(
+                "INSERT OR IGNORE INTO actions VALUES (?, ?, ?, 'started', ?, NULL)",
+                (self.controller, key, description, time.time()))
+        return cursor.rowcount == 1
+
+    def finish_action(self, key: str, status: str = "done"):
+        with self._lock, self.conn:
+            self.conn.execute("UPDATE actions SET status = ?, finished_at = ? WHERE controller = ? AND key = ?",
+                              (status, time.time(), self.controller, key))
+
+    def unfinished_actions(self) -> List[Dict]:
+        """Automations interrupted by a crash; they are not run again."""
+        rows = self.conn.execute(
+            "SELECT key, description, started_at FROM actions WHERE controller = ? AND status = 'started'",
+            (self.controller,)).fetchall()
+        return [{"key": key, "description": description, "started_at": started_at}
+                for key, description, started_at in rows]
+
+    def close(self):
+        self.flush()
+        if self._owns_connection:
+            self.conn.close()
+
+
+async def open_checkpointer(path: str = CONTROLLER_DB):
+    """Agent checkpointer in the store's file (needs langgraph-checkpoint-sqlite), else in memory."""
+    try:
+        import aiosqlite
+        from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+    except ImportError:
+        print("⚠️  langgraph-checkpoint-sqlite not installed - agent conversations are kept in memory only")
+        return InMemorySaver()
+    saver = AsyncSqliteSaver(await aiosqlite.connect(path))
+    await saver.setup()
+    return saver
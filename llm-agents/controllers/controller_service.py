@@ -0,0 +1,526 @@
+import asyncio
+import contextlib
+import hashlib
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, List, Optional
+import mcp.types as types
+import uvicorn
+from langchain.agents import create_agent
+from langchain_core.messages import HumanMessage, SystemMessage
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import utils
+from controller_store import CONTROLLER_DB, ControllerStore, connect, event_time
+from device_guard import DeviceGuard, device_guard_middleware
+from event_coalescing import EventCoalescer, PayloadFetcher, describe_batch, event_name, resource_events
+from event_sharding import rule_event_list, thing_id, trigger_rules
+from history_compaction import compaction_middleware
+from instrumentation import instrument
+from job_queue import FairScheduler, QueueFull
+from mcp_pool import McpSessionPool
+from temporal_rules import RULE_PROMPT, RuleError, TemporalRuleEngine, extract_rule, rule_run_key
+
+
+HOST = os.getenv("CONTROLLER_HOST", "127.0.0.1")
+PORT = int(os.getenv("CONTROLLER_PORT", "8310"))
+# JSON file with the sites to run: [{"name": "home-1", "mcp_url": "http://...:3000/mcp", "rules": [...]}]
+CONTROLLER_SITES = os.getenv("CONTROLLER_SITES")
+CONTROLLER_MODEL = os.getenv("CONTROLLER_MODEL", utils.LLM_VERSION)
+# Model calls in flight across all sites, and per site
+CONTROLLER_LLM_CONCURRENCY = int(os.getenv("CONTROLLER_LLM_CONCURRENCY", "8"))
+SITE_LLM_CONCURRENCY = int(os.getenv("SITE_LLM_CONCURRENCY", "1"))
+# Automations waiting per site before new event batches are dropped
+SITE_MAX_QUEUED = int(os.getenv("SITE_MAX_QUEUED", "20"))
+# Sites connecting at the same time during startup
+SITE_STARTUP_CONCURRENCY = int(os.getenv("SITE_STARTUP_CONCURRENCY", "20"))
+# Seconds between passes over all sites for closed event windows and due timers
+TICK_INTERVAL = 0.5
+
+SYSTEM_PROMPT = (
+    "You are an intelligent IoT home automation agent. "
+    "You manage smart devices autonomously based on automation rules. "
+    "When you detect relevant events, execute the corresponding automations. "
+    "Always use available tools to control devices. "
+    "Be concise and only report actions taken."
+)
+
+BATCH_PROMPT = """
+The following events just occurred:
+{EVENTS}
+
+Active automation rules:
+{RULES}
+
+Check if any of these events should trigger any automations. Execute them if needed.
+Event data is already included above where the device sent any; don't read it again.
+Only report what actions you're taking now, not what was done before.
+"""
+
+RULE_FIRED_PROMPT = """
+This automation rule has just been triggered; its condition was checked and holds:
+- {RULE}
+
+Facts: {FACTS}
+
+Execute its actions now: {ACTIONS}
+Only report what actions you're taking now.
+"""
+
+
+def _text(content: Any) -> str:
+    if isinstance(content, list):
+        return "\n".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content or ""
+
+
+class Site:
+    """
+    One controlled site: its MCP session, rules, event stream and durable state.
+
+    Sites own no tasks of their own. The service calls tick() on every site and runs the
+    resulting automations through its shared FairScheduler.
+    """
+    def __init__(self, service: "ControllerService", name: str, mcp_url: str):
+        self.service = service
+        self.name = name
+        self.mcp_url = mcp_url
+        self.store = ControllerStore(controller=f"site:{name}", connection=service.conn)
+        self.events = EventCoalescer()
+        self.engine = TemporalRuleEngine()
+        # Outlives the agent, which the pool rebuilds on reconnect
+        self.devices = DeviceGuard()
+        self.payloads: Optional[PayloadFetcher] = None
+        self.event_resources: Dict[str, str] = {}
+        self.rules: List[Dict] = []
+        self.fired: List[tuple] = []
+        # Automations held back while the site's MCP session is down
+        self.deferred: List[tuple] = []
+        self.stats = {"automations": 0, "rules_fired": 0, "skipped": 0, "dropped_batches": 0, "errors": 0}
+        self.pool = McpSessionPool(
+            {"wot": {"transport": "streamable_http", "url": mcp_url}},
+            on_session=self._on_session,
+        )
+
+    async def start(self):
+        for name, at, data in self.store.recent_events(time.time() - self.engine.history.retention):
+            self.engine.history.record(name, at, data)
+        for saved in self.store.rules():
+            self._load_rule(saved["id"], saved["text"], saved["compiled"])
+        await self.pool.start()
+
+    async def close(self):
+        await self.pool.close()
+        self.store.close()
+
+    @property
+    def healthy(self) -> bool:
+        server = self.pool.servers.get("wot")
+        return bool(server and server.healthy)
+
+    def _load_rule(self, rule_id: int, text: str, compiled: Optional[Dict]) -> Dict:
+        rule = {"id": rule_id, "text": text, "local": False}
+        if compiled:
+            local = {**compiled, "id": rule_id, "text": text}
+            try:
+                self.engine.add_rule(local, lambda rule, facts: self.fired.append((rule, facts)))
+                rule.update(local=True, compiled=compiled)
+            except RuleError as e:
+                print(f"⚠️  [{self.name}] Rule can't be evaluated locally ({e}): {text}")
+        self.rules.append(rule)
+        return rule
+
+    async def _on_session(self, _, session):
+        """Install the notification handler, (re)subscribe and catch up on missed events."""
+        original_handler = session._message_handler
+
+        async def notification_handler(message):
+            if original_handler:
+                await original_handler(message)
+            actual_message = getattr(message, "root", message)
+            if isinstance(actual_message, types.ResourceUpdatedNotification):
+                uri = str(actual_message.params.uri)
+                if "/events/" in uri:
+                    self.on_event(uri)
+
+        session._message_handler = notification_handler
+        self.payloads = PayloadFetcher(session.read_resource)
+
+        resources = self.store.subscriptions()
+        try:
+            for resource in (await session.list_resources()).resources or []:
+                resources[str(resource.uri)] = resource.name
+        except Exception as e:
+            print(f"⚠️  [{self.name}] Listing resources failed: {e}")
+        results = await asyncio.gather(*(session.subscribe_resource(uri) for uri in resources),
+                                       return_exceptions=True)
+        subscribed = {uri: name for (uri, name), result in zip(resources.items(), results)
+                      if not isinstance(result, Exception)}
+        self.event_resources = {uri: name for uri, name in subscribed.items() if "/events/" in uri}
+        self.devices.add_devices({thing_id(uri) for uri in subscribed})
+        self.store.set_subscriptions(subscribed)
+
+        cursors = {uri: cursor for uri, cursor in self.store.cursors().items() if uri in self.event_resources}
+        await asyncio.gather(*(self._catch_up(session, uri, cursor) for uri, cursor in cursors.items()),
+                             return_exceptions=True)
+
+    async def _catch_up(self, session, uri: str, cursor: str):
+        missed = [event for event in resource_events(await session.read_resource(uri))
+                  if event.get("timestamp", "") > cursor]
+        for event in missed:
+            self.on_event(uri, event.get("data"), event_time(event["timestamp"]))
+        if missed:
+            print(f"🔄 [{self.name}] {len(missed)} missed {event_name(uri)} events")
+
+    def on_event(self, uri: str, data: Any = None, at: Optional[float] = None):
+        at = time.time() if at is None else at
+        self.events.add(uri, self.event_resources.get(uri, uri))
+        self.engine.on_event(event_name(uri), data, now=at, trigger=False, thing=thing_id(uri))
+        self.store.log_event(event_name(uri), at, data)
+        if self.payloads:
+            self.payloads.notify(uri)
+
+    def tick(self):
+        """Hand closed event windows and fired rules to the scheduler."""
+        self.store.flush()
+        if self.deferred and self.healthy:
+            deferred, self.deferred = self.deferred, []
+            print(f"🔄 [{self.name}] Session back, running {len(deferred)} deferred automations")
+            for factory, kind in deferred:
+                self._submit(factory, kind)
+        batch = self.events.ready()
+        if batch:
+            self._submit(lambda: self._handle_batch(batch), "batch")
+        self.engine.advance()
+        # Event-triggered rules run once per closed window, not once per raw notification
+        trigger_rules(self.engine, batch)
+        while self.fired:
+            rule, facts = self.fired.pop(0)
+            self.stats["rules_fired"] += 1
+            self._submit(lambda rule=rule, facts=facts: self._run_rule(rule, facts), "rule")
+
+    def _submit(self, factory, kind: str):
+        if not self.healthy:
+            self._defer(factory, kind)
+            return
+        try:
+            self.service.scheduler.submit(self.name, factory)
+        except QueueFull:
+            self.stats["dropped_batches"] += 1
+            print(f"⚠️  [{self.name}] Automation queue full, {kind} dropped")
+
+    def _defer(self, factory, kind: str):
+        """Keep an automation until the session is back: without it the agent has no tools."""
+        if len(self.deferred) >= SITE_MAX_QUEUED:
+            self.stats["dropped_batches"] += 1
+            print(f"⚠️  [{self.name}] Session down and {len(self.deferred)} automations deferred, {kind} dropped")
+            return
+        self.deferred.append((factory, kind))
+
+    async def _handle_batch(self, batch: List[Dict]):
+        if not self.healthy:
+            # The session dropped while this batch was queued
+            self._defer(lambda: self._handle_batch(batch), "batch")
+            return
+        if self.payloads:
+            await self.payloads.attach(batch)
+        llm_rules = [rule["text"] for rule in self.rules if not rule["local"]]
+        if llm_rules:
+            prompt = BATCH_PROMPT.replace("{EVENTS}", describe_batch(batch)).replace(
+                "{RULES}", "\n".join(f"- {rule}" for rule in llm_rules))
+            key = "batch:" + ",".join(f"{e['uri']}@{e.get('cursor') or e['last']}" for e in batch)
+            await self._run_automation(prompt, key, ", ".join(e["name"] for e in batch))
+        self.store.set_cursors({e["uri"]: e["cursor"] for e in batch if e.get("cursor")})
+
+    async def _run_rule(self, rule: Dict, facts: Dict):
+        if not self.healthy:
+            self._defer(lambda: self._run_rule(rule, facts), "rule")
+            return
+        prompt = (RULE_FIRED_PROMPT.replace("{RULE}", rule["text"]).replace("{FACTS}", json.dumps(facts))
+                  .replace("{ACTIONS}", rule.get("actions") or rule["text"]))
+        await self._run_automation(prompt, rule_run_key(rule, facts), rule["text"])
+
+    def agent(self):
+        """The site's agent, rebuilt by the pool when the session reconnects."""
+        return self.pool.get_agent("controller", self._build_agent, servers=["wot"])
+
+    def _build_agent(self, tools: List):
+        # Tool errors go back to the model (and through the device guard) instead of ending the run
+        for tool in tools:
+            tool.handle_tool_error = True
+        return instrument(create_agent(
+            model=self.service.model,
+            tools=tools,
+            system_prompt=SYSTEM_PROMPT,
+            middleware=compaction_middleware(reset_per_request=True) + device_guard_middleware(self.devices),
+        ), "controller_service", system=self.name)
+
+    async def _run_automation(self, prompt: str, key: str, description: str):
+        if not self.store.begin_action(key, description):
+            self.stats["skipped"] += 1
+            return
+        status = "done"
+        try:
+            # Every automation is a one-shot conversation: no checkpointer, nothing kept per site
+            response = await self.agent().ainvoke(
+                {"messages": [{"role": "user", "content": prompt}]},
+                {"configurable": {"thread_id": f"{self.name}:{hashlib.sha1(key.encode()).hexdigest()[:16]}"}},
+            )
+            self.stats["automations"] += 1
+            content = _text(response["messages"][-1].content).strip() if response.get("messages") else ""
+            if content and content.lower().rstrip(".") != "no actions needed":
+                print(f"🤖 [{self.name}] {content}")
+        except Exception as e:
+            status = "error"
+            self.stats["errors"] += 1
+            print(f"❌ [{self.name}] Automation failed: {e}")
+        finally:
+            self.store.finish_action(key, status)
+
+    async def add_rule(self, text: str) -> Dict:
+        """Store a rule, compiled once into its local form when it can be (through the scheduler)."""
+        try:
+            compiled = await self.service.scheduler.submit(self.name, lambda: self._compile(text))
+        except QueueFull:
+            raise
+        except Exception as e:
+            print(f"⚠️  [{self.name}] Rule compilation failed, leaving it to the agent: {e}")
+            compiled = None
+        rule_id = self.store.add_rule(text, compiled)
+        return self._load_rule(rule_id, text, compiled)
+
+    async def _compile(self, text: str) -> Optional[Dict]:
+        response = await self.service.model.ainvoke([
+            SystemMessage(content=RULE_PROMPT.replace("{EVENTS}", rule_event_list(self.event_resources))),
+            HumanMessage(content=text),
+        ])
+        rule = extract_rule(_text(response.content))
+        if not rule or not rule.get("trigger"):
+            return None
+        return {key: rule[key] for key in ("trigger", "when", "actions") if key in rule}
+
+    def status(self) -> Dict:
+        return {
+            "name": self.name,
+            "mcp_url": self.mcp_url,
+            "healthy": self.healthy,
+            "rules": len(self.rules),
+            "local_rules": sum(rule["local"] for rule in self.rules),
+            "event_resources": len(self.event_resources),
+            "events": self.events.stats,
+            "pending_events": len(self.events.pending),
+            "deferred_automations": len(self.deferred),
+            "unavailable_devices": self.devices.unavailable_devices(),
+            **self.stats,
+        }
+
+
+class ControllerService:
+    """
+    Runs the reactive controller for many sites in one event loop.
+
+    Every site keeps its own MCP session, rules, event stream and durable state (one
+    shared SQLite connection, rows scoped by site). All sites share one chat model client,
+    and their automations and rule compilations go through one FairScheduler: at most
+    `llm_concurrency` model runs in flight overall and `per_site` per site, handed out
+    round-robin between the sites that are waiting.
+    """
+    def __init__(self, model_spec: str = CONTROLLER_MODEL, llm_concurrency: int = CONTROLLER_LLM_CONCURRENCY,
+                 per_site: int = SITE_LLM_CONCURRENCY, db_path: str = CONTROLLER_DB):
+        self.model = utils.create_chat_model(model_spec)
+        self.scheduler = FairScheduler(llm_concurrency, per_site, SITE_MAX_QUEUED)
+        self.conn = connect(db_path)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS sites (name TEXT PRIMARY KEY, config TEXT)")
+        self.sites: Dict[str, Site] = {}
+        self._tick_task: Optional[asyncio.Task] = None
+
+    def saved_sites(self) -> List[Dict]:
+        return [json.loads(config) for (config,) in self.conn.execute("SELECT config FROM sites ORDER BY name")]
+
+    async def start(self, configs: Optional[List[Dict]] = None):
+        """Start the saved sites plus the given ones (connections opened concurrently)."""
+        merged = {config["name"]: config for config in self.saved_sites() + (configs or [])}
+        started = time.perf_counter()
+        limit = asyncio.Semaphore(SITE_STARTUP_CONCURRENCY)
+
+        async def start_site(config):
+            async with limit:
+                await self.add_site(config)
+
+        await asyncio.gather(*(start_site(config) for config in merged.values()), return_exceptions=True)
+        healthy = sum(site.healthy for site in self.sites.values())
+        print(f"✓ {len(self.sites)} sites started ({healthy} connected) in {time.perf_counter() - started:.1f}s")
+        self._tick_task = asyncio.create_task(self._tick_loop())
+
+    async def add_site(self, config: Dict) -> Site:
+        name = config["name"]
+        if name in self.sites:
+            raise ValueError(f"Site '{name}' already exists")
+        site = Site(self, name, config["mcp_url"])
+        self.sites[name] = site
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO sites VALUES (?, ?)",
+                              (name, json.dumps({"name": name, "mcp_url": config["mcp_url"]})))
+        await site.start()
+        known = {rule["text"] for rule in site.rules}
+        for text in config.get("rules", []):
+            if text not in known:
+                await site.add_rule(text)
+        return site
+
+    async def remove_site(self, name: str):
+        site = self.sites.pop(name)
+        self.scheduler.forget(name)
+        with self.conn:
+            self.conn.execute("DELETE FROM sites WHERE name = ?", (name,))
+        await site.close()
+
+    async def _tick_loop(self):
+        while True:
+            try:
+                await asyncio.sleep(TICK_INTERVAL)
+                for site in list(self.sites.values()):
+                    # One site's failure must not hold up the others
+                    try:
+                        site.tick()
+                    except Exception as e:
+                        print(f"❌ [{site.name}] Error in tick: {e}")
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                print(f"Error in controller tick: {e}")
+
+    async def close(self):
+        if self._tick_task:
+            self._tick_task.cancel()
+            await asyncio.gather(self._tick_task, return_exceptions=True)
+        await self.scheduler.close()
+        await asyncio.gather(*(site.close() for site in self.sites.values()), return_exceptions=True)
+        self.conn.close()
+
+    def metrics(self) -> Dict:
+        sites = [site.status() for site in self.sites.values()]
+        totals = {key: sum(site[key] for site in sites)
+                  for key in ("automations", "rules_fired", "skipped", "dropped_batches", "errors")}
+        return {
+            "sites": len(sites),
+            "healthy_sites": sum(site["healthy"] for site in sites),
+            "raw_events": sum(site["events"]["raw_events"] for site in sites),
+            "event_batches": sum(site["events"]["batches"] for site in sites),
+            "unavailable_devices": sum(len(site["unavailable_devices"]) for site in sites),
+            **totals,
+            "llm": self.scheduler.stats(),
+        }
+
+
+service: Optional[ControllerService] = None
+
+
+def load_site_configs(path: Optional[str]) -> List[Dict]:
+    if not path:
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+async def list_sites(request: Request):
+    """GET /sites -> status of every site."""
+    return JSONResponse([site.status() for site in service.sites.values()])
+
+
+async def create_site(request: Request):
+    """POST /sites {"name": ..., "mcp_url": ..., "rules": [...]} -> 201 site status."""
+    try:
+        body = await request.json()
+    except Exception:
+        return JSONResponse({"error": "Invalid JSON body"}, status_code=400)
+    if not isinstance(body, dict):
+        return JSONResponse({"error": "Body must be a JSON object"}, status_code=400)
+    if not body.get("name") or not body.get("mcp_url"):
+        return JSONResponse({"error": "Missing 'name' or 'mcp_url'"}, status_code=400)
+    try:
+        site = await service.add_site(body)
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=409)
+    return JSONResponse(site.status(), status_code=201)
+
+
+async def get_site(request: Request):
+    """GET /sites/{name} -> site status, rules and per-device tool call stats."""
+    site = service.sites.get(request.path_params["name"])
+    if not site:
+        return JSONResponse({"error": "Site not found"}, status_code=404)
+    return JSONResponse({**site.status(), "rule_list": site.rules, "devices": site.devices.stats()})
+
+
+async def delete_site(request: Request):
+    """DELETE /sites/{name} -> stop the site and forget it."""
+    if request.path_params["name"] not in service.sites:
+        return JSONResponse({"error": "Site not found"}, status_code=404)
+    await service.remove_site(request.path_params["name"])
+    return JSONResponse({"deleted": request.path_params["name"]})
+
+
+async def add_rule(request: Request):
+    """POST /sites/{name}/rules {"rule": "..."} -> the stored rule (with its local form if any)."""
+    site = service.sites.get(request.path_params["name"])
+    if not site:
+        return JSONResponse({"error": "Site not found"}, status_code=404)
+    try:
+        text = ((await request.json()).get("rule") or "").strip()
+    except Exception:
+        return JSONResponse({"error": "Invalid JSON body"}, status_code=400)
+    if not text:
+        return JSONResponse({"error": "Missing 'rule'"}, status_code=400)
+    try:
+        rule = await site.add_rule(text)
+    except QueueFull as e:
+        return JSONResponse({"error": f"Queue full: {e}"}, status_code=429, headers={"Retry-After": "1"})
+    return JSONResponse(rule, status_code=201)
+
+
+async def metrics(request: Request):
+    """GET /metrics -> event, automation and LLM scheduler counters across all sites."""
+    return JSONResponse(service.metrics())
+
+
+async def health(request: Request):
+    """GET /health -> connected sites."""
+    sites = {name: site.healthy for name, site in service.sites.items()}
+    healthy = all(sites.values())
+    return JSONResponse({"healthy": healthy, "sites": sites}, status_code=200 if healthy else 503)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    global service
+    service = ControllerService()
+    await service.start(load_site_configs(CONTROLLER_SITES))
+    try:
+        yield
+    finally:
+        await service.close()
+
+
+app = Starlette(
+    routes=[
+        Route("/sites", list_sites, methods=["GET"]),
+        Route("/sites", create_site, methods=["POST"]),
+        Route("/sites/{name}", get_site, methods=["GET"]),
+        Route("/sites/{name}", delete_site, methods=["DELETE"]),
+        Route("/sites/{name}/rules", add_rule, methods=["POST"]),
+        Route("/metrics", metrics, methods=["GET"]),
+        Route("/health", health, methods=["GET"]),
+    ],
+    lifespan=lifespan,
+)
+
+
+if __name__ == "__main__":
+    print(f"🏠 Multi-site controller service on http://{HOST}:{PORT}")
+    uvicorn.run(app, host=HOST, port=PORT)
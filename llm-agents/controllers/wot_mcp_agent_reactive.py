@@ -1,21 +1,36 @@
 import asyncio
+import hashlib
+import json
 import os
 import sys
-from typing import Any, Dict, Type, List
+import time
 import mcp.types as types
 from dotenv import load_dotenv
 from langchain.agents import create_agent
 from langchain_mcp_adapters.client import MultiServerMCPClient
 from langchain_mcp_adapters.tools import load_mcp_tools
 from langgraph.checkpoint.memory import InMemorySaver
-from langchain_core.messages import AIMessage
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
 from langchain_openai import ChatOpenAI
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 import utils
+from instrumentation import instrument
+from history_compaction import compaction_middleware
+from event_coalescing import PayloadFetcher, describe_batch, event_name, resource_events
+from event_sharding import open_events, rule_event_list, thing_id
+from device_guard import DeviceGuard, device_guard_middleware
+from temporal_rules import RULE_PROMPT, RuleError, extract_rule, rule_run_key
+from controller_store import CONTROLLER_DB, ControllerStore, event_time, open_checkpointer
 
 load_dotenv()
 
 MCP_SERVER_URL = "http://localhost:3000/mcp"
+# Seconds between checks for event batches whose window has closed
+EVENT_POLL_INTERVAL = 0.5
+# Compile automation rules into time-windowed conditions evaluated without the LLM
+LOCAL_RULES = os.getenv("LOCAL_RULES", "1").lower() in ("1", "true", "yes")
+# Keep rules, subscriptions, event cursors and automation runs in CONTROLLER_DB across restarts
+PERSIST_STATE = os.getenv("PERSIST_STATE", "1").lower() in ("1", "true", "yes")
     
 
 model = ChatOpenAI(
@@ -24,30 +39,6 @@ model = ChatOpenAI(
     openai_api_key=os.getenv("OPENAI_API_KEY")
 )
 
-class EventBuffer:
-    """Simple buffer to track recent events."""
-    def __init__(self, max_events=100):
-        self.events: List[Dict] = []
-        self.max_events = max_events
-        self.last_processed = 0
-    
-    def add_event(self, event_uri: str, event_name: str):
-        """Add an event to the buffer."""
-        self.events.append({
-            "uri": event_uri,
-            "name": event_name,
-            "timestamp": asyncio.get_event_loop().time()
-        })
-        if len(self.events) > self.max_events:
-            self.events.pop(0)
-    
-    def get_new_events(self) -> List[Dict]:
-        """Get events that haven't been processed yet."""
-        new_events = self.events[self.last_processed:]
-        if new_events:
-            self.last_processed = len(self.events)
-        return new_events
-
 def print_event(message: str):
     """Print event message with proper formatting."""
     # Use carriage return to clear current line and print event
@@ -70,12 +61,34 @@ async def main():
     print("🏠 IoT Autonomous Agent Starting...")
     async with client.session("wot") as session:
         original_handler = session._message_handler
-        event_buffer = EventBuffer()
+        # Event coalescing and local rules, in this loop or sharded by Thing (CONTROLLER_SHARDS)
+        events = open_events()
+        payloads = PayloadFetcher(session.read_resource)
         event_resources = {}
         automation_rules = []
+        # Rules evaluated by the temporal rule engine; the LLM only runs their actions
+        local_rules = {}
+        fired_rules = []
+
+        started = time.perf_counter()
+        store = ControllerStore(CONTROLLER_DB if PERSIST_STATE else ":memory:", "reactive")
+        for name, at, data in store.recent_events(time.time() - events.retention):
+            events.record(name, at, data)
+        events.set_resources(store.subscriptions())
+        for saved in store.rules():
+            automation_rules.append(saved["text"])
+            if saved["compiled"]:
+                rule = {**saved["compiled"], "id": saved["id"], "text": saved["text"]}
+                try:
+                    events.add_rule(rule, lambda rule, facts: fired_rules.append((rule, facts)))
+                    local_rules[saved["text"]] = rule
+                except RuleError as e:
+                    print(f"⚠️  Saved rule can't be evaluated locally ({e}): {saved['text']}")
+        for action in store.unfinished_actions():
+            print(f"⚠️  Automation interrupted by the last shutdown, not repeated: {action['description']}")
 
         async def notification_handler(message):
-            """Capture events into buffer."""
+            """Capture events into the coalescing buffer."""
             if original_handler:
                 await original_handler(message)
             
@@ -89,7 +102,9 @@ async def main():
                     uri = str(actual_message.params.uri)
                     if "/events/" in uri:
                         resource_name = event_resources.get(uri, uri)
-                        event_buffer.add_event(uri, resource_name)
+                        events.add(uri, resource_name)
+                        store.log_event(event_name(uri), time.time())
+                        payloads.notify(uri)
                         # Don't print here - let autonomous_loop handle it
             except Exception as e:
                 print(f"Error in notification handler: {e}")
@@ -104,18 +119,46 @@ async def main():
         print(f"✅ Loaded {len(tools)} tools")
 
         print("📋 Subscribing to all resources...")
+        # Resources of the previous run are resubscribed even if listing fails
+        resources = store.subscriptions()
         try:
             resources_result = await session.list_resources()
-            if resources_result.resources:
-                for resource in resources_result.resources:
-                    resource_uri = str(resource.uri)
-                    await session.subscribe_resource(resource_uri)
-                    
-                    if "/events/" in resource_uri:
-                        event_resources[resource_uri] = resource.name
-                        print(f"  📌 {resource.name}")
+            for resource in resources_result.resources or []:
+                resources[str(resource.uri)] = resource.name
         except Exception as e:
-            print(f"Error subscribing: {e}")
+            print(f"Error listing resources: {e}")
+        results = await asyncio.gather(*(session.subscribe_resource(uri) for uri in resources), return_exceptions=True)
+        subscribed = {}
+        for (resource_uri, name), result in zip(resources.items(), results):
+            if isinstance(result, Exception):
+                print(f"Error subscribing to {resource_uri}: {result}")
+                continue
+            subscribed[resource_uri] = name
+            if "/events/" in resource_uri:
+                event_resources[resource_uri] = name
+                print(f"  📌 {name}")
+        store.set_subscriptions(subscribed)
+        events.set_resources(event_resources)
+
+        async def catch_up(uri: str, cursor: str) -> int:
+            """Queue the events of `uri` buffered by the server after the last processed one."""
+            missed = [event for event in resource_events(await session.read_resource(uri))
+                      if event.get("timestamp", "") > cursor]
+            for event in missed:
+                at = event_time(event["timestamp"])
+                events.add(uri, event_resources.get(uri, uri), event.get("data"), at=at)
+                store.log_event(event_name(uri), at, event.get("data"))
+            if missed:
+                payloads.notify(uri)
+            return len(missed)
+
+        cursors = {uri: cursor for uri, cursor in store.cursors().items() if uri in event_resources}
+        missed = await asyncio.gather(*(catch_up(uri, cursor) for uri, cursor in cursors.items()),
+                                      return_exceptions=True)
+        if store.rules() or cursors:
+            print(f"🔄 Resumed {len(automation_rules)} rules ({len(local_rules)} local), {len(subscribed)} subscriptions "
+                  f"and {sum(n for n in missed if isinstance(n, int))} missed events "
+                  f"in {(time.perf_counter() - started) * 1000:.0f} ms")
 
         system_prompt = (
             "You are an intelligent IoT home automation agent. "
@@ -125,76 +168,137 @@ async def main():
             "Be concise and only report actions taken."
         )
         
-        agent = create_agent(
+        # Fail fast on devices that are down or slow instead of stalling the automation cycle
+        device_guard = DeviceGuard(thing_id(uri) for uri in subscribed)
+        agent = instrument(create_agent(
             model=model,
             tools=tools,
             system_prompt=system_prompt,
-            checkpointer=InMemorySaver(),
-        )
+            checkpointer=await open_checkpointer(CONTROLLER_DB) if PERSIST_STATE else InMemorySaver(),
+            middleware=compaction_middleware() + device_guard_middleware(device_guard),
+        ), "reactive_controller")
 
         print("\n🤖 Agent ready!")
         print("Examples of automation rules:")
         print("  - 'Blink LEDs when washing machine cycle has finished'")
         print("  - 'Turn on the main room light when motion is detected in that room'")
         print("  - 'When doorbell is pressed, reduce speaker volume and alert homeowner'")
-        print("\nType 'bye' to exit, 'rules' to see automation rules.\n")
+        print("\nType 'bye' to exit, 'rules' to see automation rules, 'stats' for event metrics.\n")
+
+        async def run_automation(prompt: str, key: str, description: str):
+            """Run one automation prompt through the agent (once per key) and print the actions it took."""
+            if not store.begin_action(key, description):
+                print_event(f"Already handled: {description}")
+                return
+            status = "done"
+            try:
+                response = await agent.ainvoke(
+                    {"messages": [{"role": "user", "content": prompt}]},
+                    {"configurable": {"thread_id": f"automation_{hashlib.sha1(key.encode()).hexdigest()[:16]}"}}
+                )
+                
+                if "messages" in response:
+                    messages = response["messages"]
+                    if messages:
+                        last_msg = messages[-1]
+                        if isinstance(last_msg, AIMessage) and last_msg.content:
+                            if isinstance(last_msg.content, list):
+                                for part in last_msg.content:
+                                    if isinstance(part, dict) and part.get("type") == "text":
+                                        content = part.get('text', '').strip()
+                                        if content and content.lower() not in ["no actions needed.", "no actions needed"]:
+                                            print_event(f"Action: {content}")
+                            else:
+                                content = last_msg.content.strip()
+                                if content and content.lower() not in ["no actions needed.", "no actions needed"]:
+                                    print_event(f"Action: {content}")
+            except Exception as e:
+                status = "error"
+                print(f"Error in automation loop: {e}")
+            finally:
+                store.finish_action(key, status)
+
+        async def compile_rule(text: str):
+            """Ask the model once for a local form of the rule; None if it needs the LLM on every event."""
+            try:
+                response = await model.ainvoke([
+                    SystemMessage(content=RULE_PROMPT.replace("{EVENTS}", rule_event_list(event_resources))),
+                    HumanMessage(content=text),
+                ])
+                rule = extract_rule(response.content if isinstance(response.content, str) else str(response.content))
+                if not rule or not rule.get("trigger"):
+                    return None
+                rule["text"] = text
+                events.add_rule(rule, lambda rule, facts: fired_rules.append((rule, facts)))
+                return rule
+            except RuleError as e:
+                print(f"⚠️  Rule can't be evaluated locally ({e}), leaving it to the agent")
+            except Exception as e:
+                print(f"⚠️  Rule compilation failed: {e}")
+            return None
 
         async def autonomous_loop():
             """Agent autonomously checks for new events and executes automations."""
             check_counter = 0
             while True:
                 try:
-                    await asyncio.sleep(2)
+                    await asyncio.sleep(EVENT_POLL_INTERVAL)
+                    store.flush()
                     
-                    new_events = event_buffer.get_new_events()
+                    new_events = await events.tick()
+                    await payloads.attach(new_events)
                     
-                    if new_events and automation_rules:
+                    llm_rules = [rule for rule in automation_rules if rule not in local_rules]
+                    if new_events and llm_rules:
                         check_counter += 1
                         # Print detected events
                         for event in new_events:
                             print_event(f"Event: {event['name']}")
+                        raw_events = sum(event["count"] for event in new_events)
+                        if raw_events > len(new_events):
+                            print(f"📊 Batch {check_counter}: {raw_events} raw events folded into {len(new_events)}")
                         
-                        events_str = "\n".join(
-                            [f"- {event['name']}" for event in new_events]
-                        )
+                        events_str = describe_batch(new_events)
                         
                         automation_prompt = f"""
 The following events just occurred:
 {events_str}
 
 Active automation rules:
-{chr(10).join([f"- {rule}" for rule in automation_rules])}
+{chr(10).join([f"- {rule}" for rule in llm_rules])}
 
 Check if any of these events should trigger any automations. Execute them if needed.
+Event data is already included above where the device sent any; don't read it again.
 Only report what actions you're taking now, not what was done before.
 """
                         
-                        try:
-                            response = await agent.ainvoke(
-                                {"messages": [{"role": "user", "content": automation_prompt}]},
-                                {"configurable": {"thread_id": f"automation_check_{check_counter}"}}
-                            )
-                            
-                            if "messages" in response:
-                                messages = response["messages"]
-                                if messages:
-                                    last_msg = messages[-1]
-                                    if isinstance(last_msg, AIMessage) and last_msg.content:
-                                        if isinstance(last_msg.content, list):
-                                            for part in last_msg.content:
-                                                if isinstance(part, dict) and part.get("type") == "text":
-                                                    content = part.get('text', '').strip()
-                                                    if content and content.lower() not in ["no actions needed.", "no actions needed"]:
-                                                        print_event(f"Action: {content}")
-                                        else:
-                                            content = last_msg.content.strip()
-                                            if content and content.lower() not in ["no actions needed.", "no actions needed"]:
-                                                print_event(f"Action: {content}")
-                        except Exception as e:
-                            print(f"Error in automation loop: {e}")
+                        await run_automation(
+                            automation_prompt,
+                            "batch:" + ",".join(f"{e['uri']}@{e.get('cursor') or e['last']}" for e in new_events),
+                            ", ".join(e["name"] for e in new_events),
+                        )
+                    # Events are processed once their batch has been handled (or there was nothing to check)
+                    store.set_cursors({e["uri"]: e["cursor"] for e in new_events if e.get("cursor")})
+                    
+                    while fired_rules:
+                        check_counter += 1
+                        rule, facts = fired_rules.pop(0)
+                        print_event(f"Rule: {rule['text']}")
+                        await run_automation(f"""
+This automation rule has just been triggered; its condition was checked and holds:
+- {rule['text']}
+
+Facts: {json.dumps(facts)}
+
+Execute its actions now: {rule.get('actions') or rule['text']}
+Only report what actions you're taking now.
+""", rule_run_key(rule, facts), rule["text"])
                     
                 except asyncio.CancelledError:
                     break
+                except Exception as e:
+                    # A store or shard error skips this round instead of ending the automations
+                    print(f"❌ Error in automation loop: {e}")
 
         loop_task = asyncio.create_task(autonomous_loop())
 
@@ -206,11 +310,24 @@ Only report what actions you're taking now, not what was done before.
                     print("Goodbye!")
                     break
                 
+                if user_input.lower() == "stats":
+                    stats = events.stats()
+                    print(f"📊 {stats.get('raw_events', 0)} raw events, {stats.get('released_events', 0)} passed to the agent "
+                          f"in {stats.get('batches', 0)} batches, {stats.get('pending', 0)} pending")
+                    if "shards" in stats:
+                        print(f"🧩 {stats['shards']} event shards, {stats['coordinated_rules']} rules on the coordinator")
+                    print(f"⏱️  {len(local_rules)} local rules: {stats['evaluations']} evaluations, "
+                          f"{stats['fired']} fired, {stats['timers']} timers")
+                    unavailable = device_guard.unavailable_devices()
+                    print(f"🔌 {len(device_guard.breakers)} devices called"
+                          + (f", unavailable: {', '.join(unavailable)}" if unavailable else "") + "\n")
+                    continue
+                
                 if user_input.lower() == "rules":
                     if automation_rules:
                         print("\n📋 Active Automation Rules:")
                         for i, rule in enumerate(automation_rules, 1):
-                            print(f"  {i}. {rule}")
+                            print(f"  {i}. {rule}" + (" (evaluated locally)" if rule in local_rules else ""))
                         print()
                     else:
                         print("No automation rules defined yet.\n")
@@ -226,7 +343,15 @@ Only report what actions you're taking now, not what was done before.
                 if is_automation_rule:
                     # Store as automation rule
                     automation_rules.append(user_input)
-                    print(f"✅ Automation rule added: {user_input}\n")
+                    rule = await compile_rule(user_input) if LOCAL_RULES else None
+                    compiled = {k: rule[k] for k in ("trigger", "when", "actions") if k in rule} if rule else None
+                    rule_id = store.add_rule(user_input, compiled)
+                    if rule:
+                        rule["id"] = rule_id
+                        local_rules[user_input] = rule
+                        print(f"✅ Automation rule added, evaluated locally: {json.dumps({k: rule[k] for k in ('trigger', 'when') if k in rule})}\n")
+                    else:
+                        print(f"✅ Automation rule added: {user_input}\n")
                 else:
                     # Process as a direct query/command
                     try:
@@ -256,6 +381,8 @@ Only report what actions you're taking now, not what was done before.
                 await loop_task
             except asyncio.CancelledError:
                 pass
+            store.close()
+            events.close()
 
 
 if __name__ == "__main__":
@@ -12,6 +12,11 @@ from langchain_openai import ChatOpenAI
 import sys
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 import utils
+from instrumentation import instrument
+from history_compaction import compaction_middleware
+from event_coalescing import PayloadFetcher, describe_batch
+from event_sharding import thing_id
+from device_guard import DeviceGuard, device_guard_middleware
 
 load_dotenv()
 
@@ -50,6 +55,10 @@ async def main():
         
         # Dictionary to track which resources are events
         event_resources = {}
+        # Tool calls to devices that are down or slow fail fast (device ids come from the resources)
+        device_guard = DeviceGuard()
+        # Event payloads are read in the background as notifications arrive
+        payloads = PayloadFetcher(session.read_resource)
 
         async def notification_handler(message):
             # Call the original handler first (to handle responses etc.)
@@ -74,9 +83,11 @@ async def main():
             # Check if this is an event resource (URI contains /events/)
             if "/events/" in uri:
                 resource_name = event_resources.get(uri, uri)
+                payloads.notify(uri)
                 await event_queue.put({
                     "uri": uri,
                     "name": resource_name,
+                    "count": 1,
                     "message": f"Event triggered: {resource_name}"
                 })
             else:
@@ -106,6 +117,7 @@ async def main():
                 print(f"Found {len(resources_result.resources)} resources. Subscribing...")
                 for resource in resources_result.resources:
                     await session.subscribe_resource(resource.uri)
+                    device_guard.add_devices([thing_id(str(resource.uri))])
                     
                     # Track event resources for easy identification
                     if "/events/" in resource.uri:
@@ -126,12 +138,13 @@ async def main():
             "If a tool fails, explain the error to the user."
         )
         
-        agent = create_agent(
+        agent = instrument(create_agent(
             model=model,
             tools=tools,
             system_prompt=system_prompt,
             checkpointer=InMemorySaver(),
-        )
+            middleware=compaction_middleware() + device_guard_middleware(device_guard),
+        ), "simple_controller")
 
         print("\n🏠 Agent ready! Type 'bye' to exit.")
         print("Listening for device events...\n")
@@ -141,7 +154,10 @@ async def main():
             while True:
                 try:
                     event = await event_queue.get()
+                    await payloads.attach([event])
                     print(f"\n🔔 EVENT: {event['message']}")
+                    if event.get("payloads"):
+                        print(f"  {describe_batch([event])}")
                     # Passively display the event - do NOT auto-act on it
                     # User can then ask the agent to perform actions based on this event
                 except asyncio.CancelledError:
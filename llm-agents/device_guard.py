@@ -0,0 +1,225 @@
+import asyncio
+import json
+import os
+import re
+import time
+from typing import Any, Dict, Iterable, List, Optional
+from langchain.agents.middleware import AgentMiddleware
+from langchain_core.messages import ToolMessage
+from langchain_core.tools import ToolException
+
+
+# Circuit breakers and in-flight limits on the agents' device tool calls
+DEVICE_GUARD = os.getenv("DEVICE_GUARD", "1").lower() in ("1", "true", "yes")
+# Seconds a device tool call may take before it is abandoned and counted as a failure
+DEVICE_CALL_TIMEOUT = float(os.getenv("DEVICE_CALL_TIMEOUT", "8"))
+# Tool calls in flight per device; further calls wait for a slot within their timeout
+DEVICE_MAX_IN_FLIGHT = int(os.getenv("DEVICE_MAX_IN_FLIGHT", "2"))
+# Failures in a row that open a device's breaker
+DEVICE_FAILURE_THRESHOLD = int(os.getenv("DEVICE_FAILURE_THRESHOLD", "3"))
+# Seconds an open breaker answers calls itself before one trial call goes to the device
+DEVICE_OPEN_SECONDS = float(os.getenv("DEVICE_OPEN_SECONDS", "30"))
+# Recent calls per device kept for latency and error-rate stats
+DEVICE_STATS_WINDOW = 50
+
+# Errors of the WoT MCP server when it could not reach the device (not when it was misused)
+DEVICE_ERROR = re.compile(r"Failed to (read property|write property|invoke action)")
+
+
+def _sanitized(device: str) -> str:
+    """Device id as it appears in the WoT MCP server's per-affordance tool names."""
+    return re.sub(r"[^a-z0-9]", "_", device, flags=re.IGNORECASE)
+
+
+def _text(content: Any) -> str:
+    if isinstance(content, list):
+        return "\n".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
+    return content if isinstance(content, str) else ""
+
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class DeviceBreaker:
+    """
+    Circuit breaker and in-flight limit of one device.
+
+    closed: calls go through; `threshold` device failures in a row open the breaker.
+    open: calls are answered at once with the last error, for `open_seconds`.
+    half-open: one trial call goes through; success closes the breaker, failure opens it again.
+    """
+    def __init__(self, device: str, threshold: int = DEVICE_FAILURE_THRESHOLD,
+                 open_seconds: float = DEVICE_OPEN_SECONDS, max_in_flight: int = DEVICE_MAX_IN_FLIGHT):
+        self.device = device
+        self.threshold = threshold
+        self.open_seconds = open_seconds
+        self.slots = asyncio.Semaphore(max_in_flight)
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.last_error = ""
+        self.trial = False
+        self.recent: List[tuple] = []
+        self.counts = {"calls": 0, "failures": 0, "rejected": 0}
+
+    def allow(self, now: float) -> bool:
+        if self.state == "open" and now - self.opened_at >= self.open_seconds:
+            self.state = "half_open"
+        if self.state == "half_open":
+            if self.trial:
+                return False
+            self.trial = True
+        return self.state != "open"
+
+    def record(self, ok: bool, latency: float, now: float, error: str = ""):
+        self.trial = False
+        self.counts["calls"] += 1
+        self.recent = self.recent[-(DEVICE_STATS_WINDOW - 1):] + [(ok, latency)]
+        if ok:
+            self.failures = 0
+            self.state = "closed"
+            return
+        self.counts["failures"] += 1
+        self.failures += 1
+        self.last_error = error
+        if self.state == "half_open" or self.failures >= self.threshold:
+            if self.state != "open":
+                print(f"🔌 Device '{self.device}' unavailable ({error}), failing its calls fast for {self.open_seconds:g}s")
+            self.state = "open"
+            self.opened_at = now
+
+    def release(self):
+        """A call that says nothing about the device (e.g. a wrong property name) ended."""
+        self.trial = False
+
+    def unavailable(self, now: float) -> str:
+        self.counts["rejected"] += 1
+        retry = max(0.0, self.opened_at + self.open_seconds - now)
+        return (f"Error: device '{self.device}' is unavailable ({self.last_error}). "
+                f"It will not be called again for {retry:.0f}s; skip it and carry on with the other devices.")
+
+    def stats(self) -> Dict:
+        latencies = [latency for ok, latency in self.recent if ok]
+        return {
+            "state": self.state,
+            **self.counts,
+            "error_rate": round(sum(not ok for ok, _ in self.recent) / len(self.recent), 3) if self.recent else 0.0,
+            "latency_p50": _percentile(latencies, 0.5),
+            "latency_p95": _percentile(latencies, 0.95),
+            "last_error": self.last_error,
+        }
+
+
+class DeviceGuard(AgentMiddleware):
+    """
+    Agent middleware that puts every device tool call behind its device's DeviceBreaker.
+
+    The device of a call is its `device_id` argument (read_property, write_property,
+    invoke_action) or the device id that ends a per-affordance tool name
+    (e.g. startCycle_washingmachine). Calls wait for one of the device's in-flight slots
+    and are abandoned after `timeout` seconds, so a slow or dead device costs the agent
+    at most one timeout per breaker period instead of one HTTP timeout per retry. Other
+    tools are passed through. One guard can be shared by several agents; its breakers are
+    kept when agents are rebuilt.
+    """
+    def __init__(self, devices: Iterable[str] = (), timeout: float = DEVICE_CALL_TIMEOUT,
+                 max_in_flight: int = DEVICE_MAX_IN_FLIGHT, threshold: int = DEVICE_FAILURE_THRESHOLD,
+                 open_seconds: float = DEVICE_OPEN_SECONDS):
+        super().__init__()
+        self.timeout = timeout
+        self.max_in_flight = max_in_flight
+        self.threshold = threshold
+        self.open_seconds = open_seconds
+        self.breakers: Dict[str, DeviceBreaker] = {}
+        self._suffixes: Dict[str, str] = {}
+        self._tool_devices: Dict[str, Optional[str]] = {}
+        self.add_devices(devices)
+
+    def add_devices(self, devices: Iterable[str]):
+        for device in devices:
+            self._suffixes["_" + _sanitized(device)] = device
+        self._tool_devices.clear()
+
+    def device_of(self, tool_name: str, args: Dict) -> Optional[str]:
+        if isinstance(args.get("device_id"), str):
+            return args["device_id"]
+        if tool_name not in self._tool_devices:
+            # Longest match, so "lamp_2" is not taken for "2"
+            matches = [suffix for suffix in self._suffixes if tool_name.endswith(suffix)]
+            self._tool_devices[tool_name] = self._suffixes[max(matches, key=len)] if matches else None
+        return self._tool_devices[tool_name]
+
+    def breaker(self, device: str) -> DeviceBreaker:
+        if device not in self.breakers:
+            self.breakers[device] = DeviceBreaker(device, self.threshold, self.open_seconds, self.max_in_flight)
+        return self.breakers[device]
+
+    async def awrap_tool_call(self, request, handler):
+        call = request.tool_call
+        device = self.device_of(call["name"], call.get("args") or {})
+        if device is None:
+            result = await handler(request)
+            if call["name"] == "list_devices":
+                self._learn_devices(result)
+            return result
+
+        breaker = self.breaker(device)
+        started = time.monotonic()
+        if not breaker.allow(started):
+            return ToolMessage(content=breaker.unavailable(started), tool_call_id=call["id"],
+                               name=call["name"], status="error")
+        try:
+            result = await asyncio.wait_for(self._call(breaker, handler, request), self.timeout)
+        except asyncio.TimeoutError:
+            error = f"no answer within {self.timeout:g}s"
+            breaker.record(False, self.timeout, time.monotonic(), error)
+            return ToolMessage(content=f"Error: device '{device}' gave {error}", tool_call_id=call["id"],
+                               name=call["name"], status="error")
+        except ToolException as e:
+            # A tool without handle_tool_error raises the server's error instead of returning it
+            if not DEVICE_ERROR.search(str(e)):
+                breaker.release()
+                raise
+            result = ToolMessage(content=str(e), tool_call_id=call["id"], name=call["name"], status="error")
+        except BaseException:
+            breaker.release()
+            raise
+        latency = time.monotonic() - started
+        text = _text(result.content) if isinstance(result, ToolMessage) else ""
+        if getattr(result, "status", None) == "error" and DEVICE_ERROR.search(text):
+            breaker.record(False, latency, time.monotonic(), text.split(": ", 1)[-1][:200])
+        elif getattr(result, "status", None) == "error":
+            breaker.release()
+        else:
+            breaker.record(True, latency, time.monotonic())
+        return result
+
+    async def _call(self, breaker: DeviceBreaker, handler, request):
+        async with breaker.slots:
+            return await handler(request)
+
+    def _learn_devices(self, result: Any):
+        try:
+            devices = json.loads(_text(getattr(result, "content", "")))
+        except json.JSONDecodeError:
+            return
+        if isinstance(devices, list):
+            self.add_devices(d["id"] for d in devices if isinstance(d, dict) and isinstance(d.get("id"), str))
+
+    def stats(self) -> Dict[str, Dict]:
+        """Per-device breaker state, call counts, error rate and latency percentiles."""
+        return {device: breaker.stats() for device, breaker in self.breakers.items()}
+
+    def unavailable_devices(self) -> List[str]:
+        return [device for device, breaker in self.breakers.items() if breaker.state != "closed"]
+
+
+def device_guard_middleware(guard: Optional[DeviceGuard] = None) -> List:
+    """Middleware list for create_agent (empty when DEVICE_GUARD is off)."""
+    if not DEVICE_GUARD:
+        return []
+    return [guard or DeviceGuard()]
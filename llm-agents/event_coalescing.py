@@ -0,0 +1,209 @@
+import asyncio
+import fnmatch
+import json
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+
+# Default window for event resources without their own policy: "debounce:SECONDS",
+# "throttle:SECONDS" or "pass"
+EVENT_POLICY = os.getenv("EVENT_POLICY", "debounce:2")
+# Per event type, e.g. "motionDetected=debounce:5,vibration*=throttle:30,doorbellPressed=pass"
+EVENT_POLICIES = os.getenv("EVENT_POLICIES", "")
+# A debounced resource that keeps firing is still released after this many seconds
+EVENT_MAX_WAIT = float(os.getenv("EVENT_MAX_WAIT", "10"))
+# Payloads of the latest raw updates inlined per event resource of a batch
+EVENT_PAYLOADS_KEEP = int(os.getenv("EVENT_PAYLOADS_KEEP", "5"))
+# Seconds a batch waits for its payload reads before it is sent without them
+EVENT_PAYLOAD_TIMEOUT = float(os.getenv("EVENT_PAYLOAD_TIMEOUT", "2"))
+# Characters of one payload kept in the prompt
+PAYLOAD_TEXT_KEEP = 300
+
+MODES = ("debounce", "throttle", "pass")
+
+
+def parse_policy(spec: str) -> Tuple[str, float]:
+    """Parse "debounce:5" into ("debounce", 5.0); "pass" has no window."""
+    mode, _, window = spec.strip().partition(":")
+    if mode not in MODES:
+        raise ValueError(f"Unknown event policy '{spec}' (expected one of {', '.join(MODES)})")
+    return mode, float(window or 0)
+
+
+def parse_policies(spec: str) -> Dict[str, Tuple[str, float]]:
+    """Parse "motionDetected=debounce:5,vibration*=throttle:30" into {pattern: (mode, window)}."""
+    policies = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        pattern, _, policy = item.partition("=")
+        policies[pattern.strip()] = parse_policy(policy)
+    return policies
+
+
+def event_name(uri: str) -> str:
+    """Event type of a resource URI (wot://washingmachine/events/finishedCycle -> finishedCycle)."""
+    return uri.rstrip("/").rsplit("/", 1)[-1]
+
+
+class EventCoalescer:
+    """
+    Folds bursts of resource update notifications into a few batches for the agent.
+
+    Every event resource has a policy, chosen by its event name or URI (shell patterns allowed):
+    - debounce:S - the resource is released once it has been quiet for S seconds, or at the
+      latest `max_wait` seconds after its first pending update;
+    - throttle:S - the resource is released at most once every S seconds;
+    - pass - every update is released at the next poll.
+    Repeated updates of a pending resource are only counted, so a chatty sensor shows up
+    once per batch with the number of raw updates it stands for.
+    """
+    def __init__(self, policies: Optional[Dict[str, Tuple[str, float]]] = None,
+                 default: Tuple[str, float] = parse_policy(EVENT_POLICY), max_wait: float = EVENT_MAX_WAIT):
+        self.policies = parse_policies(EVENT_POLICIES) if policies is None else policies
+        self.default = default
+        self.max_wait = max_wait
+        self.pending: Dict[str, Dict] = {}
+        self.released_at: Dict[str, float] = {}
+        self.stats = {"raw_events": 0, "released_events": 0, "batches": 0}
+
+    def policy(self, uri: str) -> Tuple[str, float]:
+        name = event_name(uri)
+        for pattern, policy in self.policies.items():
+            if fnmatch.fnmatchcase(name, pattern) or fnmatch.fnmatchcase(uri, pattern):
+                return policy
+        return self.default
+
+    def add(self, uri: str, name: Optional[str] = None, now: Optional[float] = None):
+        """Record one raw update of an event resource."""
+        now = time.monotonic() if now is None else now
+        self.stats["raw_events"] += 1
+        entry = self.pending.get(uri)
+        if entry is None:
+            entry = self.pending[uri] = {"uri": uri, "name": name or event_name(uri), "count": 0, "first": now}
+        entry["count"] += 1
+        entry["last"] = now
+        mode, window = self.policy(uri)
+        if mode == "debounce":
+            entry["due"] = min(now + window, entry["first"] + self.max_wait)
+        elif mode == "throttle":
+            entry["due"] = max(entry["first"], self.released_at.get(uri, float("-inf")) + window)
+        else:
+            entry["due"] = entry["first"]
+
+    def next_due(self) -> Optional[float]:
+        """When the next pending resource is released (None if nothing is pending)."""
+        return min((entry["due"] for entry in self.pending.values()), default=None)
+
+    def ready(self, now: Optional[float] = None) -> List[Dict]:
+        """Pending resources whose window has closed, oldest first: {uri, name, count, first, last}."""
+        now = time.monotonic() if now is None else now
+        batch = sorted((e for e in self.pending.values() if e["due"] <= now), key=lambda e: e["first"])
+        for entry in batch:
+            del self.pending[entry["uri"]]
+            self.released_at[entry["uri"]] = now
+        if batch:
+            self.stats["batches"] += 1
+            self.stats["released_events"] += len(batch)
+        return batch
+
+
+def resource_events(result: Any) -> List[Dict]:
+    """Buffered events ({timestamp, data, eventType}) of a read_resource result on an event resource."""
+    for content in getattr(result, "contents", []):
+        try:
+            value = json.loads(getattr(content, "text", "") or "")
+        except json.JSONDecodeError:
+            continue
+        if isinstance(value, dict) and isinstance(value.get("events"), list):
+            return value["events"]
+    return []
+
+
+class PayloadFetcher:
+    """
+    Reads the buffered payloads of event resources while their notifications are coming in.
+
+    A notification only carries the resource URI. notify() starts a read_resource of the URI
+    in the background (reads of different resources run concurrently; a resource that fires
+    again while its read is in flight is read once more afterwards), so by the time a batch
+    is released its payloads are usually already there and attach() only collects them.
+    """
+    def __init__(self, read: Callable[[str], Awaitable[Any]], timeout: float = EVENT_PAYLOAD_TIMEOUT,
+                 keep: int = EVENT_PAYLOADS_KEEP):
+        self.read = read
+        self.timeout = timeout
+        self.keep = keep
+        self._reads: Dict[str, asyncio.Task] = {}
+        self._stale: set = set()
+        self.stats = {"reads": 0, "read_errors": 0, "timeouts": 0}
+
+    def notify(self, uri: str):
+        """A new update of `uri` arrived: make sure a read started after it."""
+        task = self._reads.get(uri)
+        if task is not None and not task.done():
+            self._stale.add(uri)
+        else:
+            self._start(uri)
+
+    def _start(self, uri: str):
+        self._stale.discard(uri)
+        self.stats["reads"] += 1
+        task = asyncio.ensure_future(self._read(uri))
+        self._reads[uri] = task
+        task.add_done_callback(lambda _, uri=uri: uri in self._stale and self._start(uri))
+
+    async def _read(self, uri: str) -> List[Dict]:
+        try:
+            return resource_events(await self.read(uri))
+        except Exception:
+            self.stats["read_errors"] += 1
+            return []
+
+    async def _latest(self, uri: str) -> List[Dict]:
+        while True:
+            task = self._reads.get(uri)
+            if task is None:
+                return []
+            events = await asyncio.shield(task)
+            if self._reads.get(uri) is task:
+                return events
+
+    async def attach(self, batch: List[Dict]) -> List[Dict]:
+        """Add "payloads" (data of the entry's latest raw updates) and "cursor" to every entry of a batch."""
+        if not batch:
+            return batch
+        try:
+            results = await asyncio.wait_for(
+                asyncio.gather(*(self._latest(entry["uri"]) for entry in batch)), self.timeout)
+        except asyncio.TimeoutError:
+            self.stats["timeouts"] += 1
+            return batch
+        for entry, events in zip(batch, results):
+            if events and events[-1].get("timestamp"):
+                # Server timestamp of the newest event read: how far this resource has been processed
+                entry["cursor"] = events[-1]["timestamp"]
+            recent = events[-min(entry["count"], self.keep):]
+            if any(event.get("data") is not None for event in recent):
+                entry["payloads"] = [event.get("data") for event in recent]
+        return batch
+
+
+def _payload_text(value: Any) -> str:
+    text = json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+    return text if len(text) <= PAYLOAD_TEXT_KEEP else text[:PAYLOAD_TEXT_KEEP] + "..."
+
+
+def describe_batch(batch: List[Dict]) -> str:
+    """Prompt lines for a batch: one per resource, with the number of raw updates it folds and their payloads."""
+    lines = []
+    for entry in batch:
+        line = f"- {entry['name']}"
+        if entry["count"] > 1:
+            line += f" (x{entry['count']} within {entry['last'] - entry['first']:.1f}s)"
+        payloads = entry.get("payloads")
+        if payloads and len(payloads) == 1:
+            line += f", data: {_payload_text(payloads[0])}"
+        elif payloads:
+            line += f", data of the latest {len(payloads)}: " + ", ".join(_payload_text(p) for p in payloads)
+        lines.append(line)
+    return "\n".join(lines)
@@ -0,0 +1,296 @@
+import asyncio
+import multiprocessing
+import os
+import queue
+import time
+import zlib
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+from event_coalescing import EVENT_MAX_WAIT, EVENT_POLICY, EventCoalescer, event_name, parse_policy
+from temporal_rules import RuleError, TemporalRuleEngine, check_rule, rule_events
+
+
+# Worker processes the controller's event stream is partitioned over, by Thing
+# (0 processes events in the controller's event loop)
+CONTROLLER_SHARDS = int(os.getenv("CONTROLLER_SHARDS", "0"))
+# Messages sent to a shard at once; a tick flushes the rest
+SHARD_BATCH = 512
+# Seconds a tick waits for the shards to answer
+SHARD_TIMEOUT = 10.0
+
+
+def thing_id(uri: str) -> str:
+    """Thing of a resource URI (wot://washingmachine/events/finishedCycle -> washingmachine)."""
+    return uri.split("://", 1)[-1].split("/", 1)[0]
+
+
+def shard_of(thing: str, shards: int) -> int:
+    """Shard of a Thing; stable across processes and restarts."""
+    return zlib.crc32(thing.encode()) % shards
+
+
+def rule_event_list(uris) -> str:
+    """Event names for RULE_PROMPT; names several Things emit also show their Thing-qualified form."""
+    things: Dict[str, Set[str]] = {}
+    for uri in uris:
+        if "/events/" in uri:
+            things.setdefault(event_name(uri), set()).add(thing_id(uri))
+    lines = []
+    for name in sorted(things):
+        owners = sorted(things[name])
+        if len(owners) > 1:
+            lines.append(f"- {name} (from {', '.join(owners)}; e.g. {owners[0]}/{name} for one of them)")
+        else:
+            lines.append(f"- {name}")
+    return "\n".join(lines)
+
+
+class LocalEvents:
+    """
+    Event coalescing and local rule evaluation in the calling process. The reactive
+    controller runs one in its event loop; with sharding, every shard process runs one
+    for its Things.
+    """
+    def __init__(self, policies: Optional[Dict[str, Tuple[str, float]]] = None,
+                 default: Tuple[str, float] = parse_policy(EVENT_POLICY), max_wait: float = EVENT_MAX_WAIT):
+        self.coalescer = EventCoalescer(policies, default, max_wait)
+        self.engine = TemporalRuleEngine()
+
+    @property
+    def retention(self) -> float:
+        return self.engine.history.retention
+
+    def set_resources(self, resources: Dict[str, str]):
+        """Event resources (URI -> name) of the server; only needed to place rules on shards."""
+
+    def record(self, key: str, at: float, data: Any = None):
+        """Restore one event of the rule history, without triggering anything."""
+        self.engine.history.record(key, at, data)
+
+    def add_rule(self, rule: Dict, on_fire: Callable[[Dict, Dict], None]):
+        self.engine.add_rule(rule, on_fire)
+
+    def add(self, uri: str, name: Optional[str] = None, data: Any = None,
+            at: Optional[float] = None, now: Optional[float] = None):
+        """One raw update of an event resource: coalesce it and record it for the rules."""
+        self.coalescer.add(uri, name, now)
+        self.engine.on_event(event_name(uri), data, at, trigger=False, thing=thing_id(uri))
+
+    def release(self, now: Optional[float] = None, at: Optional[float] = None) -> List[Dict]:
+        """
+        Fire the due timers and return the closed event windows (see EventCoalescer.ready).
+        Event-triggered rules run once per closed window, under the same coalescing policy.
+        """
+        self.engine.advance(at)
+        batch = self.coalescer.ready(now)
+        trigger_rules(self.engine, batch)
+        return batch
+
+    async def tick(self, now: Optional[float] = None, at: Optional[float] = None) -> List[Dict]:
+        return self.release(now, at)
+
+    def stats(self) -> Dict:
+        return {**self.coalescer.stats, "pending": len(self.coalescer.pending),
+                **self.engine.stats, "timers": len(self.engine.wheel)}
+
+    def close(self):
+        pass
+
+
+def trigger_rules(engine: TemporalRuleEngine, batch: List[Dict], keys: Optional[Set[str]] = None):
+    """Run the event-triggered rules of a batch of closed windows, at the last event of each."""
+    for entry in batch:
+        key, thing = event_name(entry["uri"]), thing_id(entry["uri"])
+        if keys is None or key in keys or f"{thing}/{key}" in keys:
+            engine.trigger(key, engine.history.last_seen(key), thing)
+
+
+def _run_shard(index: int, inbox, replies, policies, default, max_wait):
+    """Shard process: apply the messages of the controller in order, answer every tick."""
+    events = LocalEvents(policies, default, max_wait)
+    fired = []
+    while True:
+        messages = inbox.get()
+        if messages is None:
+            return
+        for message in messages:
+            kind = message[0]
+            if kind == "event":
+                events.add(*message[1:])
+            elif kind == "record":
+                events.record(*message[1:])
+            elif kind == "rule":
+                events.add_rule(message[2], lambda rule, facts, rule_index=message[1]: fired.append((rule_index, facts)))
+            elif kind == "tick":
+                batch = events.release(message[2], message[3])
+                replies.put((message[1], index, batch, fired[:], events.stats()))
+                fired.clear()
+
+
+class ShardedEvents:
+    """
+    LocalEvents partitioned by Thing over `shards` worker processes.
+
+    Every update is routed by the Thing in its resource URI, so all events of a Thing are
+    coalesced and evaluated by the same shard, in arrival order. A rule is placed on the
+    shard of the Things that emit the events it mentions; a Thing-qualified event
+    ("livingroom/motionDetected") only counts its own Thing, so rules over an event name
+    many Things share are placed by (thing, event). Rules whose events come from Things on
+    several shards (an unqualified shared name, say), or that only depend on time, stay
+    with a coordinator engine in this process, which is only fed the events those rules
+    mention. Placement uses the event resources known when the rule is added.
+
+    Messages are sent to the shards in chunks; tick() flushes them, then merges the closed
+    event windows of all shards and calls on_fire for the rules they fired. Replies that
+    miss a tick's timeout are merged into the next tick.
+    """
+    def __init__(self, shards: int, policies: Optional[Dict[str, Tuple[str, float]]] = None,
+                 default: Tuple[str, float] = parse_policy(EVENT_POLICY), max_wait: float = EVENT_MAX_WAIT,
+                 context: str = "spawn"):
+        ctx = multiprocessing.get_context(context)
+        self.shards = shards
+        self.coordinator = TemporalRuleEngine()
+        self.things: Dict[str, Set[str]] = {}
+        self.placement = {"shards": 0, "coordinator": 0}
+        self._routes: Dict[str, int] = {}
+        self._coordinated: Set[str] = set()
+        self._rules: List[Tuple[Dict, Callable[[Dict, Dict], None]]] = []
+        self._outbox: List[List[tuple]] = [[] for _ in range(shards)]
+        self._stats: List[Dict] = [{} for _ in range(shards)]
+        self._tick = 0
+        self._replies = ctx.Queue()
+        self._inboxes = [ctx.Queue() for _ in range(shards)]
+        self._workers = [
+            ctx.Process(target=_run_shard, args=(index, inbox, self._replies, policies, default, max_wait),
+                        name=f"event-shard-{index}", daemon=True)
+            for index, inbox in enumerate(self._inboxes)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    @property
+    def retention(self) -> float:
+        return self.coordinator.history.retention
+
+    def set_resources(self, resources: Dict[str, str]):
+        for uri in resources:
+            if "/events/" in uri:
+                self.things.setdefault(event_name(uri), set()).add(thing_id(uri))
+
+    def place(self, rule: Dict) -> Optional[int]:
+        """Shard that sees every event the rule mentions; None for the coordinator."""
+        names = rule_events(rule)
+        things = set()
+        for name in names:
+            if "/" in name:
+                things.add(name.split("/", 1)[0])
+            elif name in self.things:
+                things.update(self.things[name])
+            else:
+                return None
+        shards = {shard_of(thing, self.shards) for thing in things}
+        return shards.pop() if len(shards) == 1 else None
+
+    def record(self, key: str, at: float, data: Any = None):
+        self.coordinator.history.record(key, at, data)
+        for shard in range(self.shards):
+            self._send(shard, ("record", key, at, data))
+
+    def add_rule(self, rule: Dict, on_fire: Callable[[Dict, Dict], None]):
+        problems = check_rule(rule)
+        if problems:
+            raise RuleError("; ".join(problems))
+        shard = self.place(rule)
+        if shard is None:
+            self.coordinator.add_rule(rule, on_fire)
+            self._coordinated.update(rule_events(rule))
+            self.placement["coordinator"] += 1
+            return
+        # Shards report fired rules by index; on_fire gets this process's rule (ids are set after adding)
+        self._rules.append((rule, on_fire))
+        self._send(shard, ("rule", len(self._rules) - 1, rule))
+        self.placement["shards"] += 1
+
+    def add(self, uri: str, name: Optional[str] = None, data: Any = None,
+            at: Optional[float] = None, now: Optional[float] = None):
+        at = time.time() if at is None else at
+        now = time.monotonic() if now is None else now
+        shard = self._routes.get(uri)
+        if shard is None:
+            shard = self._routes[uri] = shard_of(thing_id(uri), self.shards)
+        key, thing = event_name(uri), thing_id(uri)
+        if key in self._coordinated or f"{thing}/{key}" in self._coordinated:
+            self.coordinator.on_event(key, data, at, trigger=False, thing=thing)
+        self._send(shard, ("event", uri, name, data, at, now))
+
+    def _send(self, shard: int, message: tuple):
+        outbox = self._outbox[shard]
+        outbox.append(message)
+        if len(outbox) >= SHARD_BATCH:
+            self._flush(shard)
+
+    def _flush(self, shard: int):
+        if self._outbox[shard]:
+            self._inboxes[shard].put(self._outbox[shard])
+            self._outbox[shard] = []
+
+    async def tick(self, now: Optional[float] = None, at: Optional[float] = None) -> List[Dict]:
+        """Closed event windows of all shards, oldest first; fired rules are passed to on_fire."""
+        now = time.monotonic() if now is None else now
+        at = time.time() if at is None else at
+        self._tick += 1
+        for shard in range(self.shards):
+            self._send(shard, ("tick", self._tick, now, at))
+            self._flush(shard)
+        self.coordinator.advance(at)
+        batch = []
+        for tick, shard, entries, fired, stats in await asyncio.to_thread(self._collect, self._tick):
+            batch.extend(entries)
+            if tick == self._tick:
+                self._stats[shard] = stats
+            for index, facts in fired:
+                rule, on_fire = self._rules[index]
+                on_fire(rule, facts)
+        batch.sort(key=lambda entry: entry["first"])
+        trigger_rules(self.coordinator, batch, self._coordinated)
+        return batch
+
+    def _collect(self, tick: int) -> List[tuple]:
+        """
+        Replies to this tick, plus late replies to earlier ticks that timed out (a shard answers
+        in order, so these come before its reply to this tick).
+        """
+        replies, answered = [], 0
+        deadline = time.monotonic() + SHARD_TIMEOUT
+        while answered < self.shards:
+            try:
+                reply = self._replies.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                print(f"⚠️  {self.shards - answered} event shards did not answer in {SHARD_TIMEOUT:.0f}s, "
+                      f"merging their reply into the next tick")
+                break
+            replies.append(reply)
+            answered += reply[0] == tick
+        return replies
+
+    def stats(self) -> Dict:
+        totals: Dict[str, Any] = {}
+        for stats in self._stats:
+            for key, value in stats.items():
+                totals[key] = totals.get(key, 0) + value
+        for key in ("evaluations", "fired"):
+            totals[key] = totals.get(key, 0) + self.coordinator.stats[key]
+        totals["timers"] = totals.get("timers", 0) + len(self.coordinator.wheel)
+        return {**totals, "shards": self.shards, "coordinated_rules": self.placement["coordinator"]}
+
+    def close(self):
+        for inbox in self._inboxes:
+            inbox.put(None)
+        for worker in self._workers:
+            worker.join(timeout=5)
+            if worker.is_alive():
+                worker.terminate()
+
+
+def open_events(shards: int = CONTROLLER_SHARDS):
+    """Event processing for a controller: in this process, or over `shards` worker processes."""
+    return ShardedEvents(shards) if shards > 0 else LocalEvents()
@@ -0,0 +1,148 @@
+import copy
+import json
+from typing import Dict, List, Optional
+from flow_layout import layout_flow
+from flow_utils import new_node_id, validate_flow
+from nodered_deploy import LAYOUT_FIELDS, tab_of
+
+
+# Appended to a refinement request; the model answers with a patch instead of a whole flow
+PATCH_INSTRUCTIONS = """
+This is a change to the existing Node-RED flow above. Do NOT repeat the flow.
+Return ONLY a JSON patch object with the operations needed (omit empty keys):
+{"add": [FULL_NEW_NODE, ...],
+ "remove": ["NODE_ID", ...],
+ "modify": [{"id": "NODE_ID", "set": {"field": "new value"}, "unset": ["field"]}],
+ "wire": [{"from": "NODE_ID", "to": "NODE_ID", "port": 0}],
+ "unwire": [{"from": "NODE_ID", "to": "NODE_ID"}]}
+New nodes may reference existing node ids (tab, consumed-thing nodes) and each other.
+"""
+
+# Default field values that are left out when the current flow is shown to the model
+BOILERPLATE = {"topic": "", "uriVariables": "{}", "info": "", "env": [], "td": "", "disabled": False,
+               "statusVal": "", "statusType": "auto", "targetType": "msg", "tostatus": False}
+
+PATCH_KEYS = ("add", "remove", "modify", "wire", "unwire")
+
+
+class PatchError(Exception):
+    """Raised when a patch cannot be applied or leaves the flow invalid."""
+
+
+def compact_flow(flow: List[Dict]) -> str:
+    """The flow as compact JSON without coordinates and default fields, to keep refinement prompts small."""
+    compact = []
+    for node in flow:
+        compact.append({k: v for k, v in node.items()
+                        if k not in LAYOUT_FIELDS and not (k in BOILERPLATE and BOILERPLATE[k] == v)})
+    return json.dumps(compact, separators=(",", ":"))
+
+
+def patch_request(flow: List[Dict], requirement: str) -> str:
+    return f"Current flow:\n{compact_flow(flow)}\n\nChange: {requirement}\n{PATCH_INSTRUCTIONS}"
+
+
+def extract_patch(text: str) -> Optional[Dict]:
+    """Find the patch object in a model response (bare, fenced or embedded in prose)."""
+    decoder = json.JSONDecoder()
+    start = text.find("{")
+    while start >= 0:
+        try:
+            value, _ = decoder.raw_decode(text, start)
+            if isinstance(value, dict) and any(key in value for key in PATCH_KEYS):
+                return value
+        except json.JSONDecodeError:
+            pass
+        start = text.find("{", start + 1)
+    return None
+
+
+def patch_size(patch: Dict) -> Dict[str, int]:
+    return {key: len(patch.get(key) or []) for key in PATCH_KEYS}
+
+
+def _endpoint(nodes: Dict[str, Dict], edge: Dict, key: str) -> Dict:
+    node = nodes.get(edge.get(key))
+    if node is None:
+        raise PatchError(f"wire {key} unknown node {edge.get(key)}")
+    return node
+
+
+def apply_patch(flow: List[Dict], patch: Dict) -> List[Dict]:
+    """
+    Apply a patch to a copy of the flow: remove, then modify, add, unwire and wire.
+    Removed nodes are also dropped from every wire and new nodes are put on the flow's tab.
+    Raises PatchError.
+    """
+    flow = copy.deepcopy(flow)
+    tab = tab_of(flow)
+    nodes = {node["id"]: node for node in flow}
+
+    removed = set(patch.get("remove") or [])
+    if tab and tab["id"] in removed:
+        raise PatchError("the tab cannot be removed")
+    for node_id in removed:
+        if node_id not in nodes:
+            raise PatchError(f"cannot remove unknown node {node_id}")
+        del nodes[node_id]
+    for node in nodes.values():
+        if "wires" in node:
+            node["wires"] = [[target for target in port if target not in removed] for port in node["wires"]]
+        if "links" in node:
+            node["links"] = [target for target in node["links"] if target not in removed]
+
+    for change in patch.get("modify") or []:
+        node = nodes.get(change.get("id"))
+        if node is None:
+            raise PatchError(f"cannot modify unknown node {change.get('id')}")
+        if "id" in (change.get("set") or {}):
+            raise PatchError(f"cannot change the id of node {node['id']}")
+        node.update(change.get("set") or {})
+        for field in change.get("unset") or []:
+            node.pop(field, None)
+
+    for node in copy.deepcopy(patch.get("add") or []):
+        node.setdefault("id", new_node_id())
+        if node["id"] in nodes:
+            raise PatchError(f"cannot add node {node['id']}: the id already exists")
+        if node.get("type") not in ("tab", "consumed-thing"):
+            node.setdefault("wires", [])
+            if tab:
+                node["z"] = tab["id"]
+        nodes[node["id"]] = node
+
+    for edge in patch.get("unwire") or []:
+        source, target = _endpoint(nodes, edge, "from"), _endpoint(nodes, edge, "to")
+        source["wires"] = [[t for t in port if t != target["id"]] for port in source.get("wires", [])]
+    for edge in patch.get("wire") or []:
+        source, target = _endpoint(nodes, edge, "from"), _endpoint(nodes, edge, "to")
+        port = int(edge.get("port", 0))
+        wires = source.setdefault("wires", [])
+        while len(wires) <= port:
+            wires.append([])
+        if target["id"] not in wires[port]:
+            wires[port].append(target["id"])
+
+    return list(nodes.values())
+
+
+def refine_flow(flow: List[Dict], response_text: str) -> Dict:
+    """
+    Turn a refinement response into the new flow. Returns the patch and the patched flow;
+    raises PatchError if there is no patch or the patch introduces validation problems.
+    """
+    patch = extract_patch(response_text)
+    if patch is None:
+        raise PatchError("the response contains no patch")
+    patched = apply_patch(flow, patch)
+    existing = set(validate_flow(flow))
+    problems = [problem for problem in validate_flow(patched) if problem not in existing]
+    if problems:
+        raise PatchError("; ".join(problems))
+    return {"patch": patch, "flow": layout_flow(patched)}
+
+
+def print_patch_summary(patch: Dict, flow: List[Dict]):
+    size = patch_size(patch)
+    print(f"✓ Applied patch: +{size['add']} ~{size['modify']} -{size['remove']} nodes, "
+          f"+{size['wire']} -{size['unwire']} wires ({len(flow)} nodes in flow)")
@@ -0,0 +1,188 @@
+import json
+import re
+from typing import Dict, List, Optional
+from flow_layout import layout_flow
+from flow_utils import new_node_id
+from td_discovery import td_key
+
+
+# Plan step kind -> (Node-RED node type, affordance field, TD section)
+AFFORDANCE_STEPS = {
+    "read": ("read-property", "property", "properties"),
+    "write": ("write-property", "property", "properties"),
+    "invoke": ("invoke-action", "action", "actions"),
+    "event": ("subscribe-event", "event", "events"),
+}
+OTHER_STEPS = ("inject", "function", "delay", "debug")
+
+
+class PlanError(Exception):
+    """Raised when a plan references unknown devices, affordances or steps."""
+
+
+def td_link(td: Dict) -> Optional[str]:
+    """Root URL of a Thing: the TD base, or the first form href cut before /properties|actions|events."""
+    if td.get("base"):
+        return td["base"].rstrip("/")
+    for section in ("properties", "actions", "events"):
+        for affordance in td.get(section, {}).values():
+            for form in affordance.get("forms", []):
+                href = form.get("href", "")
+                match = re.match(r"(.*?)/(properties|actions|events)/", href)
+                if match:
+                    return match.group(1)
+    thing_id = td.get("id", "")
+    return thing_id if thing_id.startswith("http") else None
+
+
+def find_td(tds: List[Dict], device: str) -> Optional[Dict]:
+    """Match a plan device name against TD titles and ids, ignoring case and spaces."""
+    wanted = re.sub(r"[\s_-]", "", device).lower()
+    for td in tds:
+        for name in (td.get("title", ""), td_key(td)):
+            if re.sub(r"[\s_-]", "", name).lower() == wanted:
+                return td
+    return None
+
+
+def extract_plan(text: str) -> Optional[Dict]:
+    """Find the plan object (with "steps") in a model response."""
+    decoder = json.JSONDecoder()
+    start = text.find("{")
+    while start >= 0:
+        try:
+            value, _ = decoder.raw_decode(text, start)
+            if isinstance(value, dict) and isinstance(value.get("steps"), list):
+                return value
+        except json.JSONDecodeError:
+            pass
+        start = text.find("{", start + 1)
+    return None
+
+
+def _consumed_thing(link: str) -> Dict:
+    return {
+        "id": new_node_id(), "type": "consumed-thing", "tdLink": link, "td": "",
+        "http": True, "ws": False, "coap": False, "mqtt": False, "opcua": False, "modbus": False,
+        "basicAuth": False, "username": "", "password": "",
+    }
+
+
+def _set_payload(name: str, value) -> Dict:
+    return {
+        "type": "change", "name": name,
+        "rules": [{"t": "set", "p": "payload", "pt": "msg", "to": json.dumps(value), "tot": "json"}],
+        "action": "", "property": "", "from": "", "to": "", "reg": False,
+    }
+
+
+def _node(step: Dict, thing_ids: Dict[str, str]) -> Dict:
+    kind = step["kind"]
+    name = step.get("name", "")
+    if kind in AFFORDANCE_STEPS:
+        node_type, field, _ = AFFORDANCE_STEPS[kind]
+        node = {"type": node_type, "name": name or step[field], "topic": "",
+                "thing": thing_ids[step["device"]], field: step[field]}
+        if kind != "event":
+            node["uriVariables"] = "{}"
+        if kind == "read":
+            node["observe"] = bool(step.get("observe", False))
+        return node
+    if kind == "inject":
+        repeat = step.get("every")
+        return {"type": "inject", "name": name, "props": [{"p": "payload"}],
+                "repeat": str(repeat) if repeat else "", "crontab": step.get("cron", ""),
+                "once": bool(step.get("once", False)), "onceDelay": 0.1, "topic": "",
+                "payload": json.dumps(step.get("payload", "")), "payloadType": "json"}
+    if kind == "function":
+        return {"type": "function", "name": name, "func": step.get("code", "return msg;"),
+                "outputs": int(step.get("outputs", 1)), "noerr": 0, "initialize": "", "finalize": "", "libs": []}
+    if kind == "delay":
+        return {"type": "delay", "name": name, "pauseType": "delay", "timeout": str(step.get("seconds", 1)),
+                "timeoutUnits": "seconds", "rate": "1", "nbRateUnits": "1", "rateUnits": "second",
+                "randomFirst": "1", "randomLast": "5", "randomUnits": "seconds", "drop": False,
+                "allowrate": False, "outputs": 1}
+    return {"type": "debug", "name": name, "active": True, "tosidebar": True, "console": False,
+            "tostatus": False, "complete": "payload", "targetType": "msg", "statusVal": "", "statusType": "auto"}
+
+
+def _placed(node: Dict, tab_id: str) -> Dict:
+    """Node-RED field order: id, type, z, node fields, x, y, wires."""
+    node = dict(node)
+    return {"id": new_node_id(), "type": node.pop("type"), "z": tab_id, **node, "x": 0, "y": 0, "wires": []}
+
+
+def check_plan(plan: Dict, tds: List[Dict]) -> List[str]:
+    """Problems that prevent compiling the plan (empty if it can be compiled)."""
+    problems = []
+    ids = set()
+    for step in plan.get("steps", []):
+        kind = step.get("kind")
+        if not step.get("id") or step["id"] in ids:
+            problems.append(f"step without a unique id: {step}")
+        ids.add(step.get("id"))
+        if kind in AFFORDANCE_STEPS:
+            _, field, section = AFFORDANCE_STEPS[kind]
+            td = find_td(tds, step.get("device", ""))
+            if td is None:
+                problems.append(f"{step.get('id')}: unknown device '{step.get('device')}'")
+            elif step.get(field) not in td.get(section, {}):
+                problems.append(f"{step.get('id')}: {td.get('title')} has no {field} '{step.get(field)}'")
+        elif kind not in OTHER_STEPS:
+            problems.append(f"{step.get('id')}: unknown step kind '{kind}'")
+    for edge in plan.get("edges", []):
+        for step_id in edge[:2]:
+            if step_id not in ids:
+                problems.append(f"edge {edge}: unknown step '{step_id}'")
+    return problems
+
+
+def compile_plan(plan: Dict, tds: List[Dict]) -> List[Dict]:
+    """
+    Expand a plan into a Node-RED WoT flow: one tab, one consumed-thing per used device
+    (tdLink from its TD), one node per step with generated hex ids, constant write/invoke
+    inputs as change nodes in front of the interaction, and x/y from flow_layout.
+    """
+    problems = check_plan(plan, tds)
+    if problems:
+        raise PlanError("; ".join(problems))
+
+    tab = {"id": new_node_id(), "type": "tab", "label": plan.get("name", "generated-flow"),
+           "disabled": False, "info": plan.get("description", ""), "env": []}
+    flow = [tab]
+    thing_ids: Dict[str, str] = {}
+    things_by_td: Dict[str, str] = {}
+    for step in plan["steps"]:
+        if step["kind"] in AFFORDANCE_STEPS and step["device"] not in thing_ids:
+            td = find_td(tds, step["device"])
+            if td_key(td) not in things_by_td:
+                thing = _consumed_thing(td_link(td) or td_key(td))
+                things_by_td[td_key(td)] = thing["id"]
+                flow.append(thing)
+            thing_ids[step["device"]] = things_by_td[td_key(td)]
+
+    # Each step has an entry node (where edges arrive) and an exit node (where edges leave)
+    entry, exit_, nodes = {}, {}, []
+    for step in plan["steps"]:
+        node = _placed(_node(step, thing_ids), tab["id"])
+        entry[step["id"]] = exit_[step["id"]] = node["id"]
+        value = step.get("value", step.get("input"))
+        if step["kind"] in ("write", "invoke") and value is not None:
+            setter = _placed(_set_payload(f"{node['name']} input", value), tab["id"])
+            setter["wires"] = [[node["id"]]]
+            entry[step["id"]] = setter["id"]
+            nodes.append(setter)
+        outputs = node.get("outputs", 1) if node["type"] != "debug" else 0
+        node["wires"] = [[] for _ in range(outputs)]
+        nodes.append(node)
+
+    by_id = {node["id"]: node for node in nodes}
+    for edge in plan.get("edges", []):
+        source, target = by_id[exit_[edge[0]]], entry[edge[1]]
+        port = edge[2] if len(edge) > 2 else 0
+        while len(source["wires"]) <= port:
+            source["wires"].append([])
+        if target not in source["wires"][port]:
+            source["wires"][port].append(target)
+
+    return layout_flow(flow + nodes)
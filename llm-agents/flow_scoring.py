@@ -0,0 +1,327 @@
+import argparse
+import csv
+import glob
+import hashlib
+import json
+import os
+import re
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from flow_utils import load_flow_file
+
+
+# Nodes that never change what a flow does
+IGNORED_TYPES = {"tab", "comment", "debug"}
+# Nodes that make an effect conditional when they sit between a trigger and the effect
+CONDITION_TYPES = {"switch", "function", "rbe", "filter"}
+EFFECT_TYPES = {"invoke-action", "write-property"}
+AFFORDANCE_FIELDS = {
+    "subscribe-event": ("event", "event"),
+    "invoke-action": ("action", "action"),
+    "read-property": ("property", "property"),
+    "write-property": ("property", "property"),
+    "observe-property": ("property", "property"),
+}
+SCORE_WEIGHTS = {"devices": 0.2, "affordances": 0.3, "topology": 0.2, "rules": 0.3}
+WL_ITERATIONS = 3
+
+
+def normalize_requirement(text: Optional[str]) -> str:
+    return re.sub(r"\s+", " ", (text or "").strip().lower()).rstrip(".")
+
+
+def device_name(consumed_thing: Dict) -> str:
+    """Device of a consumed-thing node: last path segment of its tdLink (or the inline TD title)."""
+    link = (consumed_thing.get("tdLink") or "").rstrip("/")
+    if link:
+        return link.rsplit("/", 1)[-1].lower()
+    td = consumed_thing.get("td") or {}
+    try:
+        # Node-RED stores the TD as a JSON string; generated flows sometimes inline the object
+        td = json.loads(td) if isinstance(td, str) else td
+        return str(td.get("title") or "").lower()
+    except (json.JSONDecodeError, TypeError, AttributeError):
+        return ""
+
+
+def f1(expected, actual) -> float:
+    """F1 overlap of two sets or multisets (Counters). Two empty collections match perfectly."""
+    if isinstance(expected, Counter):
+        overlap, total = sum((expected & actual).values()), sum(expected.values()) + sum(actual.values())
+    else:
+        overlap, total = len(expected & actual), len(expected) + len(actual)
+    return 1.0 if total == 0 else 2 * overlap / total
+
+
+def _digest(value: str) -> str:
+    # Stable across processes, unlike hash()
+    return hashlib.blake2b(value.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def wl_hash(labels: Dict[str, str], edges: List[Tuple[str, str]], iterations: int = WL_ITERATIONS) -> str:
+    """
+    Weisfeiler-Lehman hash of a directed, labelled graph. Isomorphic graphs (same wiring up
+    to node ids) always get the same hash.
+    """
+    successors = {node: [] for node in labels}
+    predecessors = {node: [] for node in labels}
+    for source, target in edges:
+        successors[source].append(target)
+        predecessors[target].append(source)
+    current = dict(labels)
+    for _ in range(iterations):
+        current = {
+            node: _digest("|".join([
+                current[node],
+                ",".join(sorted(current[n] for n in successors[node])),
+                ",".join(sorted(current[n] for n in predecessors[node])),
+            ]))
+            for node in current
+        }
+    return _digest(",".join(sorted(current.values())))
+
+
+def summarize_flow(flow: List[Dict]) -> Dict:
+    """
+    Reduce a Node-RED flow to what is compared when scoring: devices, affordances
+    ("device.kind.name"), the labelled wiring graph and its trigger -> effect rules.
+    """
+    by_id = {node.get("id"): node for node in flow if isinstance(node, dict)}
+    devices_by_config = {
+        node_id: device_name(node) for node_id, node in by_id.items() if node.get("type") == "consumed-thing"
+    }
+
+    labels = {}
+    for node_id, node in by_id.items():
+        node_type = node.get("type", "")
+        # Config nodes (consumed-thing, global-config) have no wires
+        if node_type in IGNORED_TYPES or "wires" not in node:
+            continue
+        if node_type in AFFORDANCE_FIELDS:
+            kind, field = AFFORDANCE_FIELDS[node_type]
+            device = devices_by_config.get(node.get("thing"), "")
+            labels[node_id] = f"{device}.{kind}.{node.get(field, '')}"
+        elif node_type == "inject":
+            labels[node_id] = "timer"
+        else:
+            labels[node_id] = node_type
+
+    edges = []
+    for node_id in labels:
+        node = by_id[node_id]
+        targets = [t for port in node.get("wires", []) for t in port]
+        # Link nodes are virtual wires
+        if node.get("type") == "link out":
+            targets += node.get("links", [])
+        edges += [(node_id, target) for target in targets if target in labels]
+
+    return {
+        "devices": {labels[n].split(".")[0] for n in labels if labels[n].count(".") == 2} - {""},
+        "affordances": {label for label in labels.values() if label.count(".") == 2},
+        "labels": Counter(labels.values()),
+        "edges": Counter((labels[s], labels[t]) for s, t in edges),
+        "topology": wl_hash(labels, edges),
+        "rules": _rules(labels, edges, by_id),
+    }
+
+
+def _rules(labels: Dict[str, str], edges: List[Tuple[str, str]], by_id: Dict[str, Dict]) -> Dict[Tuple[str, str], bool]:
+    """{(trigger, effect): conditional} for every effect reachable from a trigger node."""
+    successors = {node: [] for node in labels}
+    has_input = set()
+    for source, target in edges:
+        successors[source].append(target)
+        has_input.add(target)
+
+    rules = {}
+    for trigger in (n for n in labels if n not in has_input):
+        seen = {(trigger, False)}
+        queue = deque(seen)
+        while queue:
+            node, conditional = queue.popleft()
+            if by_id[node].get("type") in EFFECT_TYPES and node != trigger:
+                key = (labels[trigger], labels[node])
+                # A rule is unconditional if any path reaches the effect without a condition
+                rules[key] = rules.get(key, True) and conditional
+            if by_id[node].get("type") in CONDITION_TYPES:
+                conditional = True
+            for target in successors[node]:
+                if (target, conditional) not in seen:
+                    seen.add((target, conditional))
+                    queue.append((target, conditional))
+    return rules
+
+
+def summarize_spec(spec: Dict) -> Dict:
+    """
+    Summary of a requirement spec, e.g.
+    {"devices": ["washingmachine", "leds"],
+     "affordances": ["washingmachine.event.finishedCycle", "leds.action.blink"],
+     "rules": [{"trigger": "washingmachine.event.finishedCycle", "effects": ["leds.action.blink"], "condition": false}]}
+    A spec with a "flow" is summarized from that reference flow instead.
+    """
+    if spec.get("flow"):
+        return summarize_flow(spec["flow"])
+
+    def affordance(label: str) -> str:
+        # Device names are compared case-insensitively, like tdLink paths
+        device, _, rest = label.partition(".")
+        return f"{device.lower()}.{rest}" if rest else label
+
+    rules = {}
+    for rule in spec.get("rules", []):
+        for effect in rule.get("effects", []):
+            rules[(affordance(rule["trigger"]), affordance(effect))] = bool(rule.get("condition"))
+    affordances = {affordance(a) for a in spec.get("affordances", [])} | \
+        {a for pair in rules for a in pair if a.count(".") == 2}
+    return {
+        "devices": {d.lower() for d in spec.get("devices", [])} | {a.split(".")[0] for a in affordances},
+        "affordances": affordances,
+        "labels": None,
+        "edges": None,
+        "topology": None,
+        "rules": rules,
+    }
+
+
+def score_rules(expected: Dict[Tuple[str, str], bool], actual: Dict[Tuple[str, str], bool]) -> float:
+    """Coverage of the expected rules: 1 per covered rule, 0.5 if its required condition is missing."""
+    if not expected:
+        return 1.0
+    total = 0.0
+    for rule, conditional in expected.items():
+        if rule in actual:
+            total += 0.5 if conditional and not actual[rule] else 1.0
+    return total / len(expected)
+
+
+def score_summaries(reference: Dict, generated: Dict) -> Dict:
+    scores = {
+        "devices": f1(reference["devices"], generated["devices"]),
+        "affordances": f1(reference["affordances"], generated["affordances"]),
+        "rules": score_rules(reference["rules"], generated["rules"]),
+    }
+    weights = dict(SCORE_WEIGHTS)
+    if reference["topology"] is None:
+        # Specs say nothing about wiring, so topology is not scored
+        weights.pop("topology")
+    else:
+        scores["isomorphic"] = reference["topology"] == generated["topology"]
+        scores["topology"] = 1.0 if scores["isomorphic"] else f1(reference["edges"], generated["edges"])
+    scores["overall"] = sum(scores[k] * w for k, w in weights.items()) / sum(weights.values())
+    scores["extra_rules"] = len(set(generated["rules"]) - set(reference["rules"]))
+    return scores
+
+
+def score_flow(flow: Optional[List[Dict]], reference) -> Dict:
+    """Score a generated flow against a reference flow (list of nodes) or a requirement spec (dict)."""
+    if flow is None:
+        return {"devices": 0.0, "affordances": 0.0, "rules": 0.0, "topology": 0.0, "overall": 0.0,
+                "extra_rules": 0, "parsed": False}
+    expected = summarize_spec(reference) if isinstance(reference, dict) else summarize_flow(reference)
+    return {**score_summaries(expected, summarize_flow(flow)), "parsed": True}
+
+
+def load_references(path: str) -> Dict[str, Dict]:
+    """
+    Load {normalized requirement: summary} from a file or directory of references.
+    References are spec files (JSON list of {"requirement", ...spec or "flow"}) or
+    recorded transcripts/flows in the generator output format.
+    """
+    paths = [path] if os.path.isfile(path) else sorted(glob.glob(os.path.join(path, "**", "*.*"), recursive=True))
+    references = {}
+    for ref_path in paths:
+        if ref_path.endswith(".json"):
+            with open(ref_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if isinstance(data, list) and data and isinstance(data[0], dict) and "requirement" in data[0]:
+                for spec in data:
+                    references[normalize_requirement(spec["requirement"])] = summarize_spec(spec)
+                continue
+        if ref_path.endswith((".json", ".txt")):
+            for requirement, flow in load_flow_file(ref_path):
+                if requirement and flow:
+                    references[normalize_requirement(requirement)] = summarize_flow(flow)
+    return references
+
+
+_references: Dict[str, Dict] = {}
+
+
+def _init_worker(references: Dict[str, Dict]):
+    global _references
+    _references = references
+
+
+def score_file(path: str) -> List[Dict]:
+    """Score every (requirement, flow) pair of one output file against the loaded references."""
+    rows = []
+    for requirement, flow in load_flow_file(path):
+        reference = _references.get(normalize_requirement(requirement))
+        if reference is None:
+            continue
+        if flow is None:
+            scores = score_flow(None, {})
+        else:
+            scores = {**score_summaries(reference, summarize_flow(flow)), "parsed": True}
+        rows.append({"file": path, "requirement": requirement, **scores})
+    return rows
+
+
+def score_outputs(paths: List[str], references: Dict[str, Dict], workers: Optional[int] = None) -> List[Dict]:
+    """Score output files across a process pool (workers=1 scores in-process)."""
+    if workers == 1:
+        _init_worker(references)
+        return [row for path in paths for row in score_file(path)]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(references,)) as pool:
+        chunksize = max(1, len(paths) // ((workers or os.cpu_count() or 1) * 4))
+        return [row for rows in pool.map(score_file, paths, chunksize=chunksize) for row in rows]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score generated Node-RED flows against reference flows or specs")
+    parser.add_argument("outputs", nargs="+", help="Output files or directories (.txt transcripts / .json flows)")
+    parser.add_argument("--reference", required=True, help="Reference spec/flow file or directory")
+    parser.add_argument("--workers", type=int, default=None, help="Scoring processes (default: CPU count)")
+    parser.add_argument("--csv", help="Write per-flow scores to this CSV file")
+    args = parser.parse_args()
+
+    paths = []
+    for output in args.outputs:
+        if os.path.isdir(output):
+            paths += sorted(glob.glob(os.path.join(output, "**", "*.txt"), recursive=True) +
+                            glob.glob(os.path.join(output, "**", "*.json"), recursive=True))
+        else:
+            paths.append(output)
+
+    references = load_references(args.reference)
+    print(f"✓ Loaded {len(references)} references from {args.reference}")
+
+    started = time.perf_counter()
+    rows = score_outputs(paths, references, args.workers)
+    elapsed = time.perf_counter() - started
+    print(f"✓ Scored {len(rows)} flows from {len(paths)} files in {elapsed:.2f}s "
+          f"({len(rows) / elapsed * 60 if elapsed else 0:.0f} flows/min)")
+
+    per_file: Dict[str, List[Dict]] = {}
+    for row in rows:
+        per_file.setdefault(row["file"], []).append(row)
+    for path, file_rows in per_file.items():
+        mean = lambda key: sum(r[key] for r in file_rows) / len(file_rows)
+        print(f"  {path}: overall={mean('overall'):.2f} devices={mean('devices'):.2f} "
+              f"affordances={mean('affordances'):.2f} rules={mean('rules'):.2f} ({len(file_rows)} flows)")
+
+    if args.csv:
+        fields = ["file", "requirement", "parsed", "overall", "devices", "affordances", "topology",
+                  "isomorphic", "rules", "extra_rules"]
+        with open(args.csv, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=fields, extrasaction="ignore")
+            writer.writeheader()
+            writer.writerows(rows)
+        print(f"✓ Wrote {args.csv}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,586 @@
+import argparse
+import copy
+import heapq
+import itertools
+import json
+import os
+import select
+import shutil
+import subprocess
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+import requests
+from flow_plan import td_link
+from flow_scoring import normalize_requirement
+from flow_utils import load_flow_file
+from td_discovery import TddClient, load_tds_from_config
+
+
+FUNCTION_SANDBOX = os.path.join(os.path.dirname(os.path.abspath(__file__)), "function_sandbox.js")
+# Virtual seconds simulated when a scenario does not set "duration"
+DEFAULT_DURATION = 3600.0
+# Safety stop for flows that loop messages without advancing time
+MAX_STEPS = 100000
+# Wall-clock seconds to wait for a function sandbox reply before restarting the sandbox
+FUNCTION_CALL_TIMEOUT = 5.0
+
+
+class SimulationError(Exception):
+    """Raised for flows or scenarios the simulator cannot run."""
+
+
+def thing_name(link: str) -> str:
+    """Device name of a tdLink: its last path segment (e.g. http://host:8090/speaker -> speaker)."""
+    return link.rstrip("/").rsplit("/", 1)[-1].lower()
+
+
+def _default_value(schema: Optional[Dict]) -> Any:
+    schema = schema or {}
+    for key in ("const", "default"):
+        if key in schema:
+            return schema[key]
+    if schema.get("enum"):
+        return schema["enum"][0]
+    return {"number": 0, "integer": 0, "boolean": False, "string": "", "object": {}, "array": []}.get(schema.get("type"))
+
+
+class StandInThings:
+    """
+    In-memory devices built from TDs: properties hold values (TD defaults unless the scenario
+    sets them), writes update them, actions are recorded and answer their output default.
+    Without TDs every affordance name is accepted.
+    """
+    def __init__(self, tds: Optional[List[Dict]] = None, properties: Optional[Dict[str, Dict]] = None):
+        self.tds = {td.get("title", "").lower(): td for td in tds or []}
+        self.values: Dict[str, Dict[str, Any]] = {}
+        for name, td in self.tds.items():
+            self.values[name] = {p: _default_value(s) for p, s in td.get("properties", {}).items()}
+        for device, values in (properties or {}).items():
+            self.values.setdefault(device.lower(), {}).update(values)
+
+    def _check(self, device: str, section: str, name: str):
+        td = self.tds.get(device)
+        if self.tds and td is None:
+            raise SimulationError(f"unknown device '{device}'")
+        if td is not None and name not in td.get(section, {}):
+            raise SimulationError(f"{device} has no {section[:-1] if section != 'properties' else 'property'} '{name}'")
+
+    def read(self, device: str, name: str) -> Any:
+        self._check(device, "properties", name)
+        return copy.deepcopy(self.values.get(device, {}).get(name))
+
+    def write(self, device: str, name: str, value: Any):
+        self._check(device, "properties", name)
+        self.values.setdefault(device, {})[name] = copy.deepcopy(value)
+
+    def invoke(self, device: str, name: str, value: Any) -> Any:
+        self._check(device, "actions", name)
+        td = self.tds.get(device)
+        return _default_value(td["actions"][name].get("output")) if td else None
+
+    def has_event(self, device: str, name: str) -> bool:
+        td = self.tds.get(device)
+        return td is None or name in td.get("events", {})
+
+
+class LiveThings(StandInThings):
+    """Reads, writes and invocations go to the running simulators (TD form hrefs over HTTP)."""
+    def __init__(self, tds: List[Dict], timeout: float = 10.0):
+        super().__init__(tds)
+        self.session = requests.Session()
+        self.timeout = timeout
+
+    def _href(self, device: str, section: str, name: str) -> str:
+        self._check(device, section, name)
+        affordance = self.tds[device][section][name]
+        forms = affordance.get("forms") or [{}]
+        href = forms[0].get("href") or f"{td_link(self.tds[device])}/{section}/{name}"
+        return href if href.startswith("http") else f"{self.tds[device].get('base', '').rstrip('/')}/{href}"
+
+    def read(self, device: str, name: str) -> Any:
+        response = self.session.get(self._href(device, "properties", name), timeout=self.timeout)
+        response.raise_for_status()
+        return response.json() if response.content else None
+
+    def write(self, device: str, name: str, value: Any):
+        self.session.put(self._href(device, "properties", name), json=value, timeout=self.timeout).raise_for_status()
+
+    def invoke(self, device: str, name: str, value: Any) -> Any:
+        response = self.session.post(self._href(device, "actions", name), json=value, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json() if response.content else None
+
+
+def _permission_flags() -> List[str]:
+    """Node's permission model: the sandbox may only read its own script (no writes, child processes, workers)."""
+    version = subprocess.run(["node", "--version"], capture_output=True, text=True).stdout.strip()
+    major = int(version.lstrip("v").split(".")[0] or 0) if version else 0
+    if major < 20:
+        return []
+    flags = ["--permission"] if major >= 22 else ["--experimental-permission", "--no-warnings"]
+    return [*flags, f"--allow-fs-read={FUNCTION_SANDBOX}"]
+
+
+class FunctionRunner:
+    """Runs function node bodies in a Node.js vm sandbox (function_sandbox.js)."""
+    def __init__(self, timeout: float = FUNCTION_CALL_TIMEOUT):
+        self.timeout = timeout
+        self.process = self._start()
+
+    def _start(self) -> subprocess.Popen:
+        return subprocess.Popen(
+            ["node", *_permission_flags(), FUNCTION_SANDBOX], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            text=True, bufsize=1, env={"PATH": os.environ.get("PATH", "")},
+        )
+
+    def restart(self):
+        """Replace a hung or crashed sandbox. Context and timers of all function nodes are lost."""
+        self.process.kill()
+        self.process.wait()
+        self.process = self._start()
+
+    def call(self, request: Dict) -> Dict:
+        try:
+            self.process.stdin.write(json.dumps(request) + "\n")
+            self.process.stdin.flush()
+        except (BrokenPipeError, OSError):
+            self.restart()
+            raise SimulationError("function sandbox exited (restarted)")
+        ready, _, _ = select.select([self.process.stdout], [], [], self.timeout)
+        if not ready:
+            self.restart()
+            raise SimulationError(f"function sandbox did not answer within {self.timeout:g}s (restarted)")
+        line = self.process.stdout.readline()
+        if not line:
+            self.restart()
+            raise SimulationError("function sandbox exited (restarted)")
+        return json.loads(line)
+
+    def close(self):
+        self.process.stdin.close()
+        try:
+            self.process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+
+class StubFunctionRunner:
+    """Fallback without Node.js: function nodes pass the message through unchanged."""
+    def call(self, request: Dict) -> Dict:
+        if request["op"] != "run":
+            return {}
+        return {"sends": [[request["msg"]]], "logs": ["function not executed (no node.js)"], "timers": [], "cleared": []}
+
+    def close(self):
+        pass
+
+
+def create_function_runner():
+    return FunctionRunner() if shutil.which("node") else StubFunctionRunner()
+
+
+def _inject_payload(node: Dict, now: float) -> Any:
+    payload, kind = node.get("payload", ""), node.get("payloadType", "str")
+    if kind == "date":
+        return int(now * 1000)
+    if kind == "num":
+        return float(payload) if "." in str(payload) else int(payload or 0)
+    if kind == "bool":
+        return str(payload).lower() == "true"
+    if kind == "json":
+        try:
+            return json.loads(payload) if isinstance(payload, str) else payload
+        except json.JSONDecodeError:
+            return payload
+    return payload
+
+
+_SWITCH_OPS = {
+    "eq": lambda a, b: a == b, "neq": lambda a, b: a != b,
+    "lt": lambda a, b: a < b, "lte": lambda a, b: a <= b,
+    "gt": lambda a, b: a > b, "gte": lambda a, b: a >= b,
+    "true": lambda a, b: a is True, "false": lambda a, b: a is False,
+    "null": lambda a, b: a is None, "nnull": lambda a, b: a is not None,
+    "cont": lambda a, b: str(b) in str(a),
+}
+
+
+def _get_path(msg: Dict, path: str) -> Any:
+    value = msg
+    for part in (path or "payload").split("."):
+        value = value.get(part) if isinstance(value, dict) else None
+    return value
+
+
+def _set_path(msg: Dict, path: str, value: Any):
+    parts = (path or "payload").split(".")
+    target = msg
+    for part in parts[:-1]:
+        target = target.setdefault(part, {})
+    target[parts[-1]] = value
+
+
+def _typed(value: Any, kind: str) -> Any:
+    if kind == "num":
+        return float(value)
+    if kind == "bool":
+        return str(value).lower() == "true"
+    if kind == "json":
+        return json.loads(value) if isinstance(value, str) else value
+    return value
+
+
+class FlowSimulator:
+    """
+    Discrete-event interpreter for Node-RED WoT flows in virtual time.
+
+    Messages move along wires as zero-delay events; inject repeats, delay nodes, function
+    node timers and scenario events are scheduled on the virtual clock, so an hour of flow
+    behaviour runs in milliseconds. Every device interaction and debug output is traced.
+    """
+    def __init__(self, flow: List[Dict], things: StandInThings, functions=None):
+        self.nodes = {node["id"]: node for node in flow if isinstance(node, dict) and node.get("id")}
+        self.things = things
+        self.functions = functions or StubFunctionRunner()
+        self.now = 0.0
+        self._queue: List[tuple] = []
+        self._counter = itertools.count()
+        self._timers: Dict[int, str] = {}
+        self.trace: List[Dict] = []
+        self.errors: List[str] = []
+        self.steps = 0
+
+    def device_of(self, node: Dict) -> Optional[str]:
+        thing = self.nodes.get(node.get("thing"))
+        if thing is None or not thing.get("tdLink"):
+            self.errors.append(f"{node.get('type')} {node['id']} has no consumed-thing")
+            return None
+        return thing_name(thing["tdLink"])
+
+    def schedule(self, delay: float, action: Callable[[], None]):
+        heapq.heappush(self._queue, (self.now + max(0.0, delay), next(self._counter), action))
+
+    def record(self, kind: str, **fields):
+        self.trace.append({"t": round(self.now, 3), "kind": kind, **fields})
+
+    def send(self, node: Dict, ports: List):
+        """Deliver node outputs: ports[i] is a msg, a list of msgs or None."""
+        for port, messages in zip(node.get("wires", []), ports):
+            if messages is None:
+                continue
+            for msg in messages if isinstance(messages, list) else [messages]:
+                for target in port:
+                    cloned = copy.deepcopy(msg)
+                    self.schedule(0, lambda target=target, cloned=cloned: self.receive(target, cloned))
+
+    def receive(self, node_id: str, msg: Dict):
+        node = self.nodes.get(node_id)
+        if node is None:
+            self.errors.append(f"wire to missing node {node_id}")
+            return
+        try:
+            self._handle(node, msg)
+        except SimulationError as e:
+            self.errors.append(f"{node.get('type')} {node_id}: {e}")
+        except requests.RequestException as e:
+            self.errors.append(f"{node.get('type')} {node_id}: {e}")
+        except Exception as e:
+            # Bad node config (e.g. a non-numeric switch value): one node fails, not the run
+            self.errors.append(f"{node.get('type')} {node_id}: {type(e).__name__}: {e}")
+
+    def _handle(self, node: Dict, msg: Dict):
+        kind = node.get("type")
+        if kind in ("read-property", "write-property", "invoke-action"):
+            device = self.device_of(node)
+            if device is None:
+                return
+            if kind == "read-property":
+                msg["payload"] = self.things.read(device, node.get("property"))
+                self.record("read", device=device, name=node.get("property"), value=msg["payload"])
+            elif kind == "write-property":
+                self.things.write(device, node.get("property"), msg.get("payload"))
+                self.record("write", device=device, name=node.get("property"), value=msg.get("payload"))
+            else:
+                value = msg.get("payload")
+                msg["payload"] = self.things.invoke(device, node.get("action"), value)
+                self.record("invoke", device=device, name=node.get("action"), value=value)
+            self.send(node, [msg])
+        elif kind == "function":
+            self._call_function(node, {"op": "run", "node": node["id"], "func": node.get("func", "return msg;"),
+                                       "msg": msg, "now": int(self.now * 1000)})
+        elif kind == "change":
+            for rule in node.get("rules", []):
+                if rule.get("t") == "set":
+                    _set_path(msg, rule.get("p"), _typed(rule.get("to"), rule.get("tot", "str")))
+                elif rule.get("t") == "delete":
+                    msg.pop(rule.get("p"), None)
+                elif rule.get("t") == "move":
+                    _set_path(msg, rule.get("to"), msg.pop(rule.get("p"), None))
+            self.send(node, [msg])
+        elif kind == "switch":
+            value = _get_path(msg, node.get("property", "payload"))
+            ports, matched = [], False
+            for rule in node.get("rules", []):
+                op = rule.get("t")
+                hit = (not matched) if op == "else" else _SWITCH_OPS.get(op, lambda a, b: False)(
+                    value, _typed(rule.get("v"), rule.get("vt", "str")) if "v" in rule else None)
+                ports.append(msg if hit else None)
+                matched = matched or hit
+                if hit and node.get("checkall") == "false":
+                    break
+            self.send(node, ports)
+        elif kind == "delay":
+            units = {"milliseconds": 0.001, "seconds": 1, "minutes": 60, "hours": 3600}
+            delay = float(node.get("timeout", 1)) * units.get(node.get("timeoutUnits", "seconds"), 1)
+            self.schedule(delay, lambda: self.send(node, [msg]))
+        elif kind == "debug":
+            # complete: "true" is the whole msg, "false" (Node-RED's default) msg.payload, else a property path
+            complete = node.get("complete", "false")
+            if complete in ("true", True):
+                value = msg
+            elif complete in ("false", False, "", None):
+                value = msg.get("payload")
+            else:
+                value = _get_path(msg, complete)
+            self.record("debug", node=node.get("name") or node["id"], value=value)
+        elif kind == "link out":
+            for target in node.get("links", []):
+                self.schedule(0, lambda target=target, msg=copy.deepcopy(msg): self.receive(target, msg))
+        elif kind in ("link in", "inject", "subscribe-event"):
+            self.send(node, [msg])
+        elif kind not in ("comment",):
+            self.errors.append(f"unsupported node type '{kind}' ({node['id']})")
+
+    def _call_function(self, node: Dict, request: Dict):
+        try:
+            result = self.functions.call(request)
+        except SimulationError as e:
+            # The sandbox was restarted, so the pending timers of every function node are gone
+            self._timers.clear()
+            result = {"error": str(e)}
+        self._apply_function(node, result)
+
+    def _apply_function(self, node: Dict, result: Dict):
+        if result.get("error"):
+            self.errors.append(f"function {node['id']}: {result['error']}")
+        for log in result.get("logs", []):
+            self.record("log", node=node.get("name") or node["id"], value=log)
+        for timer_id in result.get("cleared", []):
+            self._timers.pop(timer_id, None)
+        for timer in result.get("timers", []):
+            self._timers[timer["id"]] = node["id"]
+            self.schedule(timer["delay"] / 1000.0, lambda timer_id=timer["id"]: self._fire_timer(timer_id))
+        for ports in result.get("sends", []):
+            self.send(node, ports)
+
+    def _fire_timer(self, timer_id: int):
+        node_id = self._timers.pop(timer_id, None)
+        if node_id is not None:
+            self._call_function(self.nodes[node_id], {"op": "timer", "id": timer_id, "now": int(self.now * 1000)})
+
+    def _start_injects(self, duration: float):
+        for node in self.nodes.values():
+            if node.get("type") != "inject":
+                continue
+            repeat = float(node.get("repeat") or 0)
+            if node.get("crontab"):
+                self.errors.append(f"inject {node['id']}: crontab is not simulated")
+            if node.get("once"):
+                self.schedule(float(node.get("onceDelay") or 0), lambda node=node: self.inject(node))
+            if repeat > 0:
+                for tick in range(1, int(duration // repeat) + 1):
+                    self.schedule(tick * repeat, lambda node=node: self.inject(node))
+
+    def inject(self, node: Dict):
+        msg = {"payload": _inject_payload(node, self.now), "topic": node.get("topic", "")}
+        self.record("inject", node=node.get("name") or node["id"], value=msg["payload"])
+        self.send(node, [msg])
+
+    def emit_event(self, device: str, event: str, data: Any = None):
+        """Deliver a device event to every subscribe-event node listening to it."""
+        device = device.lower()
+        if not self.things.has_event(device, event):
+            self.errors.append(f"scenario event {device}.{event} is not in the TD")
+        self.record("event", device=device, name=event, value=data)
+        for node in self.nodes.values():
+            if node.get("type") == "subscribe-event" and node.get("event") == event:
+                if self.device_of(node) == device:
+                    self.send(node, [{"payload": copy.deepcopy(data), "topic": event}])
+
+    def run(self, scenario: Optional[Dict] = None) -> Dict:
+        """Run a scenario (events and inject presses at virtual times) and return the trace."""
+        scenario = scenario or {}
+        duration = float(scenario.get("duration", DEFAULT_DURATION))
+        self._start_injects(duration)
+        for step in scenario.get("events", []):
+            if "inject" in step:
+                targets = [n for n in self.nodes.values() if n.get("type") == "inject"
+                           and step["inject"] in (n["id"], n.get("name"))]
+                for node in targets:
+                    self.schedule(float(step.get("at", 0)), lambda node=node: self.inject(node))
+            else:
+                self.schedule(float(step.get("at", 0)), lambda step=step: self.emit_event(
+                    step["device"], step["event"], step.get("data")))
+        while self._queue and self.steps < MAX_STEPS:
+            at, _, action = heapq.heappop(self._queue)
+            if at > duration:
+                break
+            self.now = at
+            self.steps += 1
+            action()
+        if self.steps >= MAX_STEPS:
+            self.errors.append(f"stopped after {MAX_STEPS} steps (message loop?)")
+        return {"trace": self.trace, "errors": self.errors, "virtual_seconds": self.now, "steps": self.steps}
+
+
+def _matches(expected: Any, actual: Any) -> bool:
+    """Expected values match exactly, or as a subset for objects."""
+    if isinstance(expected, dict) and isinstance(actual, dict):
+        return all(k in actual and _matches(v, actual[k]) for k, v in expected.items())
+    return expected == actual
+
+
+def check_expectations(trace: List[Dict], expectations: List[Dict]) -> List[Dict]:
+    """
+    Expectations: {"device", "action"} (optionally "input"), {"device", "property", "value"}
+    for writes, {"debug": name} for debug output; "within" limits the virtual time.
+    """
+    results = []
+    for expected in expectations:
+        if "action" in expected:
+            kind, name, value = "invoke", expected["action"], expected.get("input")
+        elif "property" in expected:
+            kind, name, value = "write", expected["property"], expected.get("value")
+        else:
+            kind, name, value = "debug", expected.get("debug"), expected.get("value")
+        hit = None
+        for entry in trace:
+            if entry["kind"] != kind or ("within" in expected and entry["t"] > expected["within"]):
+                continue
+            if kind == "debug":
+                if name not in (None, entry["node"]):
+                    continue
+            elif entry["device"] != expected["device"].lower() or entry["name"] != name:
+                continue
+            if value is None or _matches(value, entry["value"]):
+                hit = entry
+                break
+        results.append({"expect": expected, "passed": hit is not None, "at": hit["t"] if hit else None})
+    return results
+
+
+def simulate(flow: List[Dict], scenario: Optional[Dict] = None, tds: Optional[List[Dict]] = None,
+             live: bool = False, functions=None) -> Dict:
+    """Run one flow against stand-in (or live) devices and check the scenario's expectations."""
+    scenario = scenario or {}
+    things = LiveThings(tds or []) if live else StandInThings(tds, scenario.get("properties"))
+    own_runner = functions is None
+    functions = functions or create_function_runner()
+    try:
+        functions.call({"op": "reset"})
+        result = FlowSimulator(flow, things, functions).run(scenario)
+    finally:
+        if own_runner:
+            functions.close()
+    result["expectations"] = check_expectations(result["trace"], scenario.get("expect", []))
+    result["passed"] = not result["errors"] and all(e["passed"] for e in result["expectations"])
+    return result
+
+
+def scenario_for(scenarios: Dict, requirement: Optional[str]) -> Dict:
+    """A scenario file holds one scenario, or {"scenarios": [...]} matched by "requirement"."""
+    if "scenarios" not in scenarios:
+        return scenarios
+    wanted = normalize_requirement(requirement)
+    for scenario in scenarios["scenarios"]:
+        if normalize_requirement(scenario.get("requirement")) == wanted:
+            return scenario
+    return {}
+
+
+_worker_runner = None
+
+
+def _simulate_file(path: str, scenarios: Dict, tds: Optional[List[Dict]], live: bool) -> List[Dict]:
+    global _worker_runner
+    if _worker_runner is None:
+        _worker_runner = create_function_runner()
+    rows = []
+    for requirement, flow in load_flow_file(path):
+        row = {"file": path, "requirement": requirement}
+        if flow is None:
+            rows.append({**row, "passed": False, "errors": ["no flow JSON"], "expectations": [], "trace": []})
+            continue
+        result = simulate(flow, scenario_for(scenarios, requirement), tds, live, _worker_runner)
+        rows.append({**row, **{k: result[k] for k in ("passed", "errors", "expectations", "trace", "steps", "virtual_seconds")}})
+    return rows
+
+
+def simulate_outputs(paths: List[str], scenarios: Dict, tds: Optional[List[Dict]] = None,
+                     live: bool = False, workers: int = os.cpu_count() or 1) -> List[Dict]:
+    """Simulate every flow of the given .json/.txt outputs in parallel (one sandbox per worker)."""
+    rows = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for file_rows in pool.map(_simulate_file, paths, [scenarios] * len(paths),
+                                  [tds] * len(paths), [live] * len(paths)):
+            rows.extend(file_rows)
+    return rows
+
+
+def load_tds(source: Optional[str]) -> Optional[List[Dict]]:
+    """TDs from a TDD url, a things-config.json or a JSON file with an array of TDs."""
+    if not source:
+        return None
+    if source.startswith("http"):
+        client = TddClient(source)
+        try:
+            return client.bootstrap()
+        finally:
+            client.close()
+    with open(source, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data, dict) and "things" in data and all("url" in t for t in data["things"]):
+        return load_tds_from_config(source)
+    return data.get("things", data) if isinstance(data, dict) else data
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dry-run generated Node-RED WoT flows in virtual time")
+    parser.add_argument("paths", nargs="+", help="Flow .json files or generator .txt transcripts")
+    parser.add_argument("--scenario", help="Scenario JSON (events, properties, expect)")
+    parser.add_argument("--tds", help="TDD url, things-config.json or TD array; without it any affordance is accepted")
+    parser.add_argument("--live", action="store_true", help="Read/write/invoke the running simulators instead of stand-ins")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--verbose", action="store_true", help="Print the trace of every flow")
+    args = parser.parse_args()
+
+    scenarios = {}
+    if args.scenario:
+        with open(args.scenario, "r", encoding="utf-8") as f:
+            scenarios = json.load(f)
+    tds = load_tds(args.tds)
+
+    started = time.perf_counter()
+    rows = simulate_outputs(args.paths, scenarios, tds, args.live, args.workers)
+    elapsed = time.perf_counter() - started
+
+    for row in rows:
+        symbol = "✓" if row["passed"] else "❌"
+        label = (row["requirement"] or os.path.basename(row["file"]))[:70]
+        print(f"{symbol} {label}")
+        for expectation in row["expectations"]:
+            if not expectation["passed"]:
+                print(f"    expected {json.dumps(expectation['expect'])}")
+        for error in row["errors"][:5]:
+            print(f"    {error}")
+        if args.verbose:
+            for entry in row["trace"]:
+                print(f"    {json.dumps(entry, ensure_ascii=False)}")
+    passed = sum(row["passed"] for row in rows)
+    print(f"\n📊 {passed}/{len(rows)} flows passed, {len(rows) / elapsed * 60:.0f} flows/min")
+
+
+if __name__ == "__main__":
+    main()
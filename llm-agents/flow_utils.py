@@ -0,0 +1,105 @@
+import json
+import re
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+
+FENCE_PATTERN = re.compile(r"```(?:json)?\s*(.*?)```", re.DOTALL)
+
+
+def extract_flow_json(text: str) -> Optional[list]:
+    """
+    Extract a Node-RED flow (JSON array of nodes) from a model response.
+    Handles bare JSON, ```json fenced blocks and JSON embedded in surrounding prose.
+    """
+    if not text:
+        return None
+    candidates = [text.strip()] + [m.group(1).strip() for m in FENCE_PATTERN.finditer(text)]
+    for candidate in candidates:
+        try:
+            flow = _as_node_list(json.loads(candidate))
+            if flow is not None:
+                return flow
+        except json.JSONDecodeError:
+            pass
+
+    # Fall back to the first decodable array/object in the text
+    decoder = json.JSONDecoder()
+    for match in re.finditer(r"[\[{]", text):
+        try:
+            value, _ = decoder.raw_decode(text, match.start())
+        except json.JSONDecodeError:
+            continue
+        flow = _as_node_list(value)
+        if flow:
+            return flow
+    return None
+
+
+def _as_node_list(value) -> Optional[list]:
+    if isinstance(value, list):
+        return value if all(isinstance(n, dict) for n in value) else None
+    if isinstance(value, dict):
+        for key in ("flows", "nodes"):
+            if isinstance(value.get(key), list):
+                return value[key]
+    return None
+
+
+def new_node_id() -> str:
+    """A fresh 16 character hex node id, as Node-RED generates them."""
+    return uuid.uuid4().hex[:16]
+
+
+def validate_flow(flow: List[Dict]) -> List[str]:
+    """Structural checks of a merged flow. Returns a list of problems (empty if valid)."""
+    problems = []
+    tabs = [node for node in flow if node.get("type") == "tab"]
+    if len(tabs) != 1:
+        problems.append(f"expected exactly one tab, found {len(tabs)}")
+    ids = [node.get("id") for node in flow]
+    duplicates = {node_id for node_id in ids if ids.count(node_id) > 1}
+    if duplicates:
+        problems.append(f"duplicate ids: {', '.join(sorted(map(str, duplicates)))}")
+    nodes = {node.get("id"): node for node in flow}
+    tab_id = tabs[0]["id"] if tabs else None
+    for node in flow:
+        if "wires" not in node:
+            continue
+        if node.get("z") != tab_id:
+            problems.append(f"{node['id']} is not on the tab")
+        for target in (t for port in node["wires"] for t in port):
+            if target not in nodes:
+                problems.append(f"{node['id']} is wired to missing node {target}")
+        if "thing" in node and nodes.get(node["thing"], {}).get("type") != "consumed-thing":
+            problems.append(f"{node['id']} references missing consumed-thing {node['thing']}")
+        if node.get("type") == "link out" and node.get("mode") != "return" and not node.get("links"):
+            problems.append(f"signal '{node.get('name')}' has no listener")
+        if node.get("type") == "link in" and not node.get("links"):
+            problems.append(f"signal '{node.get('name')}' has no emitter")
+    return problems
+
+
+def parse_transcript(text: str) -> List[Tuple[str, Optional[list]]]:
+    """
+    Split a generator console transcript ("You: ..." followed by the agent output)
+    into (requirement, flow) pairs. flow is None when no JSON could be extracted.
+    """
+    pairs = []
+    segments = re.split(r"^You:[ \t]*", text, flags=re.MULTILINE)
+    for segment in segments[1:]:
+        requirement, _, response = segment.partition("\n")
+        requirement = requirement.strip()
+        if not requirement or requirement.lower() in ("bye", "exit"):
+            continue
+        pairs.append((requirement, extract_flow_json(response)))
+    return pairs
+
+
+def load_flow_file(path: str) -> List[Tuple[Optional[str], Optional[list]]]:
+    """Load (requirement, flow) pairs from a recorded .json flow or a .txt transcript."""
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    if path.endswith(".json"):
+        return [(None, extract_flow_json(text))]
+    return parse_transcript(text)
@@ -0,0 +1,196 @@
+// Runs Node-RED function node bodies for flow_sim.py, one JSON request per stdin line.
+// Each node gets its own vm context with Node-RED's function node API (msg, node, context,
+// flow, global, RED.util). Timers and Date follow the simulator's virtual clock: setTimeout
+// only reports the timer, and flow_sim fires it later with a "timer" request.
+//
+// The API is defined inside each context, from a null-prototype global, and only strings
+// cross between this process and a context, so generated code cannot reach host objects
+// (and through them `process`). Contexts cannot compile code from strings, and every run,
+// timer and promise callbacks included, is bounded by RUN_TIMEOUT_MS. flow_sim also starts this
+// process under Node's permission model, without filesystem writes or child processes.
+const vm = require('vm');
+const readline = require('readline');
+
+const RUN_TIMEOUT_MS = 1000;
+// Node clamps interval delays to at least 1 ms
+const MIN_INTERVAL_MS = 1;
+
+// Evaluated in every node's context
+const API = `(function () {
+    const g = globalThis;
+    let out = null;
+    let flowStore = {};
+    let globalStore = {};
+    const nodeStore = {};
+    const timers = new Map();
+    let nextTimer = 1;
+
+    const store = (values) => ({
+        get: (key) => values()[key],
+        set: (key, value) => { values()[key] = value; },
+        keys: () => Object.keys(values()),
+    });
+    const sendsFrom = (result) => {
+        // A function node result: msg, [port0, port1, ...] (each a msg, array of msgs or null), or null
+        if (result === null || result === undefined) return null;
+        return Array.isArray(result) ? result : [result];
+    };
+    const schedule = (callback, delay, interval) => {
+        const id = nextTimer++;
+        delay = Number(delay) || 0;
+        if (interval) delay = Math.max(delay, ${MIN_INTERVAL_MS});
+        timers.set(id, { callback, delay, interval });
+        out.timers.push({ id, delay });
+        return id;
+    };
+    const clear = (id) => { if (timers.delete(id)) out.cleared.push(id); };
+
+    class VirtualDate extends Date {
+        constructor(...args) { if (args.length) { super(...args); } else { super(g.__now); } }
+        static now() { return g.__now; }
+    }
+    g.Date = VirtualDate;
+    g.console = { log: (...args) => out.logs.push(args.join(' ')) };
+    g.node = {
+        id: g.__nodeId,
+        send: (msg) => { const sends = sendsFrom(msg); if (sends) out.sends.push(sends); },
+        done: () => {},
+        log: (text) => out.logs.push(String(text)),
+        warn: (text) => out.logs.push('warn: ' + text),
+        error: (text) => out.logs.push('error: ' + text),
+        status: () => {},
+        on: () => {},
+    };
+    g.context = store(() => nodeStore);
+    g.flow = store(() => flowStore);
+    g.global = store(() => globalStore);
+    g.env = { get: () => undefined };
+    g.RED = { util: { cloneMessage: (value) => value === undefined ? undefined : JSON.parse(JSON.stringify(value)) } };
+    g.setTimeout = (callback, delay) => schedule(callback, delay, false);
+    g.setInterval = (callback, delay) => schedule(callback, delay, true);
+    g.clearTimeout = clear;
+    g.clearInterval = clear;
+
+    // Requests and results are JSON strings: { now, flow, global, msg | timer }
+    const begin = () => {
+        const request = JSON.parse(g.__request);
+        g.__now = request.now;
+        flowStore = request.flow;
+        globalStore = request.global;
+        out = { sends: [], logs: [], timers: [], cleared: [] };
+        return request;
+    };
+    const end = () => JSON.stringify(Object.assign(out, { flow: flowStore, global: globalStore }));
+    const handler = g.__handler;
+    g.__run = () => {
+        const request = begin();
+        const sends = sendsFrom(handler(request.msg));
+        if (sends) out.sends.push(sends);
+        return end();
+    };
+    g.__fire = () => {
+        const request = begin();
+        const timer = timers.get(request.timer);
+        if (timer) {
+            if (!timer.interval) timers.delete(request.timer);
+            timer.callback();
+            // An interval runs again until it is cleared
+            if (timer.interval && timers.has(request.timer)) out.timers.push({ id: request.timer, delay: timer.delay });
+        }
+        return end();
+    };
+})();`;
+
+let flowJson = '{}';
+let globalJson = '{}';
+let nodes = new Map();
+// Timer ids of flow_sim -> { node, local }, and back: a timer keeps its id while it repeats
+let timers = new Map();
+let timerIds = new Map();
+let nextTimer = 1;
+
+function empty() {
+    return { sends: [], logs: [], timers: [], cleared: [] };
+}
+
+function nodeState(id, func) {
+    let state = nodes.get(id);
+    if (state && state.func === func) return state;
+    // afterEvaluate runs the context's promise callbacks before runInContext returns, so
+    // they are bounded by RUN_TIMEOUT_MS too
+    const context = vm.createContext(Object.create(null), {
+        name: `function-${id}`,
+        codeGeneration: { strings: false, wasm: false },
+        microtaskMode: 'afterEvaluate',
+    });
+    context.__nodeId = String(id);
+    new vm.Script(`globalThis.__handler = (function (msg) {\n${func}\n});`, { filename: `function-${id}.js` })
+        .runInContext(context, { timeout: RUN_TIMEOUT_MS });
+    vm.runInContext(API, context, { timeout: RUN_TIMEOUT_MS });
+    state = { func, context };
+    nodes.set(id, state);
+    return state;
+}
+
+function invoke(state, nodeId, entry, request) {
+    state.context.__request = JSON.stringify({ ...request, flow: JSON.parse(flowJson), global: JSON.parse(globalJson) });
+    const result = vm.runInContext(`${entry}()`, state.context, { timeout: RUN_TIMEOUT_MS });
+    if (typeof result !== 'string') throw new Error('function node replaced the sandbox API');
+    const out = JSON.parse(result);
+    flowJson = JSON.stringify(out.flow === undefined ? {} : out.flow);
+    globalJson = JSON.stringify(out.global === undefined ? {} : out.global);
+    const cleared = [];
+    for (const local of out.cleared) {
+        const key = `${nodeId}:${local}`;
+        if (!timerIds.has(key)) continue;
+        cleared.push(timerIds.get(key));
+        timers.delete(timerIds.get(key));
+        timerIds.delete(key);
+    }
+    const scheduled = out.timers.map((timer) => {
+        const key = `${nodeId}:${timer.id}`;
+        if (!timerIds.has(key)) {
+            timerIds.set(key, nextTimer);
+            timers.set(nextTimer++, { node: nodeId, local: timer.id });
+        }
+        return { id: timerIds.get(key), delay: timer.delay };
+    });
+    return { sends: out.sends, logs: out.logs, timers: scheduled, cleared };
+}
+
+function handle(request) {
+    if (request.op === 'reset') {
+        flowJson = '{}';
+        globalJson = '{}';
+        nodes = new Map();
+        timers = new Map();
+        timerIds = new Map();
+        return { ok: true };
+    }
+    if (request.op === 'run') {
+        const state = nodeState(request.node, request.func);
+        return invoke(state, request.node, '__run', { now: request.now, msg: request.msg });
+    }
+    if (request.op === 'timer') {
+        const timer = timers.get(request.id);
+        if (!timer) return empty();
+        const state = nodes.get(timer.node);
+        const result = invoke(state, timer.node, '__fire', { now: request.now, timer: timer.local });
+        if (!result.timers.some((scheduled) => scheduled.id === request.id)) {
+            timers.delete(request.id);
+            timerIds.delete(`${timer.node}:${timer.local}`);
+        }
+        return result;
+    }
+    throw new Error(`Unknown op '${request.op}'`);
+}
+
+readline.createInterface({ input: process.stdin }).on('line', (line) => {
+    let response;
+    try {
+        response = handle(JSON.parse(line));
+    } catch (error) {
+        response = { error: String(error && error.message || error), ...empty() };
+    }
+    process.stdout.write(JSON.stringify(response) + '\n');
+});
@@ -0,0 +1,141 @@
+import json
+import os
+from typing import Any, Dict, List, Optional
+from langchain.agents.middleware import AgentMiddleware, AgentState
+from langchain_core.messages import AIMessage, HumanMessage, RemoveMessage, ToolMessage
+from langgraph.graph.message import REMOVE_ALL_MESSAGES
+from typing_extensions import NotRequired
+
+
+HISTORY_COMPACTION = os.getenv("HISTORY_COMPACTION", "1").lower() in ("1", "true", "yes")
+# Controllers: drop earlier requests of a thread at the start of every run
+HISTORY_RESET = os.getenv("HISTORY_RESET", "").lower() in ("1", "true", "yes")
+# Tool results longer than this (characters) are compacted once their request is answered
+COMPACT_TOOL_RESULTS_OVER = int(os.getenv("COMPACT_TOOL_RESULTS_OVER", "1000"))
+# Characters of a non-JSON tool result kept in its compacted form
+COMPACT_TEXT_KEEP = 200
+
+AFFORDANCE_KINDS = ("properties", "actions", "events")
+
+
+def approx_tokens(text: str) -> int:
+    return len(text) // 4
+
+
+def _affordance_names(value: Any) -> List[str]:
+    return list(value) if isinstance(value, (dict, list)) else []
+
+
+def _compact_td(td: Dict) -> Dict:
+    compact = {key: td[key] for key in ("id", "title", "base") if td.get(key)}
+    for kind in AFFORDANCE_KINDS:
+        names = _affordance_names(td.get(kind))
+        if names:
+            compact[kind] = names
+    return compact
+
+
+def _is_td(value: Any) -> bool:
+    return isinstance(value, dict) and any(kind in value for kind in AFFORDANCE_KINDS)
+
+
+def summarize_tool_result(tool_name: str, text: str) -> str:
+    """Compact stand-in for a large tool result: TDs shrink to affordance names, text is cut."""
+    note = f"[compacted {tool_name} result, call {tool_name} again for the full details] "
+    try:
+        value = json.loads(text)
+    except (json.JSONDecodeError, TypeError):
+        return note + text[:COMPACT_TEXT_KEEP] + f"... ({len(text) - COMPACT_TEXT_KEEP} characters omitted)"
+    if _is_td(value):
+        value = _compact_td(value)
+    elif isinstance(value, dict) and any(_is_td(v) for v in value.values()):
+        value = {key: _compact_td(v) if _is_td(v) else v for key, v in value.items()}
+    elif isinstance(value, list) and any(_is_td(v) for v in value):
+        value = [_compact_td(v) if _is_td(v) else v for v in value]
+    else:
+        compact = json.dumps(value, separators=(",", ":"))
+        return note + compact[:COMPACT_TEXT_KEEP] + f"... ({len(compact) - COMPACT_TEXT_KEEP} characters omitted)"
+    return note + json.dumps(value, separators=(",", ":"))
+
+
+def _content_text(content: Any) -> str:
+    if isinstance(content, str):
+        return content
+    return "\n".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
+
+
+class CompactionState(AgentState):
+    tokens_saved: NotRequired[int]
+
+
+class HistoryCompaction(AgentMiddleware):
+    """
+    Keeps the agent's message history small.
+
+    Before every model call, tool results larger than `threshold` characters that belong to a
+    finished request (a later user message or a final answer without tool calls follows them)
+    are replaced, in the stored history, by a compact summary: TDs are reduced to id, title,
+    base and affordance names. Within a request the model keeps the full results (it may still
+    need the schemas to write the flow); later requests on the same thread only carry the summary.
+
+    With reset_per_request, every agent run starts from the new user message only, so a
+    long-lived thread_id does not carry earlier requests. The tokens kept out of model calls
+    during a run are returned in the agent state as "tokens_saved".
+    """
+    state_schema = CompactionState
+
+    def __init__(self, threshold: int = COMPACT_TOOL_RESULTS_OVER, reset_per_request: bool = HISTORY_RESET):
+        super().__init__()
+        self.threshold = threshold
+        self.reset_per_request = reset_per_request
+
+    def before_agent(self, state: CompactionState, runtime) -> Optional[Dict]:
+        messages = state["messages"]
+        update: Dict[str, Any] = {"tokens_saved": 0}
+        if self.reset_per_request:
+            last_human = max((i for i, m in enumerate(messages) if isinstance(m, HumanMessage)), default=0)
+            if last_human > 0:
+                update["messages"] = [RemoveMessage(id=REMOVE_ALL_MESSAGES), *messages[last_human:]]
+        return update
+
+    async def abefore_agent(self, state: CompactionState, runtime) -> Optional[Dict]:
+        return self.before_agent(state, runtime)
+
+    def before_model(self, state: CompactionState, runtime) -> Optional[Dict]:
+        messages = state["messages"]
+        # Results before this index belong to answered requests
+        answered = max((i for i, m in enumerate(messages) if isinstance(m, HumanMessage)
+                        or (isinstance(m, AIMessage) and not m.tool_calls)), default=-1)
+        replaced, saved = [], 0
+        for index, message in enumerate(messages):
+            if not isinstance(message, ToolMessage):
+                continue
+            original = message.additional_kwargs.get("compacted_from")
+            if original is None and index < answered:
+                text = _content_text(message.content)
+                if len(text) > self.threshold:
+                    summary = summarize_tool_result(message.name or "tool", text)
+                    if len(summary) < len(text):
+                        original = approx_tokens(text)
+                        message = message.model_copy(update={
+                            "content": summary,
+                            "additional_kwargs": {**message.additional_kwargs, "compacted_from": original},
+                        })
+                        replaced.append(message)
+            if original is not None:
+                saved += original - approx_tokens(_content_text(message.content))
+        if not saved:
+            return None
+        update: Dict[str, Any] = {"tokens_saved": state.get("tokens_saved", 0) + saved}
+        if replaced:
+            # Same message ids: the add_messages reducer replaces them in place
+            update["messages"] = replaced
+        return update
+
+    async def abefore_model(self, state: CompactionState, runtime) -> Optional[Dict]:
+        return self.before_model(state, runtime)
+
+
+def compaction_middleware(reset_per_request: bool = HISTORY_RESET) -> List:
+    """Middleware list for create_agent (empty when HISTORY_COMPACTION is off)."""
+    return [HistoryCompaction(reset_per_request=reset_per_request)] if HISTORY_COMPACTION else []
@@ -0,0 +1,312 @@
+import argparse
+import atexit
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+from langchain_core.callbacks import BaseCallbackHandler
+from job_queue import percentile
+
+
+# Comma-separated sinks: "sqlite", "otel" (OpenTelemetry, needs opentelemetry-sdk) or "off"
+AGENT_INSTRUMENTATION = os.getenv("AGENT_INSTRUMENTATION", "sqlite")
+INSTRUMENTATION_DB = os.getenv("INSTRUMENTATION_DB", os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '..', 'results', 'instrumentation.sqlite')
+))
+# Name of the simulated system the agents run against (smart-home, manufacturing, ...)
+SYSTEM_NAME = os.getenv("SYSTEM_NAME", "default")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS spans (
+    started_at REAL, kind TEXT, name TEXT, component TEXT, system TEXT, model TEXT,
+    run_id TEXT, root_id TEXT, duration_ms REAL, model_ms REAL, tool_ms REAL,
+    input_tokens INTEGER, output_tokens INTEGER, cached_tokens INTEGER, error TEXT
+)
+"""
+COLUMNS = ("started_at", "kind", "name", "component", "system", "model", "run_id", "root_id",
+           "duration_ms", "model_ms", "tool_ms", "input_tokens", "output_tokens", "cached_tokens", "error")
+
+
+class SQLiteSink:
+    """Buffers finished spans and writes them to a local SQLite file."""
+    def __init__(self, path: str = INSTRUMENTATION_DB, batch_size: int = 100):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(SCHEMA)
+        self.batch_size = batch_size
+        self._buffer: List[tuple] = []
+        self._lock = threading.Lock()
+
+    def start(self, span: Dict):
+        pass
+
+    def end(self, span: Dict):
+        with self._lock:
+            self._buffer.append(tuple(span.get(c) for c in COLUMNS))
+            if len(self._buffer) >= self.batch_size or span["kind"] == "agent":
+                self._flush()
+
+    def _flush(self):
+        if self._buffer:
+            self.conn.executemany(f"INSERT INTO spans VALUES ({', '.join('?' * len(COLUMNS))})", self._buffer)
+            self.conn.commit()
+            self._buffer.clear()
+
+    def close(self):
+        with self._lock:
+            self._flush()
+        self.conn.close()
+
+
+class OTelSink:
+    """Exports spans through OpenTelemetry (OTLP exporter configured from the OTEL_* env vars)."""
+    def __init__(self):
+        from opentelemetry import trace
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+
+        if not isinstance(trace.get_tracer_provider(), TracerProvider):
+            provider = TracerProvider(resource=Resource.create({"service.name": "llm-agents"}))
+            provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+            trace.set_tracer_provider(provider)
+        self._trace = trace
+        self.tracer = trace.get_tracer("llm-agents")
+        self._spans: Dict[str, Any] = {}
+
+    def start(self, span: Dict):
+        parent = self._spans.get(span.get("parent_id")) or self._spans.get(span["root_id"])
+        context = self._trace.set_span_in_context(parent) if parent else None
+        self._spans[span["run_id"]] = self.tracer.start_span(
+            f"{span['kind']} {span['name']}", context=context, start_time=int(span["started_at"] * 1e9)
+        )
+
+    def end(self, span: Dict):
+        otel_span = self._spans.pop(span["run_id"], None)
+        if otel_span is None:
+            return
+        for key in ("component", "system", "model", "input_tokens", "output_tokens", "cached_tokens",
+                    "model_ms", "tool_ms", "error"):
+            if span.get(key) is not None:
+                otel_span.set_attribute(f"llm_agents.{key}", span[key])
+        otel_span.end(end_time=int((span["started_at"] + span["duration_ms"] / 1000) * 1e9))
+
+    def close(self):
+        provider = self._trace.get_tracer_provider()
+        if hasattr(provider, "shutdown"):
+            provider.shutdown()
+
+
+class InstrumentationHandler(BaseCallbackHandler):
+    """
+    LangChain callback handler that records every model call (tokens incl. cached prompt
+    tokens, latency), every tool call (for MCP tools: the MCP round trip) and every agent run
+    (total latency split into model time and tool time) as spans.
+    """
+    run_inline = True  # time callbacks on the event loop instead of a thread pool
+
+    def __init__(self, sinks: List):
+        self.sinks = sinks
+        self._runs: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    def _start(self, kind: str, name: str, run_id: UUID, parent_run_id: Optional[UUID], metadata: Optional[Dict],
+               model: Optional[str] = None):
+        metadata = metadata or {}
+        if kind == "chain" and parent_run_id is None:
+            kind = "agent"
+        with self._lock:
+            parent = self._runs.get(str(parent_run_id)) if parent_run_id else None
+            span = {
+                "kind": kind, "name": name, "run_id": str(run_id),
+                "parent_id": str(parent_run_id) if parent_run_id else None,
+                "root_id": parent["root_id"] if parent else str(run_id),
+                "component": metadata.get("component"), "system": metadata.get("system", SYSTEM_NAME),
+                "model": model, "started_at": time.time(), "_t0": time.perf_counter(),
+                "model_ms": 0.0, "tool_ms": 0.0, "input_tokens": 0, "output_tokens": 0, "cached_tokens": 0,
+            }
+            self._runs[str(run_id)] = span
+        # Inner chains (agent graph nodes) are only tracked to find their agent run
+        if kind != "chain":
+            for sink in self.sinks:
+                sink.start(span)
+
+    def _end(self, run_id: UUID, error: Optional[BaseException] = None, **fields):
+        with self._lock:
+            span = self._runs.pop(str(run_id), None)
+            if span is None:
+                return
+            span.update(fields, duration_ms=(time.perf_counter() - span["_t0"]) * 1000)
+            if error is not None:
+                span["error"] = f"{type(error).__name__}: {error}"
+            root = self._runs.get(span["root_id"])
+            if root is not None and span["kind"] in ("llm", "tool"):
+                # Roll model and tool time (and tokens) up into the agent run
+                root[f"{'model' if span['kind'] == 'llm' else 'tool'}_ms"] += span["duration_ms"]
+                for key in ("input_tokens", "output_tokens", "cached_tokens"):
+                    root[key] += span.get(key) or 0
+                root["model"] = span.get("model") or root["model"]
+                span["model"] = span.get("model") or root["model"]
+            if span["kind"] == "chain":
+                return
+        for sink in self.sinks:
+            sink.end(span)
+
+    def on_chat_model_start(self, serialized: Dict, messages, *, run_id: UUID, parent_run_id: Optional[UUID] = None,
+                            metadata: Optional[Dict] = None, **kwargs: Any):
+        params = kwargs.get("invocation_params") or {}
+        model = (metadata or {}).get("ls_model_name") or params.get("model") or params.get("model_name") \
+            or (serialized or {}).get("name", "chat_model")
+        self._start("llm", model, run_id, parent_run_id, metadata, model)
+
+    def on_llm_start(self, serialized: Dict, prompts, *, run_id: UUID, parent_run_id: Optional[UUID] = None,
+                     metadata: Optional[Dict] = None, **kwargs: Any):
+        model = (metadata or {}).get("ls_model_name") or (serialized or {}).get("name", "llm")
+        self._start("llm", model, run_id, parent_run_id, metadata, model)
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs: Any):
+        usage = {}
+        generations = response.generations[0] if response.generations else []
+        message = getattr(generations[0], "message", None) if generations else None
+        metadata = getattr(message, "usage_metadata", None)
+        if metadata:
+            usage = {
+                "input_tokens": metadata.get("input_tokens", 0),
+                "output_tokens": metadata.get("output_tokens", 0),
+                "cached_tokens": (metadata.get("input_token_details") or {}).get("cache_read", 0),
+            }
+        elif response.llm_output and response.llm_output.get("token_usage"):
+            token_usage = response.llm_output["token_usage"]
+            usage = {"input_tokens": token_usage.get("prompt_tokens", 0),
+                     "output_tokens": token_usage.get("completion_tokens", 0)}
+        self._end(run_id, **usage)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        self._end(run_id, error)
+
+    def on_tool_start(self, serialized: Dict, input_str: str, *, run_id: UUID, parent_run_id: Optional[UUID] = None,
+                      metadata: Optional[Dict] = None, **kwargs: Any):
+        self._start("tool", (serialized or {}).get("name", "tool"), run_id, parent_run_id, metadata)
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any):
+        self._end(run_id)
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        self._end(run_id, error)
+
+    def on_chain_start(self, serialized: Dict, inputs: Dict, *, run_id: UUID, parent_run_id: Optional[UUID] = None,
+                       metadata: Optional[Dict] = None, **kwargs: Any):
+        name = kwargs.get("name") or (serialized or {}).get("name") or "agent"
+        self._start("chain", name, run_id, parent_run_id, metadata)
+
+    def on_chain_end(self, outputs: Any, *, run_id: UUID, **kwargs: Any):
+        self._end(run_id)
+
+    def on_chain_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        self._end(run_id, error)
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+
+_handler: Optional[InstrumentationHandler] = None
+
+
+def get_handler() -> Optional[InstrumentationHandler]:
+    """Process-wide handler for the sinks in AGENT_INSTRUMENTATION (None when disabled)."""
+    global _handler
+    if _handler is None:
+        sinks = []
+        for name in filter(None, (part.strip() for part in AGENT_INSTRUMENTATION.split(","))):
+            if name == "sqlite":
+                sinks.append(SQLiteSink())
+            elif name == "otel":
+                try:
+                    sinks.append(OTelSink())
+                except ImportError:
+                    print("⚠️  opentelemetry-sdk not installed - OpenTelemetry export disabled")
+        if not sinks:
+            return None
+        _handler = InstrumentationHandler(sinks)
+        atexit.register(_handler.close)
+    return _handler
+
+
+def instrument(runnable, component: str, system: Optional[str] = None):
+    """Attach the instrumentation callbacks to an agent (or chat model) for every call."""
+    handler = get_handler()
+    if handler is None:
+        return runnable
+    return runnable.with_config(
+        callbacks=[handler],
+        metadata={"component": component, "system": system or SYSTEM_NAME},
+    )
+
+
+def summarize(db_path: str = INSTRUMENTATION_DB, by: str = "system", since: Optional[float] = None) -> List[Dict]:
+    """p50/p95 latencies and token totals per system (or model / component)."""
+    if by not in ("system", "model", "component"):
+        raise ValueError(f"Cannot group spans by '{by}'")
+    conn = sqlite3.connect(db_path)
+    query = f"SELECT {by}, kind, duration_ms, model_ms, tool_ms, input_tokens, output_tokens, cached_tokens, error FROM spans"
+    rows = conn.execute(query + (" WHERE started_at >= ?" if since else ""), (since,) if since else ()).fetchall()
+    conn.close()
+
+    groups: Dict[str, Dict[str, List[tuple]]] = {}
+    for row in rows:
+        groups.setdefault(row[0] or "-", {}).setdefault(row[1], []).append(row[2:])
+    summary = []
+    for group, kinds in sorted(groups.items()):
+        agent, llm, tool = kinds.get("agent", []), kinds.get("llm", []), kinds.get("tool", [])
+        agent_ms = sum(r[0] for r in agent)
+        summary.append({
+            by: group,
+            "agent_runs": len(agent),
+            "agent_p50_ms": percentile([r[0] for r in agent], 50),
+            "agent_p95_ms": percentile([r[0] for r in agent], 95),
+            "model_share": sum(r[1] for r in agent) / agent_ms if agent_ms else None,
+            "tool_share": sum(r[2] for r in agent) / agent_ms if agent_ms else None,
+            "llm_calls": len(llm),
+            "llm_p50_ms": percentile([r[0] for r in llm], 50),
+            "llm_p95_ms": percentile([r[0] for r in llm], 95),
+            "tool_calls": len(tool),
+            "tool_p50_ms": percentile([r[0] for r in tool], 50),
+            "tool_p95_ms": percentile([r[0] for r in tool], 95),
+            "input_tokens": sum(r[3] or 0 for r in llm),
+            "output_tokens": sum(r[4] or 0 for r in llm),
+            "cached_tokens": sum(r[5] or 0 for r in llm),
+            "errors": sum(1 for rows_ in kinds.values() for r in rows_ if r[6]),
+        })
+    return summary
+
+
+def print_summary(summary: List[Dict], by: str = "system"):
+    fmt = lambda value, unit="ms": f"{value:.0f}{unit}" if value is not None else "-"
+    for row in summary:
+        share = f"{row['model_share']:.0%}/{row['tool_share']:.0%}" if row["model_share"] is not None else "-"
+        print(f"📊 {row[by]}")
+        print(f"  agent: runs={row['agent_runs']} p50={fmt(row['agent_p50_ms'])} p95={fmt(row['agent_p95_ms'])} "
+              f"model/tool time={share}")
+        print(f"  model: calls={row['llm_calls']} p50={fmt(row['llm_p50_ms'])} p95={fmt(row['llm_p95_ms'])} "
+              f"tokens in={row['input_tokens']} (cached {row['cached_tokens']}) out={row['output_tokens']}")
+        print(f"  tools: calls={row['tool_calls']} p50={fmt(row['tool_p50_ms'])} p95={fmt(row['tool_p95_ms'])} "
+              f"errors={row['errors']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize recorded agent instrumentation")
+    parser.add_argument("--db", default=INSTRUMENTATION_DB)
+    parser.add_argument("--by", choices=["system", "model", "component"], default="system")
+    parser.add_argument("--last-hours", type=float, help="Only spans from the last N hours")
+    args = parser.parse_args()
+    since = time.time() - args.last_hours * 3600 if args.last_hours else None
+    print_summary(summarize(args.db, args.by, since), args.by)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+import asyncio
+import math
+import time
+import uuid
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+
+DEFAULT_MODEL_CONCURRENCY = 2
+LATENCY_WINDOW = 1000
+
+
+class QueueFull(Exception):
+    """Raised when a job is submitted while the bounded queue is full."""
+
+
+class Job:
+    """A queued generation job with its progress log and result."""
+    def __init__(self, model: str, payload: Dict):
+        self.id = uuid.uuid4().hex
+        self.model = model
+        self.payload = payload
+        self.status = "queued"
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.submitted_at = time.monotonic()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.events: List[Dict] = []
+        self._changed = asyncio.Event()
+        self.progress("queued")
+
+    def progress(self, stage: str, **data):
+        """Record a progress event and wake up stream readers."""
+        self.events.append({"stage": stage, "time": time.time(), **data})
+        self._changed.set()
+
+    async def stream(self):
+        """Yield progress events (past and future) until the job has finished."""
+        index = 0
+        while True:
+            while index < len(self.events):
+                yield self.events[index]
+                index += 1
+            if self.done:
+                return
+            self._changed.clear()
+            if index == len(self.events):
+                await self._changed.wait()
+
+    async def wait(self):
+        async for _ in self.stream():
+            pass
+        return self
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("completed", "failed")
+
+    def to_dict(self) -> Dict:
+        return {
+            "id": self.id,
+            "model": self.model,
+            "status": self.status,
+            "result": self.result,
+            "error": self.error,
+            "queue_wait": self.started_at - self.submitted_at if self.started_at else None,
+            "latency": self.finished_at - self.submitted_at if self.finished_at else None,
+        }
+
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    """Nearest-rank percentile (p in 0..100) of a list of numbers."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = min(len(ordered), max(1, math.ceil(p / 100 * len(ordered))))
+    return ordered[rank - 1]
+
+
+class JobQueue:
+    """
+    Bounded work queue with a separate worker pool per model.
+
+    At most max_queued jobs wait across all models (submit raises QueueFull beyond that,
+    which the HTTP layer turns into 429 backpressure). Each model gets its own queue and
+    model_limits[model] workers, so a slow provider never blocks jobs for another one.
+    """
+    def __init__(self, runner: Callable[[Job], Awaitable[Any]], max_queued: int = 100,
+                 model_limits: Optional[Dict[str, int]] = None,
+                 default_limit: int = DEFAULT_MODEL_CONCURRENCY,
+                 max_finished: int = 1000):
+        self.runner = runner
+        self.max_queued = max_queued
+        self.model_limits = model_limits or {}
+        self.default_limit = default_limit
+        self.jobs: Dict[str, Job] = {}
+        self._finished: Deque[str] = deque()
+        self._max_finished = max_finished
+        self._queues: Dict[str, asyncio.Queue] = {}
+        self._workers: List[asyncio.Task] = []
+        self._queued = 0
+        self._running: Dict[str, int] = {}
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._waits: Dict[str, Deque[float]] = {}
+        self._counts = {"submitted": 0, "completed": 0, "failed": 0, "rejected": 0}
+
+    def submit(self, model: str, payload: Dict) -> Job:
+        if self._queued >= self.max_queued:
+            self._counts["rejected"] += 1
+            raise QueueFull(f"{self._queued} jobs already queued")
+        job = Job(model, payload)
+        self.jobs[job.id] = job
+        self._queue_for(model).put_nowait(job)
+        self._queued += 1
+        self._counts["submitted"] += 1
+        return job
+
+    def _queue_for(self, model: str) -> asyncio.Queue:
+        if model not in self._queues:
+            self._queues[model] = asyncio.Queue()
+            for _ in range(self.model_limits.get(model, self.default_limit)):
+                self._workers.append(asyncio.create_task(self._worker(model)))
+        return self._queues[model]
+
+    async def _worker(self, model: str):
+        queue = self._queues[model]
+        while True:
+            job = await queue.get()
+            self._queued -= 1
+            self._running[model] = self._running.get(model, 0) + 1
+            job.started_at = time.monotonic()
+            job.status = "running"
+            job.progress("running")
+            try:
+                job.result = await self.runner(job)
+                job.status = "completed"
+                self._counts["completed"] += 1
+            except asyncio.CancelledError:
+                job.status = "failed"
+                job.error = "cancelled"
+                raise
+            except Exception as e:
+                job.status = "failed"
+                job.error = str(e)
+                self._counts["failed"] += 1
+            finally:
+                job.finished_at = time.monotonic()
+                self._running[model] -= 1
+                self._record(job)
+                job.progress(job.status, error=job.error)
+                queue.task_done()
+
+    def _record(self, job: Job):
+        latencies = self._latencies.setdefault(job.model, deque(maxlen=LATENCY_WINDOW))
+        waits = self._waits.setdefault(job.model, deque(maxlen=LATENCY_WINDOW))
+        latencies.append(job.finished_at - job.submitted_at)
+        waits.append(job.started_at - job.submitted_at)
+        # Forget old finished jobs so a long-running service does not grow unbounded
+        self._finished.append(job.id)
+        while len(self._finished) > self._max_finished:
+            self.jobs.pop(self._finished.popleft(), None)
+
+    def stats(self) -> Dict:
+        """Queue depth, running jobs and latency percentiles (seconds) per model."""
+        models = {}
+        for model in self._queues:
+            latencies = list(self._latencies.get(model, []))
+            waits = list(self._waits.get(model, []))
+            models[model] = {
+                "queued": self._queues[model].qsize(),
+                "running": self._running.get(model, 0),
+                "limit": self.model_limits.get(model, self.default_limit),
+                "latency_p50": percentile(latencies, 50),
+                "latency_p95": percentile(latencies, 95),
+                "latency_p99": percentile(latencies, 99),
+                "queue_wait_p50": percentile(waits, 50),
+                "queue_wait_p95": percentile(waits, 95),
+            }
+        return {
+            "queue_depth": self._queued,
+            "max_queued": self.max_queued,
+            **self._counts,
+            "models": models,
+        }
+
+    async def close(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers.clear()
+
+
+class FairScheduler:
+    """
+    Runs coroutines for many tenants (controller sites) under one global concurrency limit.
+
+    Every tenant has its own FIFO; free slots are handed out round-robin over the tenants
+    with waiting work, and a tenant never holds more than `per_tenant` slots, so a site in
+    an event storm queues behind itself instead of starving the others.
+    """
+    def __init__(self, limit: int, per_tenant: int = 1, max_queued_per_tenant: int = 100):
+        self.limit = limit
+        self.per_tenant = per_tenant
+        self.max_queued_per_tenant = max_queued_per_tenant
+        self._queues: Dict[str, Deque[tuple]] = {}
+        self._ring: Deque[str] = deque()
+        self._running: Dict[str, int] = {}
+        self._tasks: set = set()
+        self._waits: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self._latencies: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self._counts = {"submitted": 0, "completed": 0, "failed": 0, "rejected": 0}
+
+    @property
+    def running(self) -> int:
+        return sum(self._running.values())
+
+    def submit(self, tenant: str, factory: Callable[[], Awaitable[Any]]) -> asyncio.Future:
+        """Queue factory() for a tenant; the future resolves with its result."""
+        queue = self._queues.setdefault(tenant, deque())
+        if len(queue) >= self.max_queued_per_tenant:
+            self._counts["rejected"] += 1
+            raise QueueFull(f"{len(queue)} jobs already queued for {tenant}")
+        future = asyncio.get_running_loop().create_future()
+        queue.append((factory, future, time.monotonic()))
+        self._counts["submitted"] += 1
+        if tenant not in self._ring and self._running.get(tenant, 0) < self.per_tenant:
+            self._ring.append(tenant)
+        self._dispatch()
+        return future
+
+    def _dispatch(self):
+        while self._ring and self.running < self.limit:
+            tenant = self._ring.popleft()
+            factory, future, submitted_at = self._queues[tenant].popleft()
+            self._running[tenant] = self._running.get(tenant, 0) + 1
+            if self._queues[tenant] and self._running[tenant] < self.per_tenant:
+                self._ring.append(tenant)
+            task = asyncio.ensure_future(self._run(tenant, factory, future, submitted_at))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, tenant: str, factory: Callable[[], Awaitable[Any]], future: asyncio.Future,
+                   submitted_at: float):
+        started_at = time.monotonic()
+        self._waits.append(started_at - submitted_at)
+        try:
+            result = await factory()
+            self._counts["completed"] += 1
+            if not future.done():
+                future.set_result(result)
+        except Exception as e:
+            self._counts["failed"] += 1
+            if not future.done():
+                future.set_exception(e)
+        finally:
+            self._latencies.append(time.monotonic() - started_at)
+            self._running[tenant] -= 1
+            if self._queues[tenant] and tenant not in self._ring:
+                self._ring.append(tenant)
+            self._dispatch()
+
+    def forget(self, tenant: str):
+        """Drop a tenant's waiting work (its running jobs finish)."""
+        for _, future, _ in self._queues.pop(tenant, deque()):
+            future.cancel()
+        if tenant in self._ring:
+            self._ring.remove(tenant)
+        self._queues[tenant] = deque()
+
+    def stats(self) -> Dict:
+        """Global slots in use, waiting work and queue-wait / run-time percentiles (seconds)."""
+        waits, latencies = list(self._waits), list(self._latencies)
+        return {
+            "limit": self.limit,
+            "running": self.running,
+            "queued": sum(len(queue) for queue in self._queues.values()),
+            "tenants_waiting": len(self._ring),
+            **self._counts,
+            "queue_wait_p50": percentile(waits, 50),
+            "queue_wait_p95": percentile(waits, 95),
+            "run_p50": percentile(latencies, 50),
+            "run_p95": percentile(latencies, 95),
+        }
+
+    async def close(self):
+        for tenant in list(self._queues):
+            self.forget(tenant)
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+def parse_model_limits(spec: str) -> Dict[str, int]:
+    """Parse "gpt-4.1=4,recorded=32" into {"gpt-4.1": 4, "recorded": 32}."""
+    limits = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        model, _, limit = item.rpartition("=")
+        limits[model] = int(limit)
+    return limits
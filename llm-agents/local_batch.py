@@ -0,0 +1,201 @@
+import asyncio
+import heapq
+import json
+import itertools
+import math
+import os
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+from langchain_core.messages import HumanMessage, SystemMessage
+from flow_layout import layout_flow
+from flow_utils import extract_flow_json
+from job_queue import percentile
+
+
+LOCAL_MIN_CONCURRENCY = int(os.getenv("LOCAL_MIN_CONCURRENCY", "1"))
+LOCAL_MAX_CONCURRENCY = int(os.getenv("LOCAL_MAX_CONCURRENCY", "32"))
+LOCAL_INITIAL_CONCURRENCY = int(os.getenv("LOCAL_INITIAL_CONCURRENCY", "4"))
+# Completions per concurrency adjustment
+ADAPT_WINDOW = 8
+
+
+def prompt_length(messages: List) -> int:
+    """Rough prompt size in tokens (4 characters per token)."""
+    chars = 0
+    for message in messages:
+        content = message.content if hasattr(message, "content") else message.get("content", "")
+        chars += len(content) if isinstance(content, str) else len(str(content))
+    return chars // 4 + 1
+
+
+def _output_tokens(response: Any) -> int:
+    usage = getattr(response, "usage_metadata", None) or {}
+    if usage.get("output_tokens"):
+        return usage["output_tokens"]
+    content = getattr(response, "content", "")
+    return max(1, len(content if isinstance(content, str) else str(content)) // 4)
+
+
+class LocalBatchScheduler:
+    """
+    Client-side scheduler for a local OpenAI-compatible server (LM Studio, llama.cpp, vLLM).
+
+    Keeps `limit` requests in flight so the server's continuous batching stays busy, and
+    adapts the limit from observed latency (gradient control): the per-output-token latency
+    of recent requests is compared with the best seen so far. While it stays close, the
+    server still has spare batch slots and the limit grows; when requests slow down, the
+    limit shrinks proportionally. Errors halve the limit.
+
+    Queued prompts are dispatched longest first by default: in a batch the long prompts
+    dominate the tail, so starting them early shortens the total run ("shortest" favours
+    interactive latency instead).
+    """
+    def __init__(self, model, min_concurrency: int = LOCAL_MIN_CONCURRENCY,
+                 max_concurrency: int = LOCAL_MAX_CONCURRENCY,
+                 initial_concurrency: int = LOCAL_INITIAL_CONCURRENCY,
+                 order: str = "longest", tolerance: float = 1.5):
+        if order not in ("longest", "shortest", "fifo"):
+            raise ValueError(f"Unknown queue order '{order}'")
+        self.model = model
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.limit = float(max(min_concurrency, min(initial_concurrency, max_concurrency)))
+        self.order = order
+        self.tolerance = tolerance
+        self.in_flight = 0
+        self._queue: List[tuple] = []
+        self._counter = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._tasks: set = set()
+        self._window: List[float] = []
+        self._best_token_latency: Optional[float] = None
+        self._latencies: Deque[float] = deque(maxlen=1000)
+        self._history: List[tuple] = []
+        self._counts = {"completed": 0, "failed": 0}
+        self._started_at: Optional[float] = None
+
+    async def submit(self, messages: List) -> Any:
+        """Queue one chat request and wait for its response."""
+        if self._dispatcher is None:
+            self._dispatcher = asyncio.create_task(self._dispatch())
+            self._started_at = time.monotonic()
+        length = prompt_length(messages)
+        key = {"longest": -length, "shortest": length, "fifo": 0}[self.order]
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (key, next(self._counter), messages, future))
+        self._wakeup.set()
+        return await future
+
+    async def map(self, batch: List[List]) -> List[Any]:
+        """Run a batch of chat requests; results (or exceptions) come back in input order."""
+        return await asyncio.gather(*(self.submit(messages) for messages in batch), return_exceptions=True)
+
+    async def _dispatch(self):
+        while True:
+            while self._queue and self.in_flight < int(self.limit):
+                _, _, messages, future = heapq.heappop(self._queue)
+                self.in_flight += 1
+                task = asyncio.create_task(self._run(messages, future))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+            self._wakeup.clear()
+            await self._wakeup.wait()
+
+    async def _run(self, messages: List, future: asyncio.Future):
+        started = time.perf_counter()
+        try:
+            response = await self.model.ainvoke(messages)
+        except Exception as e:
+            self._counts["failed"] += 1
+            self._set_limit(self.limit / 2)
+            if not future.done():
+                future.set_exception(e)
+        else:
+            latency = time.perf_counter() - started
+            self._counts["completed"] += 1
+            self._latencies.append(latency)
+            self._observe(latency / _output_tokens(response))
+            if not future.done():
+                future.set_result(response)
+        finally:
+            self.in_flight -= 1
+            self._wakeup.set()
+
+    def _observe(self, token_latency: float):
+        self._window.append(token_latency)
+        if len(self._window) < ADAPT_WINDOW:
+            return
+        recent = percentile(self._window, 50)
+        self._window.clear()
+        if self._best_token_latency is None or recent < self._best_token_latency:
+            self._best_token_latency = recent
+        gradient = self.tolerance * self._best_token_latency / recent
+        if gradient >= 1.0:
+            # Latency still near the best seen: the server has spare slots
+            self._set_limit(self.limit + max(1.0, math.sqrt(self.limit)))
+        else:
+            self._set_limit(self.limit * max(0.5, gradient))
+
+    def _set_limit(self, limit: float):
+        self.limit = max(float(self.min_concurrency), min(float(self.max_concurrency), limit))
+        self._history.append((time.monotonic(), self.limit))
+        self._wakeup.set()
+
+    def stats(self) -> Dict:
+        latencies = list(self._latencies)
+        elapsed = time.monotonic() - self._started_at if self._started_at else 0.0
+        return {
+            **self._counts,
+            "queued": len(self._queue),
+            "in_flight": self.in_flight,
+            "limit": int(self.limit),
+            "peak_limit": int(max((limit for _, limit in self._history), default=self.limit)),
+            "latency_p50": percentile(latencies, 50),
+            "latency_p95": percentile(latencies, 95),
+            "throughput": self._counts["completed"] / elapsed if elapsed else 0.0,
+        }
+
+    async def close(self):
+        if self._dispatcher:
+            self._dispatcher.cancel()
+            await asyncio.gather(self._dispatcher, return_exceptions=True)
+            self._dispatcher = None
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+def read_requirements(path: str) -> List[str]:
+    """One requirement per non-empty line."""
+    with open(path, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def laid_out(text: str) -> str:
+    """A response with its flow laid out, or the response unchanged if it holds no flow."""
+    flow = extract_flow_json(text)
+    return json.dumps(layout_flow(flow), indent=2) if flow else text
+
+
+async def generate_batch(scheduler: LocalBatchScheduler, system_prompt: str, requirements: List[str],
+                         out_path: Optional[str] = None) -> List[str]:
+    """
+    Generate one response per requirement through the scheduler. Flows in the responses are
+    laid out (the prompts leave coordinates to flow_layout). With out_path, the results are
+    written as a "You: ..." transcript (the format of results/llm_outputs).
+    """
+    started = time.perf_counter()
+    batch = [[SystemMessage(content=system_prompt), HumanMessage(content=r)] for r in requirements]
+    responses = await scheduler.map(batch)
+    texts = [f"❌ Error: {r}" if isinstance(r, Exception) else laid_out(r.content) for r in responses]
+    stats = scheduler.stats()
+    print(f"✓ Generated {stats['completed']}/{len(requirements)} responses in {time.perf_counter() - started:.1f}s "
+          f"(peak concurrency {stats['peak_limit']}, p50 {stats['latency_p50'] or 0:.1f}s)")
+    if out_path:
+        with open(out_path, "w", encoding="utf-8") as f:
+            for requirement, text in zip(requirements, texts):
+                f.write(f"You: {requirement}\n\n{text}\n\n")
+        print(f"✓ Wrote {out_path}")
+    return texts
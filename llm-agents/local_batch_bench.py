@@ -0,0 +1,120 @@
+import argparse
+import asyncio
+import time
+import uuid
+import uvicorn
+from langchain.chat_models import init_chat_model
+from langchain_core.messages import HumanMessage, SystemMessage
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from local_batch import LocalBatchScheduler, prompt_length
+
+
+# Fake server timing: seconds per prompt token (prefill) and per output token (one decode step)
+PREFILL_SECONDS = 0.0001
+STEP_SECONDS = 0.004
+# Each request in the batch slows every decode step down by this share
+BATCH_SLOWDOWN = 0.08
+
+
+class FakeBatchingServer:
+    """
+    OpenAI-compatible chat endpoint that behaves like a continuous-batching local server:
+    `slots` requests are decoded together (each step a little slower per request in the
+    batch), further requests wait for a free slot.
+    """
+    def __init__(self, slots: int):
+        self.slots = asyncio.Semaphore(slots)
+        self.active = 0
+        self.peak = 0
+
+    async def chat(self, request: Request):
+        body = await request.json()
+        prompt_tokens = prompt_length(body.get("messages", []))
+        # Longer requirements get longer flows
+        output_tokens = 40 + len(body["messages"][-1].get("content", "")) % 80
+        async with self.slots:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+            try:
+                await asyncio.sleep(prompt_tokens * PREFILL_SECONDS)
+                for _ in range(output_tokens):
+                    await asyncio.sleep(STEP_SECONDS * (1 + BATCH_SLOWDOWN * self.active))
+            finally:
+                self.active -= 1
+        return JSONResponse({
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "fake"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": "[]" + " " * (output_tokens * 4 - 2)}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": output_tokens,
+                      "total_tokens": prompt_tokens + output_tokens},
+        })
+
+    def app(self) -> Starlette:
+        return Starlette(routes=[Route("/v1/chat/completions", self.chat, methods=["POST"])])
+
+
+def make_batch(count: int) -> list:
+    requirements = [
+        "Blink LEDs when washing machine finishes",
+        "Turn on the main room light when motion is detected in that room.",
+        "When morning alarm triggers, turn heating on to 30 degrees C for 20mins.",
+        "If no motion is detected between 11 PM and 6 AM, dim the lights and lock the front door.",
+    ]
+    system = "You generate Node-RED flows for Web of Things devices. " * 20
+    return [[SystemMessage(content=system), HumanMessage(content=f"{requirements[i % len(requirements)]} (#{i})")]
+            for i in range(count)]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="LocalBatchScheduler against a fake continuous-batching server")
+    parser.add_argument("--slots", type=int, default=8, help="Batch slots of the fake server")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--port", type=int, default=1235)
+    parser.add_argument("--serve", action="store_true",
+                        help="Only run the fake server (e.g. on port 1234 for the LM Studio generators)")
+    args = parser.parse_args()
+
+    fake = FakeBatchingServer(args.slots)
+    server = uvicorn.Server(uvicorn.Config(fake.app(), host="127.0.0.1", port=args.port, log_level="warning"))
+    if args.serve:
+        print(f"🧩 Fake {args.slots}-slot server on http://127.0.0.1:{args.port}/v1")
+        await server.serve()
+        return
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    model = init_chat_model(model="fake", model_provider="openai", base_url=f"http://127.0.0.1:{args.port}/v1",
+                            api_key="not-needed", temperature=0)
+    batch = make_batch(args.requests)
+    try:
+        started = time.perf_counter()
+        for messages in batch[:max(1, args.requests // 10)]:
+            await model.ainvoke(messages)
+        sequential = max(1, args.requests // 10) / (time.perf_counter() - started)
+        print(f"  sequential:      {sequential:6.1f} req/s")
+
+        scheduler = LocalBatchScheduler(model)
+        started = time.perf_counter()
+        results = await scheduler.map(batch)
+        elapsed = time.perf_counter() - started
+        stats = scheduler.stats()
+        await scheduler.close()
+        failed = sum(isinstance(result, Exception) for result in results)
+        print(f"  LocalBatchScheduler: {args.requests / elapsed:6.1f} req/s  ({stats['completed']} completed, "
+              f"{failed} failed, peak limit {stats['peak_limit']}, server peak batch {fake.peak}/{args.slots}, "
+              f"p50 {stats['latency_p50']:.2f}s, p95 {stats['latency_p95']:.2f}s)")
+        print(f"\n📊 {args.requests / elapsed / sequential:.1f}x the sequential throughput")
+    finally:
+        server.should_exit = True
+        await serving
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,220 @@
+import asyncio
+import os
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+from langchain_mcp_adapters.client import MultiServerMCPClient
+from langchain_mcp_adapters.tools import load_mcp_tools
+
+
+WOT_MCP_SERVER_URL = os.getenv("WOT_MCP_SERVER_URL", "http://localhost:3000/mcp")
+NODE_RED_URL = os.getenv("NODE_RED_URL", "http://localhost:1880")
+NODE_RED_MCP_PATH = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '..', 'node-red-mcp', 'index.js')
+)
+
+# Connections for the two MCP servers used by the generators and controllers
+DEFAULT_CONNECTIONS = {
+    "wot": {
+        "transport": "streamable_http",
+        "url": WOT_MCP_SERVER_URL,
+    },
+    "node-red": {
+        "transport": "stdio",
+        "command": "node",
+        "args": [NODE_RED_MCP_PATH],
+        "env": {**os.environ, "NODE_RED_URL": NODE_RED_URL},
+    },
+}
+
+# Flow generation only needs device discovery; the control tools (read/write/invoke)
+# would just add their schemas to every model call.
+GENERATION_TOOLS = {"list_devices", "get_thing_descriptions", "get_thing_description"}
+
+HEALTH_CHECK_INTERVAL = 15.0
+HEALTH_CHECK_TIMEOUT = 5.0
+
+
+class PooledServer:
+    """State of one warm MCP session and the tools bound to it."""
+    def __init__(self, name: str):
+        self.name = name
+        self.session = None
+        self.tools: List = []
+        self.healthy = False
+        self.generation = 0
+        self.last_error: Optional[str] = None
+        self.stop = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+
+class McpSessionPool:
+    """
+    Keeps one long-lived MCP session per server and caches its tools and agents.
+
+    Each session is owned by a dedicated task, so it can be torn down and reopened
+    (reconnect) from any other task. MCP sessions multiplex requests, so the cached
+    tools can be shared by many concurrent agent invocations. on_session(name, session)
+    runs every time a session is (re)opened, e.g. to install notification handlers and
+    resubscribe resources.
+    """
+    def __init__(self, connections: Optional[Dict[str, dict]] = None,
+                 health_check_interval: float = HEALTH_CHECK_INTERVAL,
+                 on_session: Optional[Callable[[str, Any], Awaitable[None]]] = None):
+        self.connections = connections or {"wot": DEFAULT_CONNECTIONS["wot"]}
+        self.on_session = on_session
+        self.client = MultiServerMCPClient(self.connections)
+        self.health_check_interval = health_check_interval
+        self.servers: Dict[str, PooledServer] = {}
+        self._agents: Dict[Any, tuple] = {}
+        self._reconnect_locks: Dict[str, asyncio.Lock] = {}
+        self._health_task: Optional[asyncio.Task] = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def start(self):
+        """Open all sessions concurrently and start the health-check loop."""
+        await asyncio.gather(*(self._connect(name) for name in self.connections))
+        if self.health_check_interval:
+            self._health_task = asyncio.create_task(self._health_loop())
+
+    async def close(self):
+        """Stop the health-check loop and close every session."""
+        if self._health_task:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except asyncio.CancelledError:
+                pass
+        await asyncio.gather(*(self._disconnect(name) for name in list(self.servers)))
+        self._agents.clear()
+
+    async def _connect(self, name: str) -> bool:
+        server = PooledServer(name)
+        previous = self.servers.get(name)
+        if previous:
+            server.generation = previous.generation + 1
+        self.servers[name] = server
+
+        ready = asyncio.get_running_loop().create_future()
+        server.task = asyncio.create_task(self._own_session(server, ready))
+        try:
+            await ready
+            print(f"✓ MCP session '{name}' ready ({len(server.tools)} tools)")
+            return True
+        except Exception as e:
+            server.last_error = str(e)
+            print(f"❌ Failed to connect to MCP server '{name}': {e}")
+            return False
+
+    async def _own_session(self, server: PooledServer, ready: asyncio.Future):
+        """Hold the session open until asked to stop (runs in its own task)."""
+        try:
+            async with self.client.session(server.name) as session:
+                server.session = session
+                server.tools = await load_mcp_tools(session)
+                if self.on_session:
+                    await self.on_session(server.name, session)
+                server.healthy = True
+                ready.set_result(True)
+                await server.stop.wait()
+        except Exception as e:
+            if not ready.done():
+                ready.set_exception(e)
+            server.last_error = str(e)
+        finally:
+            server.healthy = False
+            server.session = None
+
+    async def _disconnect(self, name: str):
+        server = self.servers.get(name)
+        if not server or not server.task:
+            return
+        server.stop.set()
+        try:
+            await server.task
+        except Exception:
+            pass
+
+    async def reconnect(self, name: str) -> bool:
+        """Tear down and reopen a session; cached tools and agents are rebuilt."""
+        lock = self._reconnect_locks.setdefault(name, asyncio.Lock())
+        async with lock:
+            await self._disconnect(name)
+            return await self._connect(name)
+
+    async def health_check(self) -> Dict[str, bool]:
+        """Ping every session, reconnecting the ones that do not answer."""
+        results = {}
+        for name in self.connections:
+            server = self.servers.get(name)
+            ok = False
+            if server and server.healthy and server.session:
+                try:
+                    await asyncio.wait_for(server.session.send_ping(), HEALTH_CHECK_TIMEOUT)
+                    ok = True
+                except Exception as e:
+                    server.last_error = str(e)
+            if not ok:
+                print(f"⚠️  MCP session '{name}' unhealthy, reconnecting...")
+                ok = await self.reconnect(name)
+            results[name] = ok
+        return results
+
+    async def _health_loop(self):
+        while True:
+            try:
+                await asyncio.sleep(self.health_check_interval)
+                await self.health_check()
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                print(f"Error in MCP health check: {e}")
+
+    def session(self, name: str):
+        """Return the live session for a server (None while disconnected)."""
+        server = self.servers.get(name)
+        return server.session if server else None
+
+    def tools(self, servers: Optional[Iterable[str]] = None,
+              names: Optional[Iterable[str]] = None) -> List:
+        """Cached tools of the given servers (all by default), optionally filtered by tool name."""
+        selected = []
+        wanted = set(names) if names is not None else None
+        for server_name in servers or self.connections:
+            server = self.servers.get(server_name)
+            if not server:
+                continue
+            selected.extend(t for t in server.tools if wanted is None or t.name in wanted)
+        return selected
+
+    def get_agent(self, key: Any, factory: Callable[[List], Any],
+                  servers: Optional[Iterable[str]] = None,
+                  names: Optional[Iterable[str]] = None):
+        """
+        Return a cached agent built by factory(tools). The agent is rebuilt when one of
+        its servers has reconnected since it was created.
+        """
+        servers = tuple(servers or self.connections)
+        generations = tuple(self.servers[s].generation if s in self.servers else -1 for s in servers)
+        cached = self._agents.get(key)
+        if cached and cached[0] == generations:
+            return cached[1]
+        agent = factory(self.tools(servers, names))
+        self._agents[key] = (generations, agent)
+        return agent
+
+    def status(self) -> Dict[str, dict]:
+        """Summary of every pooled session (for health endpoints)."""
+        return {
+            name: {
+                "healthy": server.healthy,
+                "tools": len(server.tools),
+                "generation": server.generation,
+                "last_error": server.last_error,
+            }
+            for name, server in self.servers.items()
+        }
@@ -0,0 +1,228 @@
+import copy
+import json
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+import requests
+from requests.adapters import HTTPAdapter
+from flow_utils import new_node_id
+
+
+NODE_RED_URL = os.getenv("NODE_RED_URL", "http://localhost:1880")
+NODE_RED_TOKEN = os.getenv("NODE_RED_TOKEN")
+
+# Fields that identify "the same" node across two generations of a flow when ids differ
+MATCH_FIELDS = ("type", "name", "thing", "property", "action", "event", "tdLink", "func", "topic")
+# Fields that do not change node behaviour (Node-RED does not restart nodes for them either)
+LAYOUT_FIELDS = ("x", "y")
+
+
+class DeployConflict(Exception):
+    """Raised when the flows changed on the server since they were fetched (HTTP 409)."""
+
+
+def tab_of(flow: List[Dict]) -> Optional[Dict]:
+    return next((node for node in flow if node.get("type") == "tab"), None)
+
+
+def split_tab(nodes: List[Dict], tab_id: str) -> Tuple[List[Dict], List[Dict]]:
+    """Split a deployed configuration into (nodes of the tab incl. the tab itself, everything else)."""
+    inside, outside = [], []
+    for node in nodes:
+        (inside if node.get("id") == tab_id or node.get("z") == tab_id else outside).append(node)
+    return inside, outside
+
+
+def rename_ids(flow: List[Dict], mapping: Dict[str, str]) -> List[Dict]:
+    """Apply an old-id -> new-id mapping to ids, tab membership, wires, links and thing references."""
+    if not mapping:
+        return flow
+    renamed = []
+    for node in flow:
+        node = dict(node)
+        for key in ("id", "z", "thing"):
+            if node.get(key) in mapping:
+                node[key] = mapping[node[key]]
+        if "wires" in node:
+            node["wires"] = [[mapping.get(target, target) for target in port] for port in node["wires"]]
+        if "links" in node:
+            node["links"] = [mapping.get(target, target) for target in node["links"]]
+        renamed.append(node)
+    return renamed
+
+
+def align_ids(deployed: List[Dict], generated: List[Dict]) -> List[Dict]:
+    """
+    Reuse deployed node ids for generated nodes that are the same node in a new generation
+    (same type, name, thing and affordance), so a regenerated flow diffs as a small change
+    instead of replacing every node.
+    """
+    deployed_ids = {node["id"] for node in deployed}
+    # Config nodes (consumed-thing) first, so interaction nodes then match on the renamed thing
+    ordered = sorted(generated, key=lambda node: 0 if "z" not in node else 1)
+    mapping: Dict[str, str] = {}
+    used = set(node["id"] for node in generated if node.get("id") in deployed_ids)
+    for node in ordered:
+        if node.get("id") in deployed_ids:
+            continue
+        key = tuple(mapping.get(node.get(f), node.get(f)) if f == "thing" else node.get(f) for f in MATCH_FIELDS)
+        for candidate in deployed:
+            if candidate["id"] in used or candidate.get("type") != node.get("type"):
+                continue
+            if tuple(candidate.get(f) for f in MATCH_FIELDS) == key:
+                mapping[node["id"]] = candidate["id"]
+                used.add(candidate["id"])
+                break
+    return rename_ids(generated, mapping)
+
+
+def _behaviour(node: Dict) -> Dict:
+    return {k: v for k, v in node.items() if k not in LAYOUT_FIELDS}
+
+
+def diff_flow(deployed: List[Dict], generated: List[Dict]) -> Dict[str, List[Dict]]:
+    """Node-level diff by id: added, changed, moved (layout only), removed and unchanged nodes."""
+    before = {node["id"]: node for node in deployed}
+    after = {node["id"]: node for node in generated}
+    diff = {"added": [], "changed": [], "moved": [], "removed": [], "unchanged": []}
+    for node_id, node in after.items():
+        old = before.get(node_id)
+        if old is None:
+            diff["added"].append(node)
+        elif old == node:
+            diff["unchanged"].append(node)
+        elif _behaviour(old) == _behaviour(node):
+            diff["moved"].append(node)
+        else:
+            diff["changed"].append(node)
+    diff["removed"] = [node for node_id, node in before.items() if node_id not in after]
+    return diff
+
+
+class NodeRedDeployer:
+    """
+    Deploys generated flows through the Node-RED Admin API using one pooled HTTP session.
+
+    The Admin API only accepts the complete configuration on POST /flows, so the diff is
+    computed locally: nothing is sent when the tab is unchanged, and otherwise the
+    configuration is deployed with the "nodes" deployment type, which makes Node-RED
+    restart only the nodes that actually changed. The last known revision is cached and
+    sent with the deploy (optimistic concurrency), so a redeploy is a single request
+    unless someone else changed the flows in between.
+    """
+    def __init__(self, base_url: str = NODE_RED_URL, token: Optional[str] = NODE_RED_TOKEN,
+                 pool_size: int = 4, timeout: float = 10.0):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({
+            "Content-Type": "application/json",
+            "Node-RED-API-Version": "v2",
+        })
+        if token:
+            self.session.headers["Authorization"] = f"Bearer {token}"
+        self._rev: Optional[str] = None
+        self._flows: Optional[List[Dict]] = None
+
+    def get_flows(self, refresh: bool = False) -> Tuple[str, List[Dict]]:
+        """Return (rev, nodes) of the deployed configuration, cached after the first call."""
+        if refresh or self._flows is None:
+            response = self.session.get(f"{self.base_url}/flows", timeout=self.timeout)
+            response.raise_for_status()
+            data = response.json()
+            # v1 servers answer with a bare array
+            if isinstance(data, list):
+                data = {"rev": None, "flows": data}
+            self._rev, self._flows = data.get("rev"), data.get("flows", [])
+        return self._rev, self._flows
+
+    def plan(self, flow: List[Dict], refresh: bool = False) -> Dict:
+        """Compute what deploying flow would change, without deploying it."""
+        rev, nodes = self.get_flows(refresh)
+        generated = copy.deepcopy(flow)
+        tab = tab_of(generated)
+        if tab is None:
+            raise ValueError("Generated flow has no tab node")
+
+        # Match the tab by id first, then by label, so regenerating a workflow updates its tab
+        deployed_tab = next((n for n in nodes if n.get("type") == "tab" and n.get("id") == tab["id"]), None) \
+            or next((n for n in nodes if n.get("type") == "tab" and n.get("label") == tab.get("label")), None)
+        if deployed_tab and deployed_tab["id"] != tab["id"]:
+            generated = rename_ids(generated, {tab["id"]: deployed_tab["id"]})
+            tab = tab_of(generated)
+
+        inside, outside = split_tab(nodes, tab["id"])
+        # Config nodes (no z) live outside the tab but are compared with the tab's nodes
+        deployed_config = [n for n in outside if "z" not in n and n.get("type") != "tab"]
+        generated = align_ids(inside + deployed_config, generated)
+        # Generated ids that belong to nodes on other tabs get fresh ids, so deploying never replaces them
+        foreign_ids = {n["id"] for n in outside if "z" in n or n.get("type") == "tab"}
+        renamed = {n["id"]: new_node_id() for n in generated if n["id"] in foreign_ids}
+        generated = rename_ids(generated, renamed)
+
+        generated_ids = {n["id"] for n in generated}
+        diff = diff_flow(inside + [n for n in deployed_config if n["id"] in generated_ids], generated)
+        # Config nodes may be shared with other tabs, so they are never removed here
+        diff["removed"] = [n for n in diff["removed"] if "z" in n or n.get("type") == "tab"]
+
+        removed_ids = {n["id"] for n in diff["removed"]}
+        configuration = [n for n in outside if n["id"] not in generated_ids] + \
+            [n for n in inside if n["id"] not in generated_ids and n["id"] not in removed_ids] + generated
+        return {"rev": rev, "tab": tab["id"], "diff": diff, "renamed": renamed, "flows": configuration}
+
+    def deploy(self, flow: List[Dict], retries: int = 1) -> Dict:
+        """Deploy a generated flow (JSON array of nodes). Returns a summary of the changes."""
+        started = time.perf_counter()
+        refresh = False
+        for attempt in range(retries + 1):
+            plan = self.plan(flow, refresh)
+            diff = plan["diff"]
+            summary = {
+                "tab": plan["tab"],
+                **{kind: len(nodes) for kind, nodes in diff.items()},
+                "renamed": len(plan["renamed"]),
+            }
+            if not (diff["added"] or diff["changed"] or diff["moved"] or diff["removed"]):
+                return {**summary, "deployed": False, "rev": plan["rev"],
+                        "elapsed_ms": (time.perf_counter() - started) * 1000}
+            try:
+                rev = self._post_flows(plan["rev"], plan["flows"])
+            except DeployConflict:
+                if attempt == retries:
+                    raise
+                refresh = True
+                continue
+            self._rev, self._flows = rev, plan["flows"]
+            return {**summary, "deployed": True, "rev": rev,
+                    "elapsed_ms": (time.perf_counter() - started) * 1000}
+
+    def _post_flows(self, rev: Optional[str], flows: List[Dict]) -> Optional[str]:
+        body = {"flows": flows}
+        if rev:
+            body["rev"] = rev
+        response = self.session.post(
+            f"{self.base_url}/flows",
+            data=json.dumps(body),
+            headers={"Node-RED-Deployment-Type": "nodes"},
+            timeout=self.timeout,
+        )
+        if response.status_code == 409:
+            raise DeployConflict(response.text)
+        response.raise_for_status()
+        return response.json().get("rev") if response.content else None
+
+    def close(self):
+        self.session.close()
+
+
+def print_deploy_summary(summary: Dict):
+    if summary["deployed"]:
+        print(f"🚀 Deployed to Node-RED tab {summary['tab']} in {summary['elapsed_ms']:.1f} ms: "
+              f"{summary['added']} added, {summary['changed']} changed, {summary['moved']} moved, "
+              f"{summary['removed']} removed, {summary['unchanged']} unchanged"
+              + (f" ({summary['renamed']} renamed to keep other tabs' node ids)" if summary.get("renamed") else ""))
+    else:
+        print(f"✓ Node-RED tab {summary['tab']} already up to date ({summary['unchanged']} nodes)")
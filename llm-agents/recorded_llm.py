@@ -0,0 +1,87 @@
+import asyncio
+import glob
+import json
+import os
+import random
+import time
+from typing import Any, Dict, List, Optional
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from flow_utils import load_flow_file
+
+
+RECORDED_OUTPUTS_DIR = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '..', 'results', 'llm_outputs')
+)
+
+
+def load_recorded_responses(outputs_dir: str = RECORDED_OUTPUTS_DIR, model: str = "*") -> Dict[str, str]:
+    """
+    Load the recorded generator outputs as {requirement: flow JSON text}.
+    Flows without a recorded requirement are keyed by their file path.
+    """
+    responses = {}
+    for path in sorted(glob.glob(os.path.join(outputs_dir, model, "*", "*"))):
+        for i, (requirement, flow) in enumerate(load_flow_file(path)):
+            if flow is None:
+                continue
+            responses.setdefault(requirement or f"{path}#{i}", json.dumps(flow))
+    return responses
+
+
+class RecordedChatModel(BaseChatModel):
+    """
+    Stand-in chat model that replays recorded flows instead of calling an LLM.
+
+    The last human message is looked up in the recorded requirements; unknown prompts
+    get a recorded flow picked round-robin. latency (+/- jitter) seconds are slept per
+    call to mimic a real provider during load tests. Tool calls are never emitted.
+    """
+    responses: Dict[str, str] = {}
+    latency: float = 0.0
+    jitter: float = 0.0
+    cursor: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "recorded"
+
+    def bind_tools(self, tools: Any, **kwargs: Any):
+        # Recorded answers never call tools, so the model can be used with create_agent
+        return self
+
+    def _pick_response(self, messages: List[BaseMessage]) -> str:
+        if not self.responses:
+            self.responses = load_recorded_responses()
+        prompt = ""
+        for message in reversed(messages):
+            if message.type == "human":
+                prompt = message.content if isinstance(message.content, str) else str(message.content)
+                break
+        if prompt.strip() in self.responses:
+            return self.responses[prompt.strip()]
+        values = list(self.responses.values())
+        response = values[self.cursor % len(values)] if values else "[]"
+        self.cursor += 1
+        return response
+
+    def _delay(self) -> float:
+        return max(0.0, self.latency + random.uniform(-self.jitter, self.jitter))
+
+    def _result(self, text: str) -> ChatResult:
+        message = AIMessage(
+            content=text,
+            usage_metadata={"input_tokens": 0, "output_tokens": len(text) // 4, "total_tokens": len(text) // 4},
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        time.sleep(self._delay())
+        return self._result(self._pick_response(messages))
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(self._delay())
+        return self._result(self._pick_response(messages))
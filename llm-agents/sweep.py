@@ -0,0 +1,325 @@
+import argparse
+import asyncio
+import hashlib
+import importlib.util
+import itertools
+import json
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+from langchain.agents import create_agent
+import utils
+from flow_scoring import load_references, normalize_requirement, score_summaries, summarize_flow
+from flow_utils import extract_flow_json
+from history_compaction import compaction_middleware
+from instrumentation import instrument
+from job_queue import percentile
+from mcp_pool import GENERATION_TOOLS, WOT_MCP_SERVER_URL, McpSessionPool
+from td_discovery import TddClient, load_tds_from_config
+
+
+GENERATORS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "workflow_generators")
+RESULTS_DB = os.getenv("SWEEP_RESULTS_DB", os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '..', 'results', 'sweeps.sqlite')
+))
+# Per-provider limits used when the sweep config does not set them
+DEFAULT_RATE_LIMITS = {
+    "openai": {"concurrency": 4, "rpm": 60},
+    "anthropic": {"concurrency": 2, "rpm": 30},
+    "lmstudio": {"concurrency": 1, "rpm": 0},
+    "recorded": {"concurrency": 32, "rpm": 0},
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_key TEXT PRIMARY KEY,
+    sweep TEXT, model TEXT, provider TEXT, method TEXT, prompt TEXT, system TEXT,
+    requirement TEXT, repeat INTEGER,
+    status TEXT, error TEXT, response TEXT, flow TEXT, parsed INTEGER,
+    latency REAL, input_tokens INTEGER, output_tokens INTEGER, tool_calls INTEGER,
+    score REAL, scores TEXT,
+    started_at REAL, finished_at REAL
+)
+"""
+
+
+def connect(db_path: str) -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+    # One connection per process; WAL lets the provider processes write concurrently
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(SCHEMA)
+    return conn
+
+
+def load_prompt(method: str, variant: str) -> str:
+    """SYSTEM_PROMPT of workflow_generators/<method>/prompts_<variant>.py."""
+    path = os.path.join(GENERATORS_DIR, method, f"prompts_{variant}.py")
+    spec = importlib.util.spec_from_file_location(f"{method}_prompts_{variant}", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.SYSTEM_PROMPT
+
+
+def expand_cells(config: Dict) -> List[Dict]:
+    """Every (model, method, prompt, system, requirement, repeat) combination of a sweep config."""
+    cells = []
+    for model, method, prompt, (system_name, system) in itertools.product(
+        config["models"], config.get("methods", ["vanilla"]), config.get("prompts", ["without_node_wot"]),
+        config["systems"].items(),
+    ):
+        for requirement, repeat in itertools.product(system["requirements"], range(config.get("repeats", 1))):
+            key = "|".join([config["name"], model, method, prompt, system_name, str(repeat),
+                            hashlib.sha1(requirement.encode("utf-8")).hexdigest()[:12]])
+            cells.append({
+                "run_key": key, "model": model, "provider": utils.split_model_spec(model)[0],
+                "method": method, "prompt": prompt, "system": system_name,
+                "requirement": requirement, "repeat": repeat,
+            })
+    return cells
+
+
+class RateLimiter:
+    """At most `concurrency` calls in flight and (if rpm > 0) at most rpm call starts per minute."""
+    def __init__(self, concurrency: int = 1, rpm: int = 0):
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._interval = 60.0 / rpm if rpm else 0.0
+        self._next_start = 0.0
+        self._lock = asyncio.Lock()
+
+    async def __aenter__(self):
+        await self._semaphore.acquire()
+        if self._interval:
+            async with self._lock:
+                delay = self._next_start - time.monotonic()
+                self._next_start = max(self._next_start, time.monotonic()) + self._interval
+            if delay > 0:
+                await asyncio.sleep(delay)
+        return self
+
+    async def __aexit__(self, *exc):
+        self._semaphore.release()
+
+
+def usage_from(messages: List) -> Dict[str, int]:
+    usage = {"input_tokens": 0, "output_tokens": 0, "tool_calls": 0}
+    for message in messages:
+        metadata = getattr(message, "usage_metadata", None) or {}
+        usage["input_tokens"] += metadata.get("input_tokens", 0)
+        usage["output_tokens"] += metadata.get("output_tokens", 0)
+        usage["tool_calls"] += len(getattr(message, "tool_calls", None) or [])
+    return usage
+
+
+class ProviderRunner:
+    """Runs the cells of one provider inside one process (one event loop, one rate limiter)."""
+    def __init__(self, config: Dict, db_path: str, provider: str):
+        self.config = config
+        self.conn = connect(db_path)
+        limits = {**DEFAULT_RATE_LIMITS.get(provider, {"concurrency": 2, "rpm": 0}),
+                  **config.get("rate_limits", {}).get(provider, {})}
+        self.limiter = RateLimiter(limits["concurrency"], limits["rpm"])
+        self.agents: Dict[tuple, object] = {}
+        self._agents_lock = asyncio.Lock()
+        self.references: Dict[str, Dict] = {}
+        self.pools: Dict[str, McpSessionPool] = {}
+        self._tds: Dict[str, List[Dict]] = {}
+
+    def tds_for(self, system_name: str) -> List[Dict]:
+        if system_name not in self._tds:
+            system = self.config["systems"][system_name]
+            if system.get("tdd_url"):
+                self._tds[system_name] = TddClient(system["tdd_url"]).bootstrap()
+            elif system.get("things_config"):
+                self._tds[system_name] = load_tds_from_config(system["things_config"])
+            else:
+                self._tds[system_name] = []
+        return self._tds[system_name]
+
+    async def agent_for(self, cell: Dict):
+        """Agent of a cell's configuration, built once per (model, method, prompt, system)."""
+        key = (cell["model"], cell["method"], cell["prompt"], cell["system"])
+        async with self._agents_lock:
+            if cell["method"] == "mcp":
+                # Cached by the pool, which rebuilds it after a reconnect
+                return await self._mcp_agent(cell, key)
+            if key not in self.agents:
+                self.agents[key] = await self._build_agent(cell)
+        return self.agents[key]
+
+    async def _mcp_agent(self, cell: Dict, key: tuple):
+        system = self.config["systems"][cell["system"]]
+        if cell["system"] not in self.pools:
+            pool = McpSessionPool({"wot": {"transport": "streamable_http",
+                                           "url": system.get("mcp_url", WOT_MCP_SERVER_URL)}})
+            await pool.start()
+            self.pools[cell["system"]] = pool
+        pool = self.pools[cell["system"]]
+        server = pool.servers.get("wot")
+        # Without the session the agent would have no tools; fail the cell instead of scoring a tool-less run
+        if not (server and server.healthy) and not await pool.reconnect("wot"):
+            raise RuntimeError(f"WoT MCP session for '{cell['system']}' unavailable: "
+                               f"{pool.servers['wot'].last_error if 'wot' in pool.servers else 'not connected'}")
+        system_prompt = load_prompt(cell["method"], cell["prompt"])
+        return pool.get_agent(key, lambda tools: instrument(create_agent(
+            model=utils.create_chat_model(cell["model"]), tools=tools, system_prompt=system_prompt,
+            middleware=compaction_middleware(reset_per_request=True),
+        ), "sweep", system=cell["system"]), servers=["wot"], names=GENERATION_TOOLS)
+
+    async def _build_agent(self, cell: Dict):
+        model = utils.create_chat_model(cell["model"])
+        system_prompt = load_prompt(cell["method"], cell["prompt"])
+        tds = await asyncio.to_thread(self.tds_for, cell["system"])
+        system_prompt = system_prompt.replace("{ALL_TDS}", json.dumps(tds, indent=2))
+        return instrument(create_agent(model=model, tools=[], system_prompt=system_prompt),
+                          "sweep", system=cell["system"])
+
+    def reference_for(self, cell: Dict) -> Optional[Dict]:
+        path = self.config["systems"][cell["system"]].get("reference")
+        if not path:
+            return None
+        if path not in self.references:
+            self.references[path] = load_references(path)
+        return self.references[path].get(normalize_requirement(cell["requirement"]))
+
+    async def run_cell(self, cell: Dict):
+        async with self.limiter:
+            started = time.time()
+            record = {**cell, "sweep": self.config["name"], "started_at": started}
+            try:
+                agent = await self.agent_for(cell)
+                response = await agent.ainvoke(
+                    {"messages": [{"role": "user", "content": cell["requirement"]}]},
+                    {"configurable": {"thread_id": cell["run_key"]}},
+                )
+                messages = response.get("messages", [])
+                text = messages[-1].content if messages else ""
+                if isinstance(text, list):
+                    text = "\n".join(p.get("text", "") if isinstance(p, dict) else str(p) for p in text)
+                flow = extract_flow_json(text)
+                record.update(usage_from(messages), status="completed", response=text,
+                              flow=json.dumps(flow) if flow is not None else None, parsed=flow is not None)
+                reference = self.reference_for(cell)
+                if reference is not None:
+                    scores = score_summaries(reference, summarize_flow(flow)) if flow is not None else {"overall": 0.0}
+                    record.update(score=scores["overall"], scores=json.dumps(scores))
+            except Exception as e:
+                record.update(status="failed", error=f"{type(e).__name__}: {e}")
+            record["finished_at"] = time.time()
+            record["latency"] = record["finished_at"] - started
+            self.save(record)
+            symbol = "✓" if record["status"] == "completed" else "❌"
+            print(f"{symbol} {cell['model']} {cell['method']}/{cell['prompt']} {cell['system']}: "
+                  f"{cell['requirement'][:50]} ({record['latency']:.1f}s)")
+
+    def save(self, record: Dict):
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(runs)")]
+        values = {c: record.get(c) for c in columns}
+        self.conn.execute(
+            f"INSERT OR REPLACE INTO runs ({', '.join(values)}) VALUES ({', '.join('?' * len(values))})",
+            list(values.values()),
+        )
+        self.conn.commit()
+
+    async def run(self, cells: List[Dict]):
+        try:
+            await asyncio.gather(*(self.run_cell(cell) for cell in cells))
+        finally:
+            for pool in self.pools.values():
+                await pool.close()
+            self.conn.close()
+
+
+def run_provider(config: Dict, db_path: str, provider: str, cells: List[Dict]) -> int:
+    """Process entry point: run one provider's cells. Returns the number of cells run."""
+    asyncio.run(ProviderRunner(config, db_path, provider).run(cells))
+    return len(cells)
+
+
+def run_sweep(config: Dict, db_path: str = RESULTS_DB, retry_failed: bool = True):
+    """Run the missing cells of a sweep, one process per provider."""
+    conn = connect(db_path)
+    skip_status = ("completed",) if retry_failed else ("completed", "failed")
+    done = {row[0] for row in conn.execute(
+        f"SELECT run_key FROM runs WHERE status IN ({', '.join('?' * len(skip_status))})", skip_status
+    )}
+    conn.close()
+
+    cells = [cell for cell in expand_cells(config) if cell["run_key"] not in done]
+    by_provider: Dict[str, List[Dict]] = {}
+    for cell in cells:
+        by_provider.setdefault(cell["provider"], []).append(cell)
+    print(f"🚀 Sweep '{config['name']}': {len(cells)} runs to do ({len(done)} already done), "
+          f"providers: {', '.join(f'{p}={len(c)}' for p, c in by_provider.items()) or '-'}")
+    if not cells:
+        return
+
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=len(by_provider)) as pool:
+        futures = [pool.submit(run_provider, config, db_path, provider, provider_cells)
+                   for provider, provider_cells in by_provider.items()]
+        for future in futures:
+            future.result()
+    print(f"✓ Sweep finished in {time.perf_counter() - started:.1f}s")
+
+
+def summarize(db_path: str = RESULTS_DB, sweep: Optional[str] = None) -> List[Dict]:
+    """Aggregate metrics per (model, method, prompt, system)."""
+    conn = connect(db_path)
+    query = "SELECT model, method, prompt, system, status, parsed, latency, input_tokens, output_tokens, score FROM runs"
+    rows = conn.execute(query + (" WHERE sweep = ?" if sweep else ""), (sweep,) if sweep else ()).fetchall()
+    conn.close()
+
+    groups: Dict[tuple, List[tuple]] = {}
+    for row in rows:
+        groups.setdefault(row[:4], []).append(row[4:])
+    summary = []
+    for (model, method, prompt, system), runs in sorted(groups.items()):
+        completed = [r for r in runs if r[0] == "completed"]
+        latencies = [r[2] for r in completed]
+        scores = [r[5] for r in completed if r[5] is not None]
+        summary.append({
+            "model": model, "method": method, "prompt": prompt, "system": system,
+            "runs": len(runs), "failed": len(runs) - len(completed),
+            "parse_rate": sum(1 for r in completed if r[1]) / len(completed) if completed else 0.0,
+            "score": sum(scores) / len(scores) if scores else None,
+            "latency_p50": percentile(latencies, 50), "latency_p95": percentile(latencies, 95),
+            "tokens": sum((r[3] or 0) + (r[4] or 0) for r in completed),
+        })
+    return summary
+
+
+def print_summary(summary: List[Dict]):
+    for row in summary:
+        score = f"{row['score']:.2f}" if row["score"] is not None else "-"
+        p50 = f"{row['latency_p50']:.1f}s" if row["latency_p50"] is not None else "-"
+        print(f"  {row['model']:<32} {row['method']:<8} {row['prompt']:<17} {row['system']:<20} "
+              f"runs={row['runs']:<4} failed={row['failed']:<3} parsed={row['parse_rate']:.0%} "
+              f"score={score} p50={p50} tokens={row['tokens']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run model x prompt x system sweeps of the workflow generators")
+    parser.add_argument("--db", default=RESULTS_DB, help="SQLite results store")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run = commands.add_parser("run", help="Run (or resume) a sweep")
+    run.add_argument("config", help="Sweep config JSON (see sweep_example.json)")
+    run.add_argument("--no-retry-failed", action="store_true", help="Do not rerun failed cells when resuming")
+    report = commands.add_parser("summary", help="Print per-configuration metrics")
+    report.add_argument("--sweep", help="Only this sweep name")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        with open(args.config, "r", encoding="utf-8") as f:
+            config = json.load(f)
+        config.setdefault("name", os.path.splitext(os.path.basename(args.config))[0])
+        run_sweep(config, args.db, retry_failed=not args.no_retry_failed)
+        print_summary(summarize(args.db, config["name"]))
+    else:
+        print_summary(summarize(args.db, args.sweep))
+
+
+if __name__ == "__main__":
+    main()
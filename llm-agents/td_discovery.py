@@ -0,0 +1,136 @@
+import asyncio
+import hashlib
+import json
+import os
+from typing import Callable, Dict, List, Optional
+import requests
+
+
+TDD_URL = os.getenv("TDD_URL", "http://localhost:8101/things")
+TDD_POLL_INTERVAL = float(os.getenv("TDD_POLL_INTERVAL", "5"))
+
+
+def td_key(td: Dict) -> str:
+    """Stable catalogue key of a TD: its id, falling back to the title."""
+    return td.get("id") or td.get("title") or td.get("deviceName") or json.dumps(td, sort_keys=True)
+
+
+def td_fingerprint(td: Dict) -> str:
+    return hashlib.sha1(json.dumps(td, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def load_tds_from_config(config_path: str) -> List[Dict]:
+    """Fetch every TD listed in a things-config.json (one GET per device)."""
+    tds = []
+    with open(config_path, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    for thing in config.get("things", []):
+        url = thing.get("url")
+        if url:
+            try:
+                resp = requests.get(url)
+                resp.raise_for_status()
+                tds.append(resp.json())
+            except Exception as e:
+                print(f"❌ Failed to fetch TD from {url}: {e}")
+    return tds
+
+
+class ThingCatalog:
+    """Device catalogue keyed by TD id, updated incrementally from directory listings."""
+    def __init__(self):
+        self.tds: Dict[str, Dict] = {}
+        self._fingerprints: Dict[str, str] = {}
+
+    def apply(self, tds: List[Dict]) -> Dict[str, List[str]]:
+        """Replace the catalogue with a new listing. Returns the added/changed/removed keys."""
+        changes = {"added": [], "changed": [], "removed": []}
+        seen = set()
+        for td in tds:
+            key, fingerprint = td_key(td), td_fingerprint(td)
+            seen.add(key)
+            if key not in self._fingerprints:
+                changes["added"].append(key)
+            elif self._fingerprints[key] != fingerprint:
+                changes["changed"].append(key)
+            else:
+                continue
+            self.tds[key] = td
+            self._fingerprints[key] = fingerprint
+        for key in [key for key in self.tds if key not in seen]:
+            del self.tds[key]
+            del self._fingerprints[key]
+            changes["removed"].append(key)
+        return changes
+
+    def list(self) -> List[Dict]:
+        return list(self.tds.values())
+
+    def __len__(self):
+        return len(self.tds)
+
+
+class TddClient:
+    """
+    Discovers Thing Descriptions from a Thing Description Directory (GET /things).
+
+    The whole catalogue comes from one bulk request. Polling sends the last ETag as
+    If-None-Match, so an unchanged directory answers 304 without a body; for directories
+    without ETags, the response body hash is compared before anything is parsed.
+    """
+    def __init__(self, url: str = TDD_URL, timeout: float = 10.0):
+        self.url = url
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.catalog = ThingCatalog()
+        self.revision: Optional[str] = None
+
+    def _fetch(self) -> Optional[List[Dict]]:
+        """Fetch the TD listing, or None if the directory has not changed since the last fetch."""
+        headers = {"If-None-Match": self.revision} if self.revision else {}
+        response = self.session.get(self.url, headers=headers, timeout=self.timeout)
+        if response.status_code == 304:
+            return None
+        response.raise_for_status()
+        revision = response.headers.get("ETag") or hashlib.sha1(response.content).hexdigest()
+        if revision == self.revision:
+            return None
+        self.revision = revision
+        data = response.json()
+        # The simulated TDDs answer {"things": [...]}, W3C directories a bare array
+        return data.get("things", []) if isinstance(data, dict) else data
+
+    def bootstrap(self) -> List[Dict]:
+        """Load the full catalogue in one request."""
+        self.revision = None
+        tds = self._fetch()
+        self.catalog.apply(tds or [])
+        return self.catalog.list()
+
+    def poll(self) -> Dict[str, List[str]]:
+        """Check the directory once. Returns the catalogue changes (empty lists if none)."""
+        tds = self._fetch()
+        if tds is None:
+            return {"added": [], "changed": [], "removed": []}
+        return self.catalog.apply(tds)
+
+    async def watch(self, on_change: Callable[[Dict[str, List[str]]], None],
+                    interval: float = TDD_POLL_INTERVAL):
+        """Poll forever, calling on_change whenever the catalogue changed."""
+        while True:
+            try:
+                changes = await asyncio.to_thread(self.poll)
+                if any(changes.values()):
+                    on_change(changes)
+            except requests.RequestException as e:
+                print(f"⚠️  TDD poll failed: {e}")
+            await asyncio.sleep(interval)
+
+    def close(self):
+        self.session.close()
+
+
+def print_catalog_changes(changes: Dict[str, List[str]]):
+    for kind, symbol in (("added", "+"), ("changed", "~"), ("removed", "-")):
+        for key in changes.get(kind, []):
+            print(f"  {symbol} {key}")
@@ -0,0 +1,208 @@
+import asyncio
+import json
+import os
+import re
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+from langchain_core.tools import StructuredTool
+
+
+# Seconds a device list / TD fetched from the WoT MCP server is reused
+DISCOVERY_CACHE_TTL = float(os.getenv("DISCOVERY_CACHE_TTL", "30"))
+# Up to this many devices every TD is prefetched; larger fleets only prefetch devices matching the request
+PREFETCH_MAX_DEVICES = int(os.getenv("PREFETCH_MAX_DEVICES", "32"))
+PREFETCH_FORMAT = "affordances"
+
+# Requirement of the request being served: one cache is shared by concurrent requests, and
+# the agent's tool calls run in tasks that inherit the context preamble() set it in
+_requirement: ContextVar[str] = ContextVar("discovery_requirement", default="")
+
+
+def tool_text(content: Any) -> str:
+    """Text of an MCP tool result (a string or a list of content blocks)."""
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "\n".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
+    return str(content)
+
+
+def _words(text: str) -> set:
+    # Split camelCase and snake_case so "mainRoomLight" matches "main room light"
+    text = re.sub(r"([a-z])([A-Z])", r"\1 \2", text)
+    return {word for word in re.findall(r"[a-z0-9]+", text.lower()) if len(word) > 2}
+
+
+def relevant_devices(devices: List[Dict], requirement: str) -> List[str]:
+    """Ids of devices whose title or affordance names share a word with the requirement."""
+    wanted = _words(requirement)
+    relevant = []
+    for device in devices:
+        names = [device.get("title", "")] + [name for kind in ("properties", "actions", "events")
+                                             for name in device.get(kind, [])]
+        if wanted & _words(" ".join(names)):
+            relevant.append(device["id"])
+    return relevant
+
+
+class DiscoveryCache:
+    """
+    Read-through cache in front of the WoT MCP discovery tools of one session.
+
+    Wrapped tools keep the names and schemas of the originals, so the agent does not notice:
+    - TD lookups that arrive in the same event-loop tick (parallel tool calls of one model
+      step) are coalesced into one get_thing_descriptions call;
+    - once the device list is known, the TDs the request is likely to need are fetched in
+      the background, so the model's own lookups are answered from memory;
+    - preamble() runs list_devices before the first model call, saving that round trip.
+    """
+    def __init__(self, tools: List, ttl: float = DISCOVERY_CACHE_TTL,
+                 prefetch_max_devices: int = PREFETCH_MAX_DEVICES):
+        self.originals = {tool.name: tool for tool in tools}
+        self.ttl = ttl
+        self.prefetch_max_devices = prefetch_max_devices
+        self._devices: Dict[str, tuple] = {}
+        self._tds: Dict[tuple, tuple] = {}
+        self._pending: Dict[str, List[str]] = {}
+        self._tasks: set = set()
+        self.stats = {"tool_calls": 0, "cache_hits": 0, "prefetched": 0}
+
+    def _fresh(self, entry: Optional[tuple]) -> bool:
+        return entry is not None and time.monotonic() - entry[0] < self.ttl
+
+    async def list_devices(self, format: str = "minified") -> str:
+        entry = self._devices.get(format)
+        if self._fresh(entry):
+            self.stats["cache_hits"] += 1
+            return entry[1]
+        self.stats["tool_calls"] += 1
+        text = tool_text(await self.originals["list_devices"].ainvoke({"format": format}))
+        self._devices[format] = (time.monotonic(), text)
+        return text
+
+    def devices(self) -> List[Dict]:
+        """Parsed device list of the most recent list_devices call (empty if unknown)."""
+        for _, text in sorted(self._devices.values(), reverse=True, key=lambda entry: entry[0]):
+            try:
+                return json.loads(text)
+            except json.JSONDecodeError:
+                continue
+        return []
+
+    def descriptions(self, device_ids: List[str], format: str = PREFETCH_FORMAT) -> List[asyncio.Future]:
+        """Futures for the TDs of the given devices; misses are fetched in one batched call."""
+        loop = asyncio.get_running_loop()
+        futures = []
+        for device_id in device_ids:
+            entry = self._tds.get((device_id, format))
+            if self._fresh(entry) and not (entry[1].done() and entry[1].exception()):
+                self.stats["cache_hits"] += 1
+            else:
+                entry = (time.monotonic(), loop.create_future())
+                self._tds[(device_id, format)] = entry
+                if not self._pending:
+                    loop.call_soon(self._flush)
+                self._pending.setdefault(format, []).append(device_id)
+            futures.append(entry[1])
+        return futures
+
+    def _flush(self):
+        pending, self._pending = self._pending, {}
+        for format, device_ids in pending.items():
+            task = asyncio.ensure_future(self._fetch(device_ids, format))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _fetch(self, device_ids: List[str], format: str):
+        futures = {device_id: self._tds[(device_id, format)][1] for device_id in device_ids}
+        try:
+            if "get_thing_descriptions" in self.originals:
+                self.stats["tool_calls"] += 1
+                text = tool_text(await self.originals["get_thing_descriptions"].ainvoke(
+                    {"device_ids": device_ids, "format": format}))
+                results = json.loads(text)
+            else:
+                self.stats["tool_calls"] += len(device_ids)
+                texts = await asyncio.gather(*(self.originals["get_thing_description"].ainvoke(
+                    {"device_id": device_id, "format": format}) for device_id in device_ids))
+                results = {device_id: json.loads(tool_text(text)) for device_id, text in zip(device_ids, texts)}
+        except Exception as e:
+            for future in futures.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+        errors = results.pop("errors", {}) if isinstance(results, dict) else {}
+        for device_id, future in futures.items():
+            if future.done():
+                continue
+            if device_id in results:
+                future.set_result(results[device_id])
+            else:
+                future.set_exception(LookupError(errors.get(device_id, f"Device '{device_id}' not found.")))
+
+    def prefetch(self, requirement: str = ""):
+        """Start fetching the TDs this request is likely to need (all of them for small fleets)."""
+        devices = self.devices()
+        if not devices or not ({"get_thing_descriptions", "get_thing_description"} & set(self.originals)):
+            return
+        if len(devices) <= self.prefetch_max_devices:
+            device_ids = [device["id"] for device in devices]
+        else:
+            device_ids = relevant_devices(devices, requirement)[:self.prefetch_max_devices]
+        for future in self.descriptions(device_ids):
+            # Errors surface when the model asks for the TD; don't log them as unretrieved
+            future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self.stats["prefetched"] += len(device_ids)
+
+    async def preamble(self, requirement: str) -> str:
+        """Device list for the first user message, with TD prefetching started."""
+        if "list_devices" not in self.originals:
+            return ""
+        try:
+            devices = await self.list_devices("minified")
+        except Exception as e:
+            print(f"⚠️  Device discovery failed, leaving it to the agent: {e}")
+            return ""
+        _requirement.set(requirement)
+        self.prefetch(requirement)
+        return f'list_devices (format "minified") was already called; result:\n{devices}\n\n'
+
+    async def _get_thing_descriptions(self, device_ids: List[str], format: str = "full") -> str:
+        results = await asyncio.gather(*self.descriptions(device_ids, format), return_exceptions=True)
+        descriptions = {i: r for i, r in zip(device_ids, results) if not isinstance(r, Exception)}
+        errors = {i: str(r) for i, r in zip(device_ids, results) if isinstance(r, Exception)}
+        if not descriptions:
+            return f"Error: {json.dumps(errors)}"
+        return json.dumps({**descriptions, "errors": errors} if errors else descriptions, separators=(",", ":"))
+
+    async def _get_thing_description(self, device_id: str, format: str = "full") -> str:
+        try:
+            return json.dumps(await self.descriptions([device_id], format)[0], separators=(",", ":"))
+        except Exception as e:
+            return f"Error: {e}"
+
+    async def _list_devices(self, format: str = "full") -> str:
+        text = await self.list_devices(format)
+        self.prefetch(_requirement.get())
+        return text
+
+    def wrap(self) -> List:
+        """The discovery tools, served through this cache (other tools are passed through)."""
+        handlers = {
+            "list_devices": self._list_devices,
+            "get_thing_descriptions": self._get_thing_descriptions,
+            "get_thing_description": self._get_thing_description,
+        }
+        tools = []
+        for name, tool in self.originals.items():
+            if name not in handlers:
+                tools.append(tool)
+                continue
+            tools.append(StructuredTool.from_function(
+                coroutine=handlers[name],
+                name=name,
+                description=tool.description,
+                args_schema=tool.args_schema,
+            ))
+        return tools
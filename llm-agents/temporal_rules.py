@@ -0,0 +1,423 @@
+import itertools
+import json
+import os
+import time
+from bisect import bisect_left, bisect_right
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+
+# Seconds of event history kept for window queries
+RULE_HISTORY_RETENTION = float(os.getenv("RULE_HISTORY_RETENTION", str(24 * 3600)))
+# Events kept per event type, whatever their age
+RULE_HISTORY_MAX_EVENTS = int(os.getenv("RULE_HISTORY_MAX_EVENTS", "10000"))
+# Timer wheel: resolution (seconds) and slots per turn
+TIMER_TICK = 1.0
+TIMER_SLOTS = 3600
+# Seconds between re-checks of an absence whose condition did not hold at its deadline
+ABSENCE_RECHECK = float(os.getenv("ABSENCE_RECHECK", "60"))
+
+TRIGGERS = ("event", "absent", "at", "every")
+CONDITIONS = ("seen", "absent", "time_between", "all", "any", "not")
+
+RULE_PROMPT = """
+Translate the automation rule given by the user into a JSON rule that a local engine can evaluate without you.
+The device events that can occur are:
+{EVENTS}
+
+A rule has a "trigger" (when to check) and an optional condition "when" (what must hold at that moment):
+- triggers: {"event": "EVENT"} on every occurrence of EVENT; {"absent": "EVENT", "for": SECONDS} once EVENT has not occurred for SECONDS; {"at": "HH:MM"} every day at that local time; {"every": SECONDS}
+- conditions: {"seen": "EVENT", "within": SECONDS, "at_least": COUNT} EVENT occurred at least COUNT (default 1) times in the last SECONDS; {"absent": "EVENT", "for": SECONDS}; {"time_between": ["HH:MM", "HH:MM"]} local time of day, may wrap past midnight; {"all": [CONDITIONS]}; {"any": [CONDITIONS]}; {"not": CONDITION}
+
+Example: "If no motion is detected between 11 PM and 6 AM, dim the lights" ->
+{"trigger": {"absent": "motionDetected", "for": 1800}, "when": {"time_between": ["23:00", "06:00"]}, "actions": "dim the lights"}
+
+"actions" restates, in words, what has to be done when the rule fires. Use event names exactly as listed;
+an event that several devices emit can be limited to one of them as "DEVICE/EVENT".
+If the rule's condition cannot be expressed this way, return {"trigger": null}.
+Return ONLY the JSON object. No explanations.
+"""
+
+
+class RuleError(Exception):
+    """Raised for rules with unknown triggers, conditions or malformed times."""
+
+
+def parse_clock(text: str) -> int:
+    """Minutes after midnight of "HH:MM"."""
+    try:
+        hours, minutes = (int(part) for part in str(text).split(":"))
+    except ValueError:
+        raise RuleError(f"Bad time of day '{text}' (expected HH:MM)")
+    if not (0 <= hours < 24 and 0 <= minutes < 60):
+        raise RuleError(f"Bad time of day '{text}' (expected HH:MM)")
+    return hours * 60 + minutes
+
+
+def minute_of_day(now: float) -> int:
+    local = time.localtime(now)
+    return local.tm_hour * 60 + local.tm_min
+
+
+def next_clock(clock: str, now: float) -> float:
+    """Timestamp of the next local HH:MM after now."""
+    minutes = parse_clock(clock)
+    local = time.localtime(now)
+    for day in range(3):
+        # mktime normalizes day overflow (Jan 32 -> Feb 1) and DST changes
+        at = time.mktime((local.tm_year, local.tm_mon, local.tm_mday + day, minutes // 60, minutes % 60, 0, 0, 0, -1))
+        if at > now:
+            return at
+    raise RuleError(f"No next occurrence of {clock}")
+
+
+class EventHistory:
+    """
+    Timestamps (and payloads) of recent events, per event type, in arrival order.
+
+    Window queries are two binary searches, so counts, last-seen and absence checks cost
+    microseconds however many events are stored. Events older than `retention` seconds are
+    dropped as new ones arrive.
+    """
+    def __init__(self, retention: float = RULE_HISTORY_RETENTION, max_events: int = RULE_HISTORY_MAX_EVENTS):
+        self.retention = retention
+        self.max_events = max_events
+        self._times: Dict[str, List[float]] = {}
+        self._data: Dict[str, List[Any]] = {}
+
+    def record(self, key: str, at: Optional[float] = None, data: Any = None):
+        at = time.time() if at is None else at
+        times = self._times.setdefault(key, [])
+        values = self._data.setdefault(key, [])
+        if times and at < times[-1]:
+            index = bisect_right(times, at)
+            times.insert(index, at)
+            values.insert(index, data)
+        else:
+            times.append(at)
+            values.append(data)
+        drop = max(bisect_left(times, at - self.retention), len(times) - self.max_events)
+        # Trim in chunks, so appends stay amortized O(1)
+        if drop > 0 and (drop >= 1024 or drop * 2 >= len(times)):
+            del times[:drop]
+            del values[:drop]
+
+    def count(self, key: str, since: float, until: Optional[float] = None) -> int:
+        """Events of `key` in [since, until]."""
+        times = self._times.get(key, [])
+        end = len(times) if until is None else bisect_right(times, until)
+        return max(0, end - bisect_left(times, since))
+
+    def last_seen(self, key: str, before: Optional[float] = None) -> Optional[float]:
+        times = self._times.get(key, [])
+        index = len(times) if before is None else bisect_right(times, before)
+        return times[index - 1] if index else None
+
+    def last_data(self, key: str) -> Any:
+        values = self._data.get(key)
+        return values[-1] if values else None
+
+    def keys(self) -> List[str]:
+        return list(self._times)
+
+
+class TimerWheel:
+    """
+    Hashed timer wheel: timers are kept in `slots` buckets of `tick` seconds, so scheduling
+    and cancelling are O(1) and advance() only visits the buckets that elapsed. Timers more
+    than one turn ahead wait in their bucket until their turn comes.
+    """
+    def __init__(self, tick: float = TIMER_TICK, slots: int = TIMER_SLOTS, now: Optional[float] = None):
+        self.tick = tick
+        self.slots = slots
+        self.current = int((time.time() if now is None else now) // tick)
+        self._buckets: List[Dict[int, Tuple[int, float, Callable]]] = [{} for _ in range(slots)]
+        self._where: Dict[int, int] = {}
+        self._ids = itertools.count(1)
+
+    def schedule(self, at: float, callback: Callable[[float], None]) -> int:
+        """Call callback(at) once advance() reaches `at` (at the next advance if it is past)."""
+        tick = max(int(-(-at // self.tick)), self.current + 1)
+        timer_id = next(self._ids)
+        slot = tick % self.slots
+        self._buckets[slot][timer_id] = (tick, at, callback)
+        self._where[timer_id] = slot
+        return timer_id
+
+    def cancel(self, timer_id: Optional[int]):
+        slot = self._where.pop(timer_id, None)
+        if slot is not None:
+            self._buckets[slot].pop(timer_id, None)
+
+    def __len__(self) -> int:
+        return len(self._where)
+
+    def advance(self, now: Optional[float] = None) -> int:
+        """Fire every timer due by `now`, in time order; returns how many fired."""
+        target = int((time.time() if now is None else now) // self.tick)
+        due = []
+        for tick in range(self.current + 1, min(target, self.current + self.slots) + 1):
+            bucket = self._buckets[tick % self.slots]
+            for timer_id, (timer_tick, at, callback) in list(bucket.items()):
+                if timer_tick <= target:
+                    del bucket[timer_id]
+                    del self._where[timer_id]
+                    due.append((at, timer_id, callback))
+        self.current = max(self.current, target)
+        for at, _, callback in sorted(due, key=lambda entry: entry[:2]):
+            callback(at)
+        return len(due)
+
+
+def check_rule(rule: Dict) -> List[str]:
+    """Problems that prevent evaluating the rule locally (empty if it can be)."""
+    problems = []
+    trigger = rule.get("trigger")
+    if not isinstance(trigger, dict) or not set(trigger) & set(TRIGGERS):
+        return [f"unknown trigger {trigger!r}"]
+    if "absent" in trigger and not isinstance(trigger.get("for"), (int, float)):
+        problems.append('an "absent" trigger needs "for" seconds')
+    if "every" in trigger and not (isinstance(trigger["every"], (int, float)) and trigger["every"] > 0):
+        problems.append('"every" needs a positive number of seconds')
+    if "at" in trigger:
+        try:
+            parse_clock(trigger["at"])
+        except RuleError as e:
+            problems.append(str(e))
+    if rule.get("when") is not None:
+        problems.extend(_check_condition(rule["when"]))
+    return problems
+
+
+def _check_condition(condition: Any) -> List[str]:
+    if not isinstance(condition, dict) or len(set(condition) & set(CONDITIONS)) != 1:
+        return [f"unknown condition {condition!r}"]
+    if "all" in condition or "any" in condition:
+        parts = condition.get("all", condition.get("any"))
+        if not isinstance(parts, list):
+            return [f"{condition!r} needs a list"]
+        return [problem for part in parts for problem in _check_condition(part)]
+    if "not" in condition:
+        return _check_condition(condition["not"])
+    if "time_between" in condition:
+        window = condition["time_between"]
+        if not (isinstance(window, list) and len(window) == 2):
+            return ['"time_between" needs ["HH:MM", "HH:MM"]']
+        try:
+            [parse_clock(clock) for clock in window]
+        except RuleError as e:
+            return [str(e)]
+        return []
+    seconds = condition.get("within" if "seen" in condition else "for")
+    if not isinstance(seconds, (int, float)):
+        return [f"{condition!r} needs a number of seconds"]
+    return []
+
+
+def extract_rule(text: str) -> Optional[Dict]:
+    """Find the rule object (with "trigger") in a model response."""
+    decoder = json.JSONDecoder()
+    start = text.find("{")
+    while start >= 0:
+        try:
+            value, _ = decoder.raw_decode(text, start)
+            if isinstance(value, dict) and "trigger" in value:
+                return value
+        except json.JSONDecodeError:
+            pass
+        start = text.find("{", start + 1)
+    return None
+
+
+class TemporalRuleEngine:
+    """
+    Evaluates time-windowed automation rules in-process.
+
+    Events are recorded in an EventHistory under their name, and under "thing/name" too when
+    a rule mentions that Thing-qualified key; timers (daily times, periodic checks and
+    absence deadlines) live on a TimerWheel driven by advance(). When a rule's trigger
+    occurs and its condition holds, on_fire(rule, facts) is called, where facts hold the
+    trigger time, the last occurrence of every event the rule mentions and the last payload
+    of the triggering event.
+    """
+    def __init__(self, history: Optional[EventHistory] = None, wheel: Optional[TimerWheel] = None,
+                 now: Optional[float] = None):
+        self.history = history or EventHistory()
+        self.wheel = wheel or TimerWheel(now=now)
+        self.rules: List[Dict] = []
+        # Rules triggered (or re-armed) by each event key, so an event only visits its own rules
+        self._by_key: Dict[str, List[Dict]] = {}
+        # Thing-qualified keys ("livingroom/motionDetected") some rule mentions
+        self.qualified: Set[str] = set()
+        self._absence_timers: Dict[int, int] = {}
+        self.stats = {"events": 0, "evaluations": 0, "fired": 0}
+
+    def add_rule(self, rule: Dict, on_fire: Callable[[Dict, Dict], None], now: Optional[float] = None) -> Dict:
+        problems = check_rule(rule)
+        if problems:
+            raise RuleError("; ".join(problems))
+        now = time.time() if now is None else now
+        entry = {"rule": rule, "on_fire": on_fire, "index": len(self.rules)}
+        self.rules.append(entry)
+        self.qualified.update(name for name in rule_events(rule) if "/" in name)
+        trigger = rule["trigger"]
+        key = trigger.get("event") or trigger.get("absent")
+        if key:
+            self._by_key.setdefault(key, []).append(entry)
+        if "at" in trigger:
+            self._schedule_daily(entry, now)
+        elif "every" in trigger:
+            self.wheel.schedule(now + trigger["every"], lambda at, entry=entry: self._periodic(entry, at))
+        elif "absent" in trigger:
+            last = self.history.last_seen(trigger["absent"], now)
+            self._arm_absence(entry, now if last is None else last)
+        return entry
+
+    def remove_rule(self, entry: Dict):
+        entry["removed"] = True
+        key = entry["rule"]["trigger"].get("event") or entry["rule"]["trigger"].get("absent")
+        if key in self._by_key:
+            self._by_key[key] = [other for other in self._by_key[key] if other is not entry]
+        self.wheel.cancel(self._absence_timers.pop(entry["index"], None))
+
+    def on_event(self, key: str, data: Any = None, now: Optional[float] = None, trigger: bool = True,
+                 thing: Optional[str] = None):
+        """
+        Record an event (of `thing`, if known) and run the rules it triggers (or whose absence
+        timer it resets). With trigger=False the event is only recorded and re-arms absences;
+        the caller runs the event-triggered rules with trigger() once per coalesced batch.
+        """
+        now = time.time() if now is None else now
+        self.stats["events"] += 1
+        for name in self._keys(key, thing):
+            self.history.record(name, now, data)
+            for entry in self._by_key.get(name, ()):
+                rule_trigger = entry["rule"]["trigger"]
+                if rule_trigger.get("event") == name:
+                    if trigger:
+                        self._check(entry, now, name)
+                elif rule_trigger.get("absent") == name:
+                    self._arm_absence(entry, now)
+
+    def trigger(self, key: str, now: Optional[float] = None, thing: Optional[str] = None):
+        """Run the rules triggered by `key` once, e.g. for a released window of its events."""
+        now = time.time() if now is None else now
+        for name in self._keys(key, thing):
+            for entry in self._by_key.get(name, ()):
+                if entry["rule"]["trigger"].get("event") == name:
+                    self._check(entry, now, name)
+
+    def _keys(self, key: str, thing: Optional[str]) -> List[str]:
+        qualified = f"{thing}/{key}"
+        return [key, qualified] if thing and qualified in self.qualified else [key]
+
+    def advance(self, now: Optional[float] = None) -> int:
+        """Fire the time-based triggers that are due."""
+        return self.wheel.advance(now)
+
+    def _schedule_daily(self, entry: Dict, now: float):
+        at = next_clock(entry["rule"]["trigger"]["at"], now)
+        self.wheel.schedule(at, lambda fired, entry=entry: self._daily(entry, fired))
+
+    def _daily(self, entry: Dict, at: float):
+        if not entry.get("removed"):
+            self._check(entry, at)
+            self._schedule_daily(entry, at)
+
+    def _periodic(self, entry: Dict, at: float):
+        if not entry.get("removed"):
+            self._check(entry, at)
+            self.wheel.schedule(at + entry["rule"]["trigger"]["every"], lambda fired: self._periodic(entry, fired))
+
+    def _arm_absence(self, entry: Dict, last: float):
+        self.wheel.cancel(self._absence_timers.get(entry["index"]))
+        deadline = last + entry["rule"]["trigger"]["for"]
+        self._absence_timers[entry["index"]] = self.wheel.schedule(
+            deadline, lambda at, entry=entry: self._absence_due(entry, at))
+
+    def _absence_due(self, entry: Dict, at: float):
+        self._absence_timers.pop(entry["index"], None)
+        if entry.get("removed") or self._check(entry, at):
+            # Fires once per silence; the next occurrence of the event re-arms it
+            return
+        # The condition did not hold yet (say, outside its time window): check again while the silence lasts
+        self._absence_timers[entry["index"]] = self.wheel.schedule(
+            _recheck_at(entry["rule"]["when"], at), lambda fired, entry=entry: self._absence_due(entry, fired))
+
+    def _check(self, entry: Dict, now: float, key: Optional[str] = None) -> bool:
+        self.stats["evaluations"] += 1
+        condition = entry["rule"].get("when")
+        if condition is None or self.evaluate(condition, now):
+            self.stats["fired"] += 1
+            entry["on_fire"](entry["rule"], self.facts(entry["rule"], now, key))
+            return True
+        return False
+
+    def evaluate(self, condition: Dict, now: Optional[float] = None) -> bool:
+        now = time.time() if now is None else now
+        if "all" in condition:
+            return all(self.evaluate(part, now) for part in condition["all"])
+        if "any" in condition:
+            return any(self.evaluate(part, now) for part in condition["any"])
+        if "not" in condition:
+            return not self.evaluate(condition["not"], now)
+        if "time_between" in condition:
+            start, end = (parse_clock(clock) for clock in condition["time_between"])
+            minute = minute_of_day(now)
+            return start <= minute < end if start <= end else minute >= start or minute < end
+        if "seen" in condition:
+            count = self.history.count(condition["seen"], now - condition["within"], now)
+            return count >= condition.get("at_least", 1)
+        return self.history.count(condition["absent"], now - condition["for"], now) == 0
+
+    def facts(self, rule: Dict, now: float, key: Optional[str] = None) -> Dict:
+        """Local evidence passed along when a rule fires."""
+        mentioned = rule_events(rule)
+        facts: Dict[str, Any] = {"time": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(now)),
+                                 "at": round(now, 6)}
+        last_seen = {}
+        for name in sorted(mentioned):
+            seen = self.history.last_seen(name, now)
+            last_seen[name] = f"{now - seen:.0f}s ago" if seen is not None else "never"
+        if last_seen:
+            facts["last_seen"] = last_seen
+        if key is not None and self.history.last_data(key) is not None:
+            facts["data"] = self.history.last_data(key)
+        return facts
+
+
+def _recheck_at(condition: Dict, now: float) -> float:
+    """When a condition that is false at `now` may next hold: a time window edge, or ABSENCE_RECHECK later."""
+    clocks = _clocks(condition)
+    times = [next_clock(clock, now) for clock in clocks]
+    if not clocks or _event_names(condition):
+        times.append(now + ABSENCE_RECHECK)
+    return min(times)
+
+
+def _clocks(condition: Any) -> List[str]:
+    if isinstance(condition, list):
+        return [clock for part in condition for clock in _clocks(part)]
+    if not isinstance(condition, dict):
+        return []
+    if "time_between" in condition:
+        return list(condition["time_between"])
+    return [clock for key in ("all", "any", "not") for clock in _clocks(condition.get(key))]
+
+
+def rule_run_key(rule: Dict, facts: Dict) -> str:
+    """Automation key of one firing: the rule and its exact trigger time (two firings in a second differ)."""
+    return f"rule:{rule.get('id')}@{facts['at']:.6f}"
+
+
+def rule_events(rule: Dict) -> Set[str]:
+    """Event names a rule mentions, in its trigger or its condition."""
+    return set(_event_names(rule.get("when"))) | set(_event_names(rule.get("trigger")))
+
+
+def _event_names(value: Any) -> List[str]:
+    if isinstance(value, list):
+        return [name for part in value for name in _event_names(part)]
+    if not isinstance(value, dict):
+        return []
+    names = [value[key] for key in ("event", "seen", "absent") if isinstance(value.get(key), str)]
+    return names + [name for key in ("all", "any", "not") for name in _event_names(value.get(key))]
@@ -11,6 +11,48 @@ LLM_VERSION="gpt-4.1"
 # LLM_VERSION="claude-sonnet-4-5"
 LLM_TEMPERATURE=0
 API_KEY=os.getenv("OPENAI_API_KEY")
+LMSTUDIO_BASE_URL=os.getenv("LMSTUDIO_BASE_URL", "http://localhost:1234/v1")
+RECORDED_LLM_LATENCY=float(os.getenv("RECORDED_LLM_LATENCY", "0"))
+
+
+def split_model_spec(model_spec: str = None):
+    """
+    Split a "provider:model" spec into (provider, model). Without a prefix the provider is
+    inferred: claude-* -> anthropic, recorded -> recorded stand-in, anything else -> openai.
+    """
+    model_spec = model_spec or LLM_VERSION
+    if ":" in model_spec:
+        provider, model_name = model_spec.split(":", 1)
+        return provider, model_name
+    if model_spec.startswith("claude"):
+        return "anthropic", model_spec
+    if model_spec == "recorded":
+        return "recorded", model_spec
+    return "openai", model_spec
+
+
+def create_chat_model(model_spec: str = None, temperature: float = LLM_TEMPERATURE):
+    """Create the chat model for a spec: openai, anthropic, lmstudio (local) or recorded."""
+    provider, model_name = split_model_spec(model_spec)
+    if provider == "openai":
+        from langchain_openai import ChatOpenAI
+        return ChatOpenAI(model=model_name, temperature=temperature, openai_api_key=API_KEY)
+    if provider == "anthropic":
+        from langchain_anthropic import ChatAnthropic
+        return ChatAnthropic(model=model_name, temperature=temperature)
+    if provider == "lmstudio":
+        from langchain.chat_models import init_chat_model
+        return init_chat_model(
+            model=model_name,
+            model_provider="openai",
+            base_url=LMSTUDIO_BASE_URL,
+            api_key="not-needed",
+            temperature=temperature,
+        )
+    if provider == "recorded":
+        from recorded_llm import RecordedChatModel
+        return RecordedChatModel(latency=RECORDED_LLM_LATENCY, jitter=RECORDED_LLM_LATENCY / 2)
+    raise ValueError(f"Unknown model provider '{provider}' in '{model_spec}'")
 
 
 
@@ -0,0 +1,255 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+from typing import Dict, List, Optional
+from dotenv import load_dotenv
+from langchain_core.messages import HumanMessage, SystemMessage
+from prompts_holonic import DECOMPOSE_PROMPT, SUBSYSTEM_PROMPT
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+import utils
+from flow_layout import layout_flow
+from flow_utils import extract_flow_json, new_node_id, validate_flow
+from instrumentation import instrument
+from local_batch import prompt_length
+from nodered_deploy import NodeRedDeployer, print_deploy_summary, rename_ids
+from td_discovery import TddClient, load_tds_from_config
+
+load_dotenv()
+
+# LangSmith Configuration
+utils.configure_langsmith_tracing()
+
+VERBOSE = True
+
+DEPLOY_TO_NODE_RED = os.getenv("NODE_RED_DEPLOY", "").lower() in ("1", "true", "yes")
+
+# Subsystem name -> TDD url (or things-config.json path) of the systems in simulated-systems/system-of-systems
+DEFAULT_SUBSYSTEMS = {
+    "smart-home": "http://localhost:8101/things",
+    "smart-aquarium": "http://localhost:9101/things",
+}
+
+
+def load_subsystem_tds(source: str) -> List[Dict]:
+    if source.endswith(".json"):
+        return load_tds_from_config(source)
+    tdd = TddClient(source)
+    try:
+        return tdd.bootstrap()
+    finally:
+        tdd.close()
+
+
+def device_summary(td: Dict) -> str:
+    """One line per device for the decomposition prompt: title and affordance names only."""
+    parts = [td.get("title", "?")]
+    for kind in ("properties", "actions", "events"):
+        names = list(td.get(kind, {}))
+        if names:
+            parts.append(f"{kind}: {', '.join(names)}")
+    return " - " + "; ".join(parts)
+
+
+def decompose_prompt(subsystems: Dict[str, List[Dict]]) -> str:
+    blocks = []
+    for name, tds in subsystems.items():
+        blocks.append(f"## {name}\n" + "\n".join(device_summary(td) for td in tds))
+    return DECOMPOSE_PROMPT.replace("{SUBSYSTEMS}", "\n\n".join(blocks))
+
+
+def subsystem_prompt(name: str, tds: List[Dict]) -> str:
+    return SUBSYSTEM_PROMPT.replace("{SUBSYSTEM}", name).replace("{ALL_TDS}", json.dumps(tds, indent=2))
+
+
+def parse_subgoals(text: str, subsystems: Dict[str, List[Dict]]) -> List[Dict]:
+    """Parse the decomposition answer; subgoals for unknown subsystems are dropped."""
+    start, end = text.find("{"), text.rfind("}")
+    if start < 0 or end < start:
+        raise ValueError(f"No subgoals in decomposition: {text[:200]}")
+    subgoals = []
+    for subgoal in json.loads(text[start:end + 1]).get("subgoals", []):
+        if subgoal.get("subsystem") not in subsystems:
+            print(f"⚠️  Ignoring subgoal for unknown subsystem '{subgoal.get('subsystem')}'")
+            continue
+        subgoal.setdefault("emits", [])
+        subgoal.setdefault("listens", [])
+        subgoals.append(subgoal)
+    return subgoals
+
+
+def subgoal_request(subgoal: Dict) -> str:
+    # The decomposition may leave out the goal of a subsystem that only relays signals
+    request = subgoal.get("goal") or f"Implement the part of the requirement handled by {subgoal.get('subsystem')}"
+    if subgoal.get("emits"):
+        request += f"\nEmit signals: {', '.join(subgoal['emits'])}"
+    if subgoal.get("listens"):
+        request += f"\nListen to signals: {', '.join(subgoal['listens'])}"
+    return request
+
+
+def merge_flows(flows: Dict[str, List[Dict]], label: str) -> List[Dict]:
+    """
+    Merge per-subsystem flows into one tab: ids are made unique across flows, consumed-thing
+    nodes with the same tdLink are shared, "link out" nodes are connected to the "link in"
+    nodes of the same signal name, and the merged flow is laid out again.
+    """
+    tab = {"id": new_node_id(), "type": "tab", "label": label, "disabled": False, "info": "", "env": []}
+    merged: List[Dict] = [tab]
+    used_ids = {tab["id"]}
+    things_by_link: Dict[str, str] = {}
+    for name, flow in flows.items():
+        # Nodes without an id cannot be wired to, and would map None to a new id
+        flow = [node for node in flow if isinstance(node, dict) and node.get("id")]
+        tab_ids = {node["id"] for node in flow if node.get("type") == "tab"}
+        mapping = {tab_id: tab["id"] for tab_id in tab_ids}
+        for node in flow:
+            if node.get("type") == "tab":
+                continue
+            if node.get("type") == "consumed-thing" and node.get("tdLink") in things_by_link:
+                mapping[node["id"]] = things_by_link[node["tdLink"]]
+            elif node["id"] in used_ids:
+                mapping[node["id"]] = new_node_id()
+        for node in rename_ids([node for node in flow if node.get("type") != "tab"], mapping):
+            if node["id"] in used_ids:
+                continue  # a shared consumed-thing
+            if node.get("type") == "consumed-thing" and node.get("tdLink"):
+                things_by_link[node["tdLink"]] = node["id"]
+            if "wires" in node:
+                node["z"] = tab["id"]
+            used_ids.add(node["id"])
+            merged.append(node)
+
+    link_ins: Dict[str, List[Dict]] = {}
+    for node in merged:
+        if node.get("type") == "link in":
+            link_ins.setdefault(node.get("name"), []).append(node)
+    for node in merged:
+        if node.get("type") == "link out":
+            targets = link_ins.get(node.get("name"), [])
+            node["mode"] = "link"
+            node["links"] = [target["id"] for target in targets]
+            for target in targets:
+                target["links"] = target.get("links", []) + [node["id"]]
+    return layout_flow(merged)
+
+
+class HolonicGenerator:
+    """
+    Generates a system-of-systems flow holonically: the requirement is split into one subgoal
+    per subsystem (the decomposition only sees device and affordance names), every subgoal is
+    generated concurrently with the TDs of its own subsystem, and the subsystem flows are
+    merged into one tab. The largest prompt grows with the largest subsystem, not the SoS.
+    """
+    def __init__(self, subsystems: Dict[str, List[Dict]], model_spec: Optional[str] = None):
+        self.subsystems = subsystems
+        self.model = utils.create_chat_model(model_spec)
+        self.decomposer = instrument(self.model, "holonic_generator", "system-of-systems")
+        self.prompts = {name: subsystem_prompt(name, tds) for name, tds in subsystems.items()}
+
+    def prompt_sizes(self) -> Dict[str, int]:
+        """Approximate prompt tokens per subsystem, and of one prompt with every TD of the SoS."""
+        sizes = {name: prompt_length([SystemMessage(content=prompt)]) for name, prompt in self.prompts.items()}
+        all_tds = [td for tds in self.subsystems.values() for td in tds]
+        sizes["(whole SoS)"] = prompt_length([SystemMessage(content=subsystem_prompt("system-of-systems", all_tds))])
+        return sizes
+
+    async def decompose(self, requirement: str) -> List[Dict]:
+        response = await self.decomposer.ainvoke([
+            SystemMessage(content=decompose_prompt(self.subsystems)),
+            HumanMessage(content=requirement),
+        ])
+        return parse_subgoals(response.content, self.subsystems)
+
+    async def generate_subflow(self, subgoal: Dict) -> List[Dict]:
+        name = subgoal["subsystem"]
+        model = instrument(self.model, "holonic_generator", name)
+        response = await model.ainvoke([
+            SystemMessage(content=self.prompts[name]),
+            HumanMessage(content=subgoal_request(subgoal)),
+        ])
+        flow = extract_flow_json(response.content)
+        if flow is None:
+            raise ValueError(f"No flow JSON in the {name} response")
+        return flow
+
+    async def generate(self, requirement: str, label: str = "system-of-systems") -> Dict:
+        subgoals = await self.decompose(requirement)
+        if VERBOSE:
+            for subgoal in subgoals:
+                print(f"  • {subgoal['subsystem']}: {subgoal_request(subgoal)}")
+        flows = await asyncio.gather(*(self.generate_subflow(subgoal) for subgoal in subgoals))
+        # One subgoal per subsystem is expected; a second one is merged as its own flow
+        named = {f"{subgoal['subsystem']}#{i}": flow for i, (subgoal, flow) in enumerate(zip(subgoals, flows))}
+        flow = merge_flows(named, label)
+        return {"subgoals": subgoals, "flow": flow, "problems": validate_flow(flow)}
+
+
+def parse_subsystem_args(values: List[str]) -> Dict[str, str]:
+    if not values:
+        return dict(DEFAULT_SUBSYSTEMS)
+    subsystems = {}
+    for value in values:
+        name, _, source = value.partition("=")
+        if not source:
+            raise SystemExit(f"Expected NAME=TDD_URL_OR_CONFIG, got '{value}'")
+        subsystems[name] = source
+    return subsystems
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Holonic Node-RED workflow generator for systems of systems")
+    parser.add_argument("--subsystem", action="append",
+                        help="NAME=TDD_URL or NAME=things-config.json (repeatable, default: smart-home and smart-aquarium)")
+    parser.add_argument("--model", help="Model spec (default: utils.LLM_VERSION)")
+    args = parser.parse_args()
+
+    subsystems = {}
+    for name, source in parse_subsystem_args(args.subsystem).items():
+        subsystems[name] = await asyncio.to_thread(load_subsystem_tds, source)
+        print(f"✓ Loaded {len(subsystems[name])} Thing Descriptions for {name} from {source}")
+
+    generator = HolonicGenerator(subsystems, args.model)
+    deployer = NodeRedDeployer() if DEPLOY_TO_NODE_RED else None
+
+    print("\n📊 Prompt size (approx. tokens):")
+    for name, size in generator.prompt_sizes().items():
+        print(f"  {name:<24} {size:>8}")
+
+    print("\n🤖 Holonic Node-RED Workflow Generator ready!")
+    print("Describe the system-of-systems workflow you want.")
+    print("Type 'bye' or 'exit' to exit.\n")
+
+    while True:
+        try:
+            user_prompt = await asyncio.to_thread(input, "You: ")
+            if user_prompt.lower() in ["bye", "exit"]:
+                print("Goodbye!")
+                break
+            if not user_prompt.strip():
+                continue
+
+            print("\n🔄 Processing your request...\n")
+            try:
+                result = await generator.generate(user_prompt)
+                print(f"\n📝 Generated Node-RED Workflow:\n")
+                print(json.dumps(result["flow"], indent=2))
+                if result["problems"]:
+                    print("⚠️  Merged flow has problems:")
+                    for problem in result["problems"]:
+                        print(f"  - {problem}")
+                elif deployer:
+                    print_deploy_summary(await asyncio.to_thread(deployer.deploy, result["flow"]))
+            except Exception as e:
+                print(f"❌ Error: {e}")
+                import traceback
+                traceback.print_exc()
+        except EOFError:
+            break
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
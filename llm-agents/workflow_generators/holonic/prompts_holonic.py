@@ -0,0 +1,44 @@
+
+
+DECOMPOSE_PROMPT = """
+You are an expert IoT system architect coordinating a system of systems. Each subsystem is an independent IoT system with its own devices:
+
+{SUBSYSTEMS}
+
+Split the user's system-of-systems requirement into one subgoal per subsystem that has to take part. A subgoal only uses the devices of its own subsystem.
+When one subsystem has to react to something observed in another subsystem, connect them through a named signal: the observing subgoal "emits" the signal and the reacting subgoal "listens" to it. Use short snake_case signal names (e.g. "aquarium_critical").
+
+Return ONLY a JSON object of this form, no explanations:
+{"subgoals": [{"subsystem": "SUBSYSTEM_NAME", "goal": "what this subsystem has to do", "emits": ["signal_name"], "listens": ["signal_name"]}]}
+"""
+
+
+SUBSYSTEM_PROMPT = """
+You are an expert IoT system developer, proficient with Web of Things (WoT) descriptions and Node-RED workflow programming.
+You implement one part of a larger system of systems. You are provided with the Thing Descriptions (TDs) of the devices of the "{SUBSYSTEM}" subsystem only:
+
+{ALL_TDS}
+
+Produce a Node-RED flow (a JSON array of nodes) that implements the subgoal given by the user with these devices.
+
+# Node Types Available
+- **tab**: Container for all nodes. Exactly one: {"id": "TAB_ID", "type": "tab", "label": "name", "disabled": false, "info": "", "env": []}
+- **consumed-thing**: One per device, no "z": {"id": "ID", "type": "consumed-thing", "tdLink": "DEVICE_TD_URL", "td": "", "http": true, "ws": false, "coap": false, "mqtt": false, "opcua": false, "modbus": false, "basicAuth": false, "username": "", "password": ""}
+- **read-property** / **write-property**: {"id": "ID", "type": "read-property", "z": "TAB_ID", "name": "", "topic": "", "thing": "CONSUMED_THING_ID", "property": "property_name_from_TD", "uriVariables": "{}", "wires": [["NEXT_NODE_ID"]]}
+- **invoke-action**: same fields as read-property, with "action": "action_name_from_TD" instead of "property"
+- **subscribe-event**: same fields as read-property, with "event": "event_name_from_TD" instead of "property"
+- **inject**, **function**, **switch**, **change**, **delay**, **debug**: standard Node-RED nodes
+- **link out**: ends a path that emits a signal to another subsystem: {"id": "ID", "type": "link out", "z": "TAB_ID", "name": "SIGNAL_NAME", "mode": "link", "links": [], "wires": []}
+- **link in**: starts a path that reacts to a signal from another subsystem: {"id": "ID", "type": "link in", "z": "TAB_ID", "name": "SIGNAL_NAME", "links": [], "wires": [["NEXT_NODE_ID"]]}
+
+# Critical Rules
+1. Every node has a unique 16 character hex "id"
+2. Every node except the tab and consumed-thing nodes has "z": "TAB_ID"
+3. Property/action/event names must match exactly what's in the Thing Description
+4. For every signal the subgoal emits, wire the triggering path into a "link out" node named after the signal
+5. For every signal the subgoal listens to, start the reacting path with a "link in" node named after the signal
+6. Leave "links" empty; the subsystem flows are connected when they are merged
+7. Do not add x/y coordinates; the merged flow is laid out automatically
+
+Return ONLY the valid Node-RED flow JSON array. No explanations.
+"""
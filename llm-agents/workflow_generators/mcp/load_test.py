@@ -0,0 +1,68 @@
+import argparse
+import asyncio
+import json
+import time
+import httpx
+
+
+DEFAULT_PROMPTS = [
+    "Blink LEDs when washing machine finishes",
+    "Turn on the main room light when motion is detected in that room.",
+    "When morning alarm triggers, turn heating on to 30 degrees C for 20mins.",
+]
+
+
+async def run_one(client: httpx.AsyncClient, url: str, model: str, prompt: str, results: list):
+    started = time.perf_counter()
+    while True:
+        response = await client.post(f"{url}/jobs", json={"prompt": prompt, "model": model})
+        if response.status_code != 429:
+            break
+        # Backpressure: wait as long as the server asks
+        await asyncio.sleep(float(response.headers.get("Retry-After", "1")))
+    if response.status_code != 202:
+        results.append(("rejected", time.perf_counter() - started))
+        return
+    job_id = response.json()["id"]
+
+    event = None
+    async with client.stream("GET", f"{url}/jobs/{job_id}/events") as stream:
+        async for line in stream.aiter_lines():
+            if line.startswith("event:"):
+                event = line[6:].strip()
+            elif line.startswith("data:") and event == "result":
+                status = json.loads(line[5:]).get("status")
+                results.append((status, time.perf_counter() - started))
+                return
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Load test the workflow generator service")
+    parser.add_argument("--url", default="http://127.0.0.1:8300")
+    parser.add_argument("--model", default="recorded", help="Model spec; 'recorded' replays results/llm_outputs")
+    parser.add_argument("--jobs", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+
+    results = []
+    semaphore = asyncio.Semaphore(args.concurrency)
+    started = time.perf_counter()
+
+    async with httpx.AsyncClient(timeout=None) as client:
+        async def bounded(i):
+            async with semaphore:
+                await run_one(client, args.url, args.model, DEFAULT_PROMPTS[i % len(DEFAULT_PROMPTS)], results)
+
+        await asyncio.gather(*(bounded(i) for i in range(args.jobs)))
+        server_stats = (await client.get(f"{args.url}/metrics")).json()
+
+    elapsed = time.perf_counter() - started
+    latencies = sorted(latency for status, latency in results if status == "completed")
+    print(f"✓ {len(latencies)}/{args.jobs} jobs completed in {elapsed:.2f}s ({len(latencies) / elapsed:.1f} jobs/s)")
+    if latencies:
+        print(f"  client p50={latencies[len(latencies) // 2]:.3f}s p95={latencies[int(len(latencies) * 0.95) - 1]:.3f}s")
+    print(json.dumps(server_stats, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
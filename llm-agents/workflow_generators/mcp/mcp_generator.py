@@ -1,18 +1,22 @@
 import asyncio
 import os
 import sys
-from typing import List, Dict
-from langchain_anthropic import ChatAnthropic
+from typing import Callable, List, Dict
 # import mcp.types as types
 from langchain.agents import create_agent
-from langchain_mcp_adapters.client import MultiServerMCPClient
-from langchain_mcp_adapters.tools import load_mcp_tools
-from langchain_core.messages import AIMessage, ToolMessage, HumanMessage
+from langchain_core.messages import AIMessage, ToolMessage
 from langchain_openai import ChatOpenAI
 import json
 from prompts_with_node_wot import SYSTEM_PROMPT    # change this file for a different system prompt
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
 import utils
+from instrumentation import instrument
+from mcp_pool import GENERATION_TOOLS, McpSessionPool
+from nodered_deploy import NodeRedDeployer, print_deploy_summary
+from td_prefetch import DiscoveryCache
+from flow_layout import layout_flow
+from history_compaction import compaction_middleware
+from flow_patch import PatchError, patch_request, print_patch_summary, refine_flow
 
 
 # LangSmith Configuration
@@ -20,7 +24,17 @@ utils.configure_langsmith_tracing()
 
 VERBOSE = False
 
-WOT_MCP_SERVER_URL = "http://localhost:3000/mcp"
+WOT_MCP_SERVER_URL = os.getenv("WOT_MCP_SERVER_URL", "http://localhost:3000/mcp")
+
+# Deploy generated flows straight to Node-RED (diff-based, see nodered_deploy.py)
+DEPLOY_TO_NODE_RED = os.getenv("NODE_RED_DEPLOY", "").lower() in ("1", "true", "yes")
+
+# Serve list_devices/get_thing_description(s) through a prefetching cache (see td_prefetch.py)
+DISCOVERY_PREFETCH = os.getenv("DISCOVERY_PREFETCH", "1").lower() in ("1", "true", "yes")
+
+# Refine the current flow with patches instead of regenerating it (see flow_patch.py)
+INCREMENTAL_FLOWS = os.getenv("INCREMENTAL_FLOWS", "").lower() in ("1", "true", "yes")
+
 
 
 model = ChatOpenAI(
@@ -31,33 +45,119 @@ model = ChatOpenAI(
 
 
 
-async def main():
-    wot_client = MultiServerMCPClient(
-        {
-            "wot": {
-                "transport": "streamable_http",
-                "url": WOT_MCP_SERVER_URL,
-            }
-        }
+def response_text_from(agent_response: Dict) -> str:
+    """Extract the text of the last AI message of an agent response."""
+    messages = agent_response.get("messages", [])
+    if VERBOSE:
+        # Print out tool calls and intermediate steps
+        for msg in messages:
+            if isinstance(msg, ToolMessage):
+                print("----Tool Call Start----")
+                print(f"🛠️ ToolMessage: {msg.dict()}")
+                print(f"----Tool Call End----\n")
+            elif isinstance(msg, AIMessage) and hasattr(msg, "tool_calls"):
+                # Some frameworks store tool calls here
+                print(f"🤖 AIMessage tool_calls: {msg.tool_calls}")
+    if not messages:
+        return ""
+    last_msg = messages[-1]
+    response_text = last_msg.content
+    if isinstance(response_text, list):
+        # Extract text content
+        text_parts = [part.get('text') if isinstance(part, dict) else str(part)
+                     for part in response_text if part]
+        response_text = '\n'.join(text_parts)
+    return response_text
+
+
+def build_agent(tools: List, model_spec: str = None):
+    """Create the workflow generator agent over the given WoT tools (optionally for another model)."""
+    agent = create_agent(
+        model=utils.create_chat_model(model_spec) if model_spec else model,
+        tools=[tool for tool in tools if tool.name in GENERATION_TOOLS],
+        system_prompt=SYSTEM_PROMPT,
+        # Requests are independent: a reused thread_id must not carry earlier TDs along
+        middleware=compaction_middleware(reset_per_request=True),
     )
+    return instrument(agent, "mcp_generator")
+
+
+def get_generator(pool: McpSessionPool, model_spec: str = None, key: str = "workflow_generator"):
+    """
+    Agent for the pool's current WoT session, and the discovery cache its tools go through
+    (None if prefetching is disabled). Both are rebuilt after a reconnect.
+    """
+    discovery = None
+    if DISCOVERY_PREFETCH:
+        discovery = pool.get_agent(("discovery",), DiscoveryCache, servers=["wot"], names=GENERATION_TOOLS)
+    agent = pool.get_agent(
+        (key, model_spec),
+        lambda tools: build_agent(discovery.wrap() if discovery else tools, model_spec),
+        servers=["wot"],
+        names=GENERATION_TOOLS,
+    )
+    return agent, discovery
+
+
+def describe_step(message) -> Dict:
+    """Short progress record for one new agent message."""
+    if isinstance(message, AIMessage) and message.tool_calls:
+        return {"stage": "tool_calls", "tools": [call["name"] for call in message.tool_calls]}
+    if isinstance(message, ToolMessage):
+        return {"stage": "tool_result", "tool": message.name}
+    if isinstance(message, AIMessage):
+        return {"stage": "model_response"}
+    return {"stage": message.type}
+
+
+async def generate_flow(agent, user_prompt: str, thread_id: str = "workflow_generator",
+                        on_progress: Callable[[Dict], None] = None,
+                        discovery: DiscoveryCache = None) -> Dict:
+    """
+    Run one generation request. Returns the parsed flow (or None if the model did not
+    return valid JSON) together with the raw response text.
+    If on_progress is given, it is called with a short record for every agent step.
+    With a discovery cache, the device list is put into the request and the likely TDs are
+    prefetched, so the agent goes straight to one batched TD lookup.
+    """
+    if discovery:
+        user_prompt = await discovery.preamble(user_prompt) + user_prompt
+    # Let the agent handle everything - discovering devices, fetching TDs, generating flow
+    agent_input = {"messages": [{"role": "user", "content": user_prompt}]}
+    config = {"configurable": {"thread_id": thread_id}}
+    if on_progress is None:
+        agent_response = await agent.ainvoke(agent_input, config)
+    else:
+        agent_response, seen = {}, 1
+        async for state in agent.astream(agent_input, config, stream_mode="values"):
+            messages = state.get("messages", [])
+            for message in messages[seen:]:
+                on_progress(describe_step(message))
+            seen = max(seen, len(messages))
+            agent_response = state
+    response_text = response_text_from(agent_response)
+    # Try to parse and validate the JSON
+    try:
+        flow_json = json.loads(response_text)
+    except json.JSONDecodeError:
+        flow_json = None
+    if isinstance(flow_json, list):
+        # Coordinates come from the wires, not from the model
+        flow_json = layout_flow(flow_json)
+    return {"flow": flow_json, "response": response_text, "tokens_saved": agent_response.get("tokens_saved", 0)}
 
-    print("Connecting to WoT MCP server...")
-
-    async with wot_client.session("wot") as wot_session:
-        wot_tools = await load_mcp_tools(wot_session)
-        print(f"✓ Loaded {len(wot_tools)} tools from WoT MCP server")
-
-        system_prompt = SYSTEM_PROMPT
 
+async def main():
+    print("Connecting to WoT MCP server...")
 
-        agent = create_agent(
-            model=model,
-            tools=wot_tools,
-            system_prompt=system_prompt,
-        )
+    async with McpSessionPool({"wot": {"transport": "streamable_http", "url": WOT_MCP_SERVER_URL}}) as pool:
+        deployer = NodeRedDeployer() if DEPLOY_TO_NODE_RED else None
+        current_flow = None
 
         print("\n🤖 Node-RED Workflow Generator ready!")
         print("Describe the workflow you want (e.g., 'Blink LEDs when washing machine cycle has finished.')")
+        if INCREMENTAL_FLOWS:
+            print("Later requests change the current flow; start with 'new:' for a flow from scratch.")
         print("Type 'bye' or 'exit' to exit.\n")
 
         while True:
@@ -70,50 +170,41 @@ async def main():
                     continue
 
                 print("\n🔄 Processing your request...\n")
-                
-                # Let the agent handle everything - discovering devices, fetching TDs, generating flow
+
                 try:
-                    agent_response = await agent.ainvoke(
-                        {"messages": [{"role": "user", "content": user_prompt}]},
-                        {"configurable": {"thread_id": "workflow_generator"}}
-                    )
-                    
-                    if "messages" in agent_response:
-                        messages = agent_response["messages"]
-                        # Print out tool calls and intermediate steps
-                        for msg in messages:
-                            if isinstance(msg, ToolMessage) and VERBOSE:
-                                print("----Tool Call Start----")
-                                print(f"🛠️ ToolMessage: {msg.dict()}")
-                                print(f"----Tool Call End----\n")
-                            elif isinstance(msg, AIMessage) and hasattr(msg, "tool_calls") and VERBOSE:
-                                # Some frameworks store tool calls here
-                                print(f"🤖 AIMessage tool_calls: {msg.tool_calls}")
-                        if messages:
-                            last_msg = messages[-1]
-                            if isinstance(last_msg, AIMessage):
-                                response_text = last_msg.content
-                                if isinstance(response_text, list):
-                                    # Extract text content
-                                    text_parts = [part.get('text') if isinstance(part, dict) else str(part) 
-                                                 for part in response_text if part]
-                                    response_text = '\n'.join(text_parts)
-                                
-                                # Try to parse and validate the JSON
-                                try:
-                                    flow_json = json.loads(response_text)
-                                    print(f"\n📝 Generated Node-RED Workflow:\n")
-                                    print(json.dumps(flow_json, indent=2))
-                                except json.JSONDecodeError:
-                                    # If not valid JSON, show the raw response
-                                    print(f"\n🤖 Agent Response:\n{response_text}")
-                            else:
-                                print(f"🤖 Agent: {last_msg.content}")
+                    # Reuse the warm session; the agent is rebuilt only after a reconnect
+                    agent, discovery = get_generator(pool)
+                    if user_prompt.lower().startswith("new:"):
+                        current_flow, user_prompt = None, user_prompt[4:].strip()
+                    if INCREMENTAL_FLOWS and current_flow is not None:
+                        result = await generate_flow(agent, patch_request(current_flow, user_prompt), discovery=discovery)
+                        try:
+                            refined = refine_flow(current_flow, result["response"])
+                        except PatchError as e:
+                            print(f"❌ Patch rejected, keeping the current flow: {e}")
+                            continue
+                        current_flow = refined["flow"]
+                        print_patch_summary(refined["patch"], current_flow)
+                        if deployer:
+                            print_deploy_summary(await asyncio.to_thread(deployer.deploy, current_flow))
+                        continue
+                    result = await generate_flow(agent, user_prompt, discovery=discovery)
+                    if result["tokens_saved"]:
+                        print(f"✓ History compaction kept ~{result['tokens_saved']} tokens out of model calls")
+                    if result["flow"] is not None:
+                        current_flow = result["flow"]
+                        print(f"\n📝 Generated Node-RED Workflow:\n")
+                        print(json.dumps(result["flow"], indent=2))
+                        if deployer:
+                            print_deploy_summary(await asyncio.to_thread(deployer.deploy, result["flow"]))
+                    else:
+                        # If not valid JSON, show the raw response
+                        print(f"\n🤖 Agent Response:\n{result['response']}")
                 except Exception as e:
                     print(f"❌ Error: {e}")
                     import traceback
                     traceback.print_exc()
-                    
+
             except EOFError:
                 break
 
@@ -1,3 +1,4 @@
+import argparse
 import asyncio
 import os
 import sys
@@ -12,6 +13,9 @@ import json
 from prompts_with_node_wot import SYSTEM_PROMPT    # change this file for a different system prompt
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
 import utils
+from flow_layout import layout_flow
+from instrumentation import instrument
+from local_batch import LocalBatchScheduler, generate_batch, read_requirements
 
 load_dotenv()
 
@@ -23,15 +27,20 @@ VERBOSE = True
 WOT_MCP_SERVER_URL = "http://localhost:3000/mcp"
 
 # Initialize LM Studio (Gemma2) model as in vanilla_generator_gemma2b.py
-model = init_chat_model(
+model = instrument(init_chat_model(
     model=utils.LLM_VERSION,
     model_provider="openai",
     base_url="http://localhost:1234/v1",
     api_key="not-needed",
     temperature=utils.LLM_TEMPERATURE,
-)
+), "mcp_generator_lmstudio")
 
 async def main():
+    parser = argparse.ArgumentParser(description="Node-RED workflow generator with WoT MCP (LM Studio)")
+    parser.add_argument("--batch", help="Generate one flow per requirement in this file (one per line) concurrently")
+    parser.add_argument("--out", help="Transcript file for --batch results")
+    args = parser.parse_args()
+
     wot_client = MultiServerMCPClient(
         {
             "wot": {
@@ -49,6 +58,15 @@ async def main():
 
         system_prompt = SYSTEM_PROMPT
 
+        if args.batch:
+            # Keep the local server's batch slots busy instead of sending one request at a time
+            scheduler = LocalBatchScheduler(model)
+            try:
+                await generate_batch(scheduler, system_prompt, read_requirements(args.batch), args.out)
+            finally:
+                await scheduler.close()
+            return
+
         print("\n🤖 Node-RED Workflow Generator ready!")
         print("Describe the workflow you want (e.g., 'Blink LEDs when washing machine cycle has finished.')")
         print("Type 'bye' or 'exit' to exit.\n")
@@ -74,6 +92,9 @@ async def main():
                     response_text = response.content
                     try:
                         flow_json = json.loads(response_text)
+                        if isinstance(flow_json, list):
+                            # Coordinates come from the wires, not from the model
+                            flow_json = layout_flow(flow_json)
                         print(f"\n📝 Generated Node-RED Workflow:\n")
                         print(json.dumps(flow_json, indent=2))
                     except json.JSONDecodeError:
@@ -0,0 +1,175 @@
+import asyncio
+import contextlib
+import json
+import os
+import sys
+import uvicorn
+from sse_starlette.sse import EventSourceResponse
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from mcp_generator import generate_flow, get_generator
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+import utils
+from mcp_pool import McpSessionPool, DEFAULT_CONNECTIONS
+from job_queue import Job, JobQueue, QueueFull, parse_model_limits
+from nodered_deploy import NodeRedDeployer
+
+
+HOST = os.getenv("GENERATOR_HOST", "127.0.0.1")
+PORT = int(os.getenv("GENERATOR_PORT", "8300"))
+# Comma-separated names from mcp_pool.DEFAULT_CONNECTIONS to keep warm
+MCP_SERVERS = os.getenv("MCP_SERVERS", "wot,node-red").split(",")
+# Backpressure: jobs waiting across all models before new submissions get 429
+MAX_QUEUED_JOBS = int(os.getenv("MAX_QUEUED_JOBS", "100"))
+# Per-model concurrency, e.g. "gpt-4.1=4,lmstudio:gemma-3-1b=1,recorded=32"
+MODEL_CONCURRENCY = parse_model_limits(os.getenv("MODEL_CONCURRENCY", "recorded=32"))
+DEFAULT_MODEL_CONCURRENCY = int(os.getenv("DEFAULT_MODEL_CONCURRENCY", "2"))
+# Model specs clients may ask for (each one gets its own worker pool); defaults to
+# LLM_VERSION and the models listed in MODEL_CONCURRENCY
+ALLOWED_MODELS = set(filter(None, os.getenv("ALLOWED_MODELS", "").split(","))) or {utils.LLM_VERSION, *MODEL_CONCURRENCY}
+KNOWN_PROVIDERS = ("openai", "anthropic", "lmstudio", "recorded")
+
+
+pool = McpSessionPool({name: DEFAULT_CONNECTIONS[name] for name in MCP_SERVERS})
+deployer = NodeRedDeployer()
+
+
+async def run_job(job: Job):
+    """Run one generation job on the shared MCP session."""
+    provider, _ = utils.split_model_spec(job.model)
+    # The recorded stand-in never calls tools, so it can be load-tested without a WoT server
+    if provider != "recorded" and not (pool.servers.get("wot") and pool.servers["wot"].healthy):
+        raise RuntimeError("WoT MCP session unavailable")
+
+    agent, discovery = get_generator(pool, job.model)
+    result = await generate_flow(
+        agent,
+        job.payload["prompt"],
+        job.payload.get("thread_id") or job.id,
+        on_progress=lambda step: job.progress(**step),
+        discovery=discovery if provider != "recorded" else None,
+    )
+    if job.payload.get("deploy") and result["flow"] is not None:
+        job.progress("deploying")
+        result["deployment"] = await asyncio.to_thread(deployer.deploy, result["flow"])
+    return result
+
+
+jobs = JobQueue(
+    run_job,
+    max_queued=MAX_QUEUED_JOBS,
+    model_limits=MODEL_CONCURRENCY,
+    default_limit=DEFAULT_MODEL_CONCURRENCY,
+)
+
+
+async def submit_from_request(request: Request):
+    """Validate a job request body and queue it. Returns (job, error_response)."""
+    try:
+        body = await request.json()
+    except Exception:
+        return None, JSONResponse({"error": "Invalid JSON body"}, status_code=400)
+    if not isinstance(body, dict):
+        return None, JSONResponse({"error": "Body must be a JSON object"}, status_code=400)
+    user_prompt = body.get("prompt")
+    user_prompt = user_prompt.strip() if isinstance(user_prompt, str) else ""
+    if not user_prompt:
+        return None, JSONResponse({"error": "Missing 'prompt'"}, status_code=400)
+
+    model = body.get("model") or utils.LLM_VERSION
+    if not isinstance(model, str) or utils.split_model_spec(model)[0] not in KNOWN_PROVIDERS:
+        return None, JSONResponse({"error": f"Unknown model provider in {model!r}"}, status_code=400)
+    if model not in ALLOWED_MODELS:
+        return None, JSONResponse({"error": f"Model {model!r} is not enabled on this server",
+                                   "models": sorted(ALLOWED_MODELS)}, status_code=400)
+    try:
+        job = jobs.submit(model, {
+            "prompt": user_prompt,
+            "thread_id": body.get("thread_id"),
+            "deploy": bool(body.get("deploy")),
+        })
+    except QueueFull as e:
+        return None, JSONResponse({"error": f"Queue full: {e}"}, status_code=429, headers={"Retry-After": "1"})
+    return job, None
+
+
+async def create_job(request: Request):
+    """POST /jobs {"prompt": "...", "model": "..."} -> 202 {"id": ...}"""
+    job, error = await submit_from_request(request)
+    if error:
+        return error
+    return JSONResponse({"id": job.id, "status": job.status}, status_code=202)
+
+
+async def get_job(request: Request):
+    """GET /jobs/{id} -> job status and result."""
+    job = jobs.jobs.get(request.path_params["job_id"])
+    if not job:
+        return JSONResponse({"error": "Job not found"}, status_code=404)
+    return JSONResponse(job.to_dict())
+
+
+async def job_events(request: Request):
+    """GET /jobs/{id}/events -> server-sent progress events until the job finishes."""
+    job = jobs.jobs.get(request.path_params["job_id"])
+    if not job:
+        return JSONResponse({"error": "Job not found"}, status_code=404)
+
+    async def events():
+        async for event in job.stream():
+            yield {"event": event["stage"], "data": json.dumps(event)}
+        yield {"event": "result", "data": json.dumps(job.to_dict())}
+
+    return EventSourceResponse(events())
+
+
+async def generate(request: Request):
+    """POST /generate -> queue a job and wait for its result (synchronous convenience)."""
+    job, error = await submit_from_request(request)
+    if error:
+        return error
+    await job.wait()
+    return JSONResponse(job.to_dict(), status_code=200 if job.status == "completed" else 500)
+
+
+async def metrics(request: Request):
+    """GET /metrics -> queue depth, counters and latency percentiles per model."""
+    return JSONResponse(jobs.stats())
+
+
+async def health(request: Request):
+    """GET /health -> status of every pooled MCP session."""
+    status = pool.status()
+    healthy = bool(status.get("wot", {}).get("healthy"))
+    return JSONResponse({"healthy": healthy, "sessions": status}, status_code=200 if healthy else 503)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    await pool.start()
+    try:
+        yield
+    finally:
+        await jobs.close()
+        await pool.close()
+        deployer.close()
+
+
+app = Starlette(
+    routes=[
+        Route("/jobs", create_job, methods=["POST"]),
+        Route("/jobs/{job_id}", get_job, methods=["GET"]),
+        Route("/jobs/{job_id}/events", job_events, methods=["GET"]),
+        Route("/generate", generate, methods=["POST"]),
+        Route("/metrics", metrics, methods=["GET"]),
+        Route("/health", health, methods=["GET"]),
+    ],
+    lifespan=lifespan,
+)
+
+
+if __name__ == "__main__":
+    print(f"🤖 Node-RED Workflow Generator service on http://{HOST}:{PORT}")
+    uvicorn.run(app, host=HOST, port=PORT)
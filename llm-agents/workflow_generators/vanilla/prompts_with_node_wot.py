@@ -69,8 +69,6 @@ Your job is to take new IoT system proposals/descriptions (from users) along wit
   "property": "property_name_from_TD",
   "uriVariables": "{}",
   "observe": false,
-  "x": 460,
-  "y": 100,
   "wires": [["NEXT_NODE_ID"]]
 }
 ```
@@ -86,8 +84,6 @@ Your job is to take new IoT system proposals/descriptions (from users) along wit
   "thing": "CONSUMED_THING_NODE_ID",
   "property": "property_name_from_TD",
   "uriVariables": "{}",
-  "x": 460,
-  "y": 220,
   "wires": [["NEXT_NODE_ID"]]
 }
 ```
@@ -103,8 +99,6 @@ Your job is to take new IoT system proposals/descriptions (from users) along wit
   "thing": "CONSUMED_THING_NODE_ID",
   "action": "action_name_from_TD",
   "uriVariables": "{}",
-  "x": 470,
-  "y": 340,
   "wires": [["NEXT_NODE_ID"]]
 }
 ```
@@ -119,8 +113,6 @@ Your job is to take new IoT system proposals/descriptions (from users) along wit
   "topic": "",
   "thing": "CONSUMED_THING_NODE_ID",
   "event": "event_name_from_TD",
-  "x": 160,
-  "y": 460,
   "wires": [["NEXT_NODE_ID"]]
 }
 ```
@@ -140,8 +132,6 @@ Your job is to take new IoT system proposals/descriptions (from users) along wit
   "topic": "",
   "payload": "initial_value",
   "payloadType": "str",
-  "x": 210,
-  "y": 100,
   "wires": [["NEXT_NODE_ID"]]
 }
 ```
@@ -161,8 +151,6 @@ Your job is to take new IoT system proposals/descriptions (from users) along wit
   "targetType": "msg",
   "statusVal": "",
   "statusType": "auto",
-  "x": 690,
-  "y": 100,
   "wires": []
 }
 ```
@@ -182,9 +170,10 @@ Example wiring:
 All nodes must have:
 - id: unique identifier (16 char hex)
 - z: tab id (for grouping)
-- x, y: coordinates
 - wires: array of connections to next nodes
 
+Do not add x/y coordinates; the flow is laid out automatically from the wires.
+
 ## Critical Rules
 1. Generate a valid JSON array containing all nodes
 2. Every node must have a unique "id" (16 character hex string like "a18841fe05744488")
@@ -9,8 +9,15 @@ from langchain.agents import create_agent
 from langchain_core.messages import AIMessage
 from langchain_openai import ChatOpenAI
 from prompts_without_node_wot import SYSTEM_PROMPT     # change this file for a different system prompt
+from prompts_plan import SYSTEM_PROMPT as PLAN_PROMPT
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
 import utils
+from instrumentation import instrument
+from nodered_deploy import NodeRedDeployer, print_deploy_summary
+from flow_layout import layout_flow
+from flow_patch import PatchError, patch_request, print_patch_summary, refine_flow
+from flow_plan import PlanError, compile_plan, extract_plan
+from td_discovery import TddClient, load_tds_from_config, print_catalog_changes
 
 
 # LangSmith Configuration
@@ -18,6 +25,19 @@ utils.configure_langsmith_tracing()
 
 VERBOSE = True
 
+# Deploy generated flows straight to Node-RED (diff-based, see nodered_deploy.py)
+DEPLOY_TO_NODE_RED = os.getenv("NODE_RED_DEPLOY", "").lower() in ("1", "true", "yes")
+
+# Refine the current flow with patches instead of regenerating it (see flow_patch.py)
+INCREMENTAL_FLOWS = os.getenv("INCREMENTAL_FLOWS", "").lower() in ("1", "true", "yes")
+
+# Ask the model for a compact plan and compile it into the Node-RED flow (see flow_plan.py)
+FLOW_PLANS = os.getenv("FLOW_PLANS", "").lower() in ("1", "true", "yes")
+
+# Discover devices from a Thing Description Directory (e.g. http://localhost:8101/things)
+# instead of fetching every TD listed in things-config.json
+TDD_URL = os.getenv("TDD_URL")
+
 model = ChatOpenAI(
     model=utils.LLM_VERSION,
     temperature=utils.LLM_TEMPERATURE,
@@ -25,42 +45,43 @@ model = ChatOpenAI(
 )
 
 def load_all_tds_from_config(config_path: str) -> List[dict]:
-    tds = []
-    with open(config_path, "r", encoding="utf-8") as f:
-        config = json.load(f)
-    for thing in config.get("things", []):
-        url = thing.get("url")
-        if url:
-            try:
-                resp = requests.get(url)
-                resp.raise_for_status()
-                tds.append(resp.json())
-            except Exception as e:
-                print(f"❌ Failed to fetch TD from {url}: {e}")
-    return tds
-
+    return load_tds_from_config(config_path)
 
 
-
-async def main():
-    # Load all TDs from things-config.json
-    config_path = os.path.abspath(
-        os.path.join(os.path.dirname(__file__), '..', '..', '..', 'simulated-systems/smart-home-09-devices', 'things-config.json')
-    )
-    all_tds = load_all_tds_from_config(config_path)
-    print(f"✓ Loaded {len(all_tds)} Thing Descriptions from {config_path}")
-
+def build_agent(all_tds: List[dict]):
     # Compose system prompt with all TDs
-    system_prompt = SYSTEM_PROMPT.replace("{ALL_TDS}", json.dumps(all_tds, indent=2))
+    system_prompt = (PLAN_PROMPT if FLOW_PLANS else SYSTEM_PROMPT).replace("{ALL_TDS}", json.dumps(all_tds, indent=2))
 
     agent = create_agent(
         model=model,
         tools=[],  # No tools needed
         system_prompt=system_prompt,
     )
+    return instrument(agent, "vanilla_generator")
+
+
+async def main():
+    tdd = None
+    if TDD_URL:
+        tdd = TddClient(TDD_URL)
+        all_tds = await asyncio.to_thread(tdd.bootstrap)
+        print(f"✓ Discovered {len(all_tds)} Thing Descriptions from {TDD_URL}")
+    else:
+        # Load all TDs from things-config.json
+        config_path = os.path.abspath(
+            os.path.join(os.path.dirname(__file__), '..', '..', '..', 'simulated-systems/smart-home-09-devices', 'things-config.json')
+        )
+        all_tds = load_all_tds_from_config(config_path)
+        print(f"✓ Loaded {len(all_tds)} Thing Descriptions from {config_path}")
+
+    agent = build_agent(all_tds)
+    deployer = NodeRedDeployer() if DEPLOY_TO_NODE_RED else None
+    current_flow = None
 
     print("\n🤖 Node-RED Workflow Generator ready!")
     print("Describe the workflow you want (e.g., 'Blink LEDs when washing machine cycle has finished.')")
+    if INCREMENTAL_FLOWS:
+        print("Later requests change the current flow; start with 'new:' for a flow from scratch.")
     print("Type 'bye' or 'exit' to exit.\n")
 
     while True:
@@ -72,6 +93,23 @@ async def main():
             if not user_prompt.strip():
                 continue
 
+            if tdd:
+                # Cheap revision check; the prompt is only rebuilt when devices changed
+                try:
+                    changes = await asyncio.to_thread(tdd.poll)
+                    if any(changes.values()):
+                        print(f"✓ Device catalogue updated ({len(tdd.catalog)} Things):")
+                        print_catalog_changes(changes)
+                        agent = build_agent(tdd.catalog.list())
+                except requests.RequestException as e:
+                    print(f"⚠️  TDD poll failed, using the cached catalogue: {e}")
+
+            if user_prompt.lower().startswith("new:"):
+                current_flow, user_prompt = None, user_prompt[4:].strip()
+            refining = INCREMENTAL_FLOWS and current_flow is not None
+            if refining:
+                user_prompt = patch_request(current_flow, user_prompt)
+
             print("\n🔄 Processing your request...\n")
             try:
                 agent_response = await agent.ainvoke(
@@ -88,10 +126,40 @@ async def main():
                                 text_parts = [part.get('text') if isinstance(part, dict) else str(part)
                                              for part in response_text if part]
                                 response_text = '\n'.join(text_parts)
+                            if refining:
+                                try:
+                                    refined = refine_flow(current_flow, response_text)
+                                except PatchError as e:
+                                    print(f"❌ Patch rejected, keeping the current flow: {e}")
+                                    continue
+                                current_flow = refined["flow"]
+                                print_patch_summary(refined["patch"], current_flow)
+                                if deployer:
+                                    print_deploy_summary(await asyncio.to_thread(deployer.deploy, current_flow))
+                                continue
+                            if FLOW_PLANS:
+                                plan = extract_plan(response_text)
+                                if plan is None:
+                                    print(f"\n🤖 Agent Response:\n{response_text}")
+                                    continue
+                                try:
+                                    compiled = compile_plan(plan, tdd.catalog.list() if tdd else all_tds)
+                                except PlanError as e:
+                                    print(f"❌ Plan rejected: {e}")
+                                    continue
+                                plan_size, response_text = len(json.dumps(plan)), json.dumps(compiled)
+                                print(f"✓ Compiled a {plan_size} character plan into {len(compiled)} nodes "
+                                      f"({len(response_text)} characters)")
                             try:
                                 flow_json = json.loads(response_text)
+                                if isinstance(flow_json, list):
+                                    # Coordinates come from the wires, not from the model
+                                    flow_json = layout_flow(flow_json)
+                                current_flow = flow_json
                                 print(f"\n📝 Generated Node-RED Workflow:\n")
                                 print(json.dumps(flow_json, indent=2))
+                                if deployer:
+                                    print_deploy_summary(await asyncio.to_thread(deployer.deploy, flow_json))
                             except json.JSONDecodeError:
                                 print(f"\n🤖 Agent Response:\n{response_text}")
                         else:
@@ -1,3 +1,4 @@
+import argparse
 import asyncio
 import os
 import sys
@@ -10,6 +11,9 @@ from langchain_core.messages import SystemMessage, HumanMessage
 from prompts_with_node_wot import SYSTEM_PROMPT     # change this file for a different system prompt
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
 import utils
+from flow_layout import layout_flow
+from instrumentation import instrument
+from local_batch import LocalBatchScheduler, generate_batch, read_requirements
 
 load_dotenv()
 
@@ -19,13 +23,13 @@ utils.configure_langsmith_tracing()
 VERBOSE = True
 
 # Initialize LM Studio (Gemma2) model as in lmstudio.py
-model = init_chat_model(
+model = instrument(init_chat_model(
     model=utils.LLM_VERSION,
     model_provider="openai",
     base_url="http://localhost:1234/v1",
     api_key="not-needed",
     temperature=utils.LLM_TEMPERATURE,
-)
+), "vanilla_generator_lmstudio")
 
 def load_all_tds_from_config(config_path: str) -> List[dict]:
     tds = []
@@ -44,6 +48,11 @@ def load_all_tds_from_config(config_path: str) -> List[dict]:
 
 
 async def main():
+    parser = argparse.ArgumentParser(description="Node-RED workflow generator (LM Studio)")
+    parser.add_argument("--batch", help="Generate one flow per requirement in this file (one per line) concurrently")
+    parser.add_argument("--out", help="Transcript file for --batch results")
+    args = parser.parse_args()
+
     # Load all TDs from things-config.json
     config_path = os.path.abspath(
         os.path.join(os.path.dirname(__file__), '..', '..', '..', 'iot-systems/smart-home-09-devices', 'things-config.json')
@@ -56,6 +65,15 @@ async def main():
     limited_tds = all_tds[:3]
     system_prompt = SYSTEM_PROMPT.replace("{ALL_TDS}", json.dumps(limited_tds, separators=(",", ":")))
 
+    if args.batch:
+        # Keep the local server's batch slots busy instead of sending one request at a time
+        scheduler = LocalBatchScheduler(model)
+        try:
+            await generate_batch(scheduler, system_prompt, read_requirements(args.batch), args.out)
+        finally:
+            await scheduler.close()
+        return
+
     print("\n🤖 Node-RED Workflow Generator ready!")
     print("Describe the workflow you want (e.g., 'Blink LEDs when washing machine cycle has finished.')")
     print("Type 'bye' or 'exit' to exit.\n")
@@ -84,6 +102,9 @@ async def main():
                 response_text = response.content
                 try:
                     flow_json = json.loads(response_text)
+                    if isinstance(flow_json, list):
+                        # Coordinates come from the wires, not from the model
+                        flow_json = layout_flow(flow_json)
                     print(f"\n📝 Generated Node-RED Workflow:\n")
                     print(json.dumps(flow_json, indent=2))
                 except json.JSONDecodeError:
@@ -13,13 +13,14 @@ const NODE_RED_URL = process.env.NODE_RED_URL || "http://localhost:1880";
 const NODE_RED_API_BASE = `${NODE_RED_URL}`;
 
 // Helper function to make Node-RED API calls
-async function nodeRedAPI(method, endpoint, data = null) {
+async function nodeRedAPI(method, endpoint, data = null, headers = {}) {
   try {
     const config = {
       method,
       url: `${NODE_RED_API_BASE}${endpoint}`,
       headers: {
         "Content-Type": "application/json",
+        ...headers,
       },
     };
 
@@ -34,6 +35,122 @@ async function nodeRedAPI(method, endpoint, data = null) {
   }
 }
 
+// Flow cache: how long a fetched configuration is trusted before revalidating its rev
+const FLOW_CACHE_TTL_MS = parseInt(process.env.FLOW_CACHE_TTL_MS || "2000", 10);
+
+// Indexed, revision-aware cache of the deployed flows.
+// Lookups are served from in-memory indexes; /flows is re-fetched at most once per TTL
+// (or after a write), and the indexes are only rebuilt when the flows revision changed.
+class FlowCache {
+  constructor(ttlMs = FLOW_CACHE_TTL_MS) {
+    this.ttlMs = ttlMs;
+    this.rev = null;
+    this.flows = [];
+    this.fetchedAt = 0;
+    this.pending = null;
+    // Bumped by invalidate(), so a fetch that was already running cannot store older flows
+    this.generation = 0;
+    this.views = new Map();
+    this.index([]);
+  }
+
+  index(flows) {
+    this.flows = flows;
+    this.byId = new Map();
+    this.byType = new Map();
+    this.byTab = new Map();
+    this.tabs = [];
+    this.searchText = [];
+    for (const node of flows) {
+      this.byId.set(node.id, node);
+      if (!this.byType.has(node.type)) this.byType.set(node.type, []);
+      this.byType.get(node.type).push(node);
+      if (node.type === "tab") this.tabs.push(node);
+      if (node.z) {
+        if (!this.byTab.has(node.z)) this.byTab.set(node.z, []);
+        this.byTab.get(node.z).push(node);
+      }
+      this.searchText.push([
+        (node.name || "").toLowerCase(),
+        (node.label || "").toLowerCase(),
+        (node.type || "").toLowerCase(),
+      ]);
+    }
+    // Rendered views (formatted text, visualizations) belong to one revision
+    this.views.clear();
+  }
+
+  // Returns false when the result was discarded because the cache was invalidated meanwhile
+  async refresh() {
+    const generation = this.generation;
+    const data = await nodeRedAPI("GET", "/flows", null, { "Node-RED-API-Version": "v2" });
+    if (generation !== this.generation) return false;
+    const flows = Array.isArray(data) ? data : (data.flows || []);
+    // v1 servers have no rev, so fall back to re-indexing on every fetch
+    const rev = Array.isArray(data) ? null : data.rev;
+    if (rev == null || rev !== this.rev || this.fetchedAt === 0) {
+      this.index(flows);
+      this.rev = rev;
+    }
+    this.fetchedAt = Date.now();
+    return true;
+  }
+
+  // Make sure the indexes reflect the deployed revision (at most one fetch in flight)
+  async ensureFresh() {
+    if (this.fetchedAt && Date.now() - this.fetchedAt < this.ttlMs) return this;
+    if (!this.pending) {
+      const pending = this.refresh().finally(() => {
+        if (this.pending === pending) this.pending = null;
+      });
+      this.pending = pending;
+    }
+    if (!(await this.pending)) return this.ensureFresh();
+    return this;
+  }
+
+  // Called after create/update/delete so the next lookup revalidates immediately
+  invalidate() {
+    this.generation++;
+    this.fetchedAt = 0;
+    this.pending = null;
+  }
+
+  findByType(type) {
+    return this.byType.get(type) || [];
+  }
+
+  nodesInTab(tabId) {
+    return this.byTab.get(tabId) || [];
+  }
+
+  findTab(idOrLabel) {
+    const tab = this.byId.get(idOrLabel);
+    if (tab && tab.type === "tab") return tab;
+    return this.tabs.find((t) => t.label === idOrLabel);
+  }
+
+  search(query) {
+    const q = query.toLowerCase();
+    const matches = [];
+    for (let i = 0; i < this.flows.length; i++) {
+      const [name, label, type] = this.searchText[i];
+      if (name.includes(q) || label.includes(q) || type.includes(q)) {
+        matches.push(this.flows[i]);
+      }
+    }
+    return matches;
+  }
+
+  // Memoize a rendered view for the current revision
+  view(key, render) {
+    if (!this.views.has(key)) this.views.set(key, render());
+    return this.views.get(key);
+  }
+}
+
+const flowCache = new FlowCache();
+
 // Create MCP server
 const server = new Server(
   {
@@ -219,12 +336,14 @@ server.setRequestHandler(CallToolRequestSchema, async (request) => {
   try {
     switch (name) {
       case "get-flows": {
-        const flows = await nodeRedAPI("GET", "/flows");
+        const cache = await flowCache.ensureFresh();
         return {
           content: [
             {
               type: "text",
-              text: JSON.stringify(flows, null, 2),
+              text: cache.view("get-flows", () =>
+                JSON.stringify({ rev: cache.rev, flows: cache.flows }, null, 2)
+              ),
             },
           ],
         };
@@ -244,10 +363,7 @@ server.setRequestHandler(CallToolRequestSchema, async (request) => {
           };
         } catch (error) {
           // If ID lookup fails, try searching by label
-          const flows = await nodeRedAPI("GET", "/flows");
-          const flowTab = flows.flows.find(
-            (f) => f.label === args.id && f.type === "tab"
-          );
+          const flowTab = (await flowCache.ensureFresh()).findTab(args.id);
           if (!flowTab) {
             throw new Error(`Flow not found: ${args.id}`);
           }
@@ -265,11 +381,8 @@ server.setRequestHandler(CallToolRequestSchema, async (request) => {
       }
 
       case "list-tabs": {
-        const flows = await nodeRedAPI("GET", "/flows");
-        // Handle both array response and object with flows property
-        const flowsArray = Array.isArray(flows) ? flows : (flows.flows || []);
-        const tabs = flowsArray.filter((f) => f.type === "tab");
-        const tabList = tabs.map((t) => ({
+        const cache = await flowCache.ensureFresh();
+        const tabList = cache.tabs.map((t) => ({
           id: t.id,
           label: t.label,
           disabled: t.disabled || false,
@@ -303,6 +416,7 @@ server.setRequestHandler(CallToolRequestSchema, async (request) => {
         };
 
         await nodeRedAPI("POST", "/flow", flowData);
+        flowCache.invalidate();
 
         return {
           content: [
@@ -330,6 +444,7 @@ server.setRequestHandler(CallToolRequestSchema, async (request) => {
         };
 
         await nodeRedAPI("PUT", `/flow/${args.id}`, updatedFlow);
+        flowCache.invalidate();
 
         return {
           content: [
@@ -347,6 +462,7 @@ server.setRequestHandler(CallToolRequestSchema, async (request) => {
         const flow = await nodeRedAPI("GET", `/flow/${args.id}`);
 
         await nodeRedAPI("DELETE", `/flow/${args.id}`);
+        flowCache.invalidate();
 
         return {
           content: [
@@ -359,25 +475,26 @@ server.setRequestHandler(CallToolRequestSchema, async (request) => {
       }
 
       case "get-flows-formatted": {
-        const flows = await nodeRedAPI("GET", "/flows");
-        const tabs = flows.flows.filter((f) => f.type === "tab");
-
-        let formatted = "Node-RED Flows Overview\n" + "=".repeat(50) + "\n\n";
-
-        for (const tab of tabs) {
-          const tabNodes = flows.flows.filter((n) => n.z === tab.id);
-          formatted += `Flow: ${tab.label} (${tab.id})\n`;
-          formatted += `  Disabled: ${tab.disabled || false}\n`;
-          formatted += `  Nodes: ${tabNodes.length}\n`;
-
-          if (tabNodes.length > 0) {
-            formatted += "  Node List:\n";
-            for (const node of tabNodes) {
-              formatted += `    - ${node.type}: "${node.name || "unnamed"}" (${node.id})\n`;
+        const cache = await flowCache.ensureFresh();
+        const formatted = cache.view("formatted", () => {
+          let text = "Node-RED Flows Overview\n" + "=".repeat(50) + "\n\n";
+
+          for (const tab of cache.tabs) {
+            const tabNodes = cache.nodesInTab(tab.id);
+            text += `Flow: ${tab.label} (${tab.id})\n`;
+            text += `  Disabled: ${tab.disabled || false}\n`;
+            text += `  Nodes: ${tabNodes.length}\n`;
+
+            if (tabNodes.length > 0) {
+              text += "  Node List:\n";
+              for (const node of tabNodes) {
+                text += `    - ${node.type}: "${node.name || "unnamed"}" (${node.id})\n`;
+              }
             }
+            text += "\n";
           }
-          formatted += "\n";
-        }
+          return text;
+        });
 
         return {
           content: [
@@ -390,10 +507,7 @@ server.setRequestHandler(CallToolRequestSchema, async (request) => {
       }
 
       case "find-nodes-by-type": {
-        const flows = await nodeRedAPI("GET", "/flows");
-        const matchingNodes = flows.flows.filter(
-          (n) => n.type === args.type
-        );
+        const matchingNodes = (await flowCache.ensureFresh()).findByType(args.type);
 
         return {
           content: [
@@ -406,14 +520,7 @@ server.setRequestHandler(CallToolRequestSchema, async (request) => {
       }
 
       case "search-nodes": {
-        const flows = await nodeRedAPI("GET", "/flows");
-        const query = args.query.toLowerCase();
-        const matchingNodes = flows.flows.filter(
-          (n) =>
-            n.name?.toLowerCase().includes(query) ||
-            n.label?.toLowerCase().includes(query) ||
-            n.type?.toLowerCase().includes(query)
-        );
+        const matchingNodes = (await flowCache.ensureFresh()).search(args.query);
 
         return {
           content: [
@@ -455,33 +562,34 @@ server.setRequestHandler(CallToolRequestSchema, async (request) => {
       }
 
       case "visualize-flows": {
-        const flows = await nodeRedAPI("GET", "/flows");
-        let tabs = flows.flows.filter((f) => f.type === "tab");
+        const cache = await flowCache.ensureFresh();
+        const tabs = args.flowId
+          ? cache.tabs.filter((t) => t.id === args.flowId)
+          : cache.tabs;
 
-        if (args.flowId) {
-          tabs = tabs.filter((t) => t.id === args.flowId);
-        }
+        const visualization = cache.view(`visualize:${args.flowId || ""}`, () => {
+          let text = "Node-RED Flow Visualization\n" + "=".repeat(60) + "\n\n";
 
-        let visualization = "Node-RED Flow Visualization\n" + "=".repeat(60) + "\n\n";
+          for (const tab of tabs) {
+            const tabNodes = cache.nodesInTab(tab.id);
+            text += `┌─ ${tab.label} (${tab.id})\n`;
+            text += `│  Nodes: ${tabNodes.length}\n`;
+            text += `│\n`;
 
-        for (const tab of tabs) {
-          const tabNodes = flows.flows.filter((n) => n.z === tab.id);
-          visualization += `┌─ ${tab.label} (${tab.id})\n`;
-          visualization += `│  Nodes: ${tabNodes.length}\n`;
-          visualization += `│\n`;
-
-          for (const node of tabNodes) {
-            const wires = node.wires ? node.wires.flat().filter(Boolean) : [];
-            visualization += `│  [${node.type}] ${node.name || "unnamed"}\n`;
-            visualization += `│    ID: ${node.id}\n`;
-
-            if (wires.length > 0) {
-              visualization += `│    Wires to: ${wires.join(", ")}\n`;
+            for (const node of tabNodes) {
+              const wires = node.wires ? node.wires.flat().filter(Boolean) : [];
+              text += `│  [${node.type}] ${node.name || "unnamed"}\n`;
+              text += `│    ID: ${node.id}\n`;
+
+              if (wires.length > 0) {
+                text += `│    Wires to: ${wires.join(", ")}\n`;
+              }
+              text += `│\n`;
             }
-            visualization += `│\n`;
+            text += `└${"─".repeat(58)}\n\n`;
           }
-          visualization += `└${"─".repeat(58)}\n\n`;
-        }
+          return text;
+        });
 
         return {
           content: [
@@ -1,22 +1,41 @@
+import crypto from 'crypto';
 import http from 'http';
 
 const PORT = 8101;
 
 // In-memory TD registry (replace with a DB for production)
 const things = [];
+// Served as ETag so clients can poll with If-None-Match. A hash of the content (not a
+// counter), so an ETag from before a restart only matches the same registry
+let body = '';
+let etag = '';
+function updateListing() {
+  body = JSON.stringify({ things });
+  etag = `"${crypto.createHash('sha1').update(body).digest('hex')}"`;
+}
+updateListing();
 
 const server = http.createServer(async (req, res) => {
   if (req.method === 'GET' && req.url === '/things') {
-    res.writeHead(200, { 'Content-Type': 'application/json' });
-    res.end(JSON.stringify({ things }));
+    if (req.headers['if-none-match'] === etag) {
+      res.writeHead(304, { ETag: etag });
+      res.end();
+      return;
+    }
+    res.writeHead(200, { 'Content-Type': 'application/json', ETag: etag });
+    res.end(body);
   } else if (req.method === 'POST' && req.url === '/things') {
     // Optional: allow dynamic registration
-    let body = '';
-    req.on('data', chunk => { body += chunk; });
+    let payload = '';
+    req.on('data', chunk => { payload += chunk; });
     req.on('end', () => {
       try {
-        const td = JSON.parse(body);
-        things.push(td);
+        const td = JSON.parse(payload);
+        // A restarted device registers again; replace its old TD instead of duplicating it
+        const key = td.id || td.title;
+        const index = things.findIndex(t => (t.id || t.title) === key);
+        if (index >= 0) things[index] = td; else things.push(td);
+        updateListing();
         console.log(`Device registered: ${td.title || td.deviceName || 'Unknown'}`);
         res.writeHead(201, { 'Content-Type': 'application/json' });
         res.end(JSON.stringify({ status: 'registered', td }));
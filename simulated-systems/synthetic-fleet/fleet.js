@@ -0,0 +1,215 @@
+// synthetic-fleet/fleet.js
+// Exposes N synthetic Things from one Servient (one HTTP port), serves them from an
+// in-process TDD and writes a matching things-config.json and TDD.json.
+//
+//   node fleet.js --count 1000 --rate 2 --mix motionSensor=3,light=2
+import crypto from 'crypto';
+import fs from 'fs';
+import http from 'http';
+import path from 'path';
+import { fileURLToPath } from 'url';
+import { parseArgs } from 'util';
+import { Servient } from '@node-wot/core';
+import * as httpBinding from '@node-wot/binding-http';
+import { TEMPLATES, DEFAULT_MIX } from './templates.js';
+
+const HttpServer = httpBinding.HttpServer || httpBinding.default?.HttpServer;
+const here = path.dirname(fileURLToPath(import.meta.url));
+
+const { values: args } = parseArgs({
+    options: {
+        count: { type: 'string', default: '100' },
+        port: { type: 'string', default: '8500' },
+        'tdd-port': { type: 'string', default: '8501' },
+        host: { type: 'string', default: 'localhost' },
+        seed: { type: 'string', default: '1' },
+        // Event frequency multiplier: 2 = events twice as often as the hand-written simulators
+        rate: { type: 'string', default: '1' },
+        mix: { type: 'string' },
+        out: { type: 'string', default: here },
+        'no-events': { type: 'boolean', default: false }
+    }
+});
+
+const count = parseInt(args.count, 10);
+const port = parseInt(args.port, 10);
+const tddPort = parseInt(args['tdd-port'], 10);
+const rate = parseFloat(args.rate);
+
+// Small seeded PRNG (mulberry32) so a fleet is reproducible for benchmarks
+function createRandom(seed) {
+    let a = seed >>> 0;
+    return () => {
+        a = (a + 0x6D2B79F5) >>> 0;
+        let t = a;
+        t = Math.imul(t ^ (t >>> 15), t | 1);
+        t ^= t + Math.imul(t ^ (t >>> 7), t | 61);
+        return ((t ^ (t >>> 14)) >>> 0) / 4294967296;
+    };
+}
+const random = createRandom(parseInt(args.seed, 10));
+
+function parseMix(spec) {
+    if (!spec) return DEFAULT_MIX;
+    const mix = {};
+    for (const item of spec.split(',').filter(Boolean)) {
+        const [kind, weight] = item.split('=');
+        if (!TEMPLATES[kind]) {
+            console.error(`Unknown device kind '${kind}'. Known: ${Object.keys(TEMPLATES).join(', ')}`);
+            process.exit(1);
+        }
+        mix[kind] = parseInt(weight || '1', 10);
+    }
+    return mix;
+}
+
+// Weighted round-robin over the mix, so every prefix of the fleet has the same proportions
+function planFleet(n, mix) {
+    const cycle = Object.entries(mix).flatMap(([kind, weight]) => Array(weight).fill(kind));
+    const width = String(n).length;
+    const counters = {};
+    return Array.from({ length: n }, (_, i) => {
+        const kind = cycle[i % cycle.length];
+        counters[kind] = (counters[kind] || 0) + 1;
+        return { kind, title: `${TEMPLATES[kind].title}${String(counters[kind]).padStart(width, '0')}` };
+    });
+}
+
+class EventEmitterSimulator {
+    constructor(emitter, emitFn) {
+        this.emitter = emitter;
+        this.emitFn = emitFn;
+        this._timeout = null;
+    }
+    start() {
+        this.stop();
+        const { minDelay, maxDelay } = this.emitter;
+        const schedule = () => {
+            const delay = (random() * (maxDelay - minDelay) + minDelay) / rate;
+            this._timeout = setTimeout(() => {
+                this.emitFn();
+                schedule();
+            }, delay);
+        };
+        schedule();
+    }
+    stop() {
+        if (this._timeout) clearTimeout(this._timeout);
+        this._timeout = null;
+    }
+}
+
+const stats = { events: 0, actions: 0, reads: 0 };
+
+async function exposeDevice(WoT, { kind, title }) {
+    const template = TEMPLATES[kind];
+    const thing = await WoT.produce({
+        title,
+        description: template.description,
+        "@context": ["https://www.w3.org/2022/wot/td/v1.1"],
+        "@type": ["Thing"],
+        securityDefinitions: { no_sec: { scheme: "nosec" } },
+        security: ["no_sec"],
+        properties: template.properties,
+        actions: template.actions,
+        events: template.events
+    });
+
+    const state = { temperature: 18 + random() * 6, volume: 50 };
+    let sim = null;
+    if (template.emitter) {
+        const { event, property, data } = template.emitter;
+        sim = new EventEmitterSimulator(template.emitter, () => {
+            if (property === 'temperature') {
+                state.temperature = Math.round((state.temperature + (random() - 0.5)) * 10) / 10;
+            }
+            thing.emitEvent(event, property ? state[property] : data());
+            stats.events++;
+        });
+    }
+
+    for (const name of Object.keys(template.properties)) {
+        thing.setPropertyReadHandler(name, async () => {
+            stats.reads++;
+            return state[name];
+        });
+    }
+    for (const name of Object.keys(template.actions)) {
+        thing.setActionHandler(name, async (input) => {
+            stats.actions++;
+            let params = input;
+            if (typeof input?.value === 'function') params = await input.value();
+            if (sim && name === template.startAction) sim.start();
+            if (sim && name === template.stopAction) sim.stop();
+            if (name === 'setVolume') state.volume = params?.percentage ?? state.volume;
+            if (name === 'getVolume' || name === 'setVolume') return state.volume;
+            if (name === 'blink') return 'blinking';
+            return undefined;
+        });
+    }
+
+    await thing.expose();
+    if (sim && !args['no-events']) sim.start();
+    return thing.getThingDescription();
+}
+
+// In-process directory, same API as smart-home/TDD.js (GET /things with ETag)
+function serveDirectory(things) {
+    const body = JSON.stringify({ things });
+    // A hash of the served TDs, so a fleet restarted with other options never answers a stale 304
+    const etag = `"${crypto.createHash('sha1').update(body).digest('hex')}"`;
+    const server = http.createServer((req, res) => {
+        if (req.method === 'GET' && req.url === '/things') {
+            if (req.headers['if-none-match'] === etag) {
+                res.writeHead(304, { ETag: etag });
+                res.end();
+                return;
+            }
+            res.writeHead(200, { 'Content-Type': 'application/json', ETag: etag });
+            res.end(body);
+        } else {
+            res.writeHead(404, { 'Content-Type': 'application/json' });
+            res.end(JSON.stringify({ error: 'Not found' }));
+        }
+    });
+    server.listen(tddPort, () => {
+        console.log(`TDD server running at http://${args.host}:${tddPort}/things`);
+    });
+}
+
+function writeListings(fleet, tds) {
+    fs.mkdirSync(args.out, { recursive: true });
+    const config = {
+        things: fleet.map(({ title }) => ({
+            protocol: "http",
+            deviceName: title,
+            url: `http://${args.host}:${port}/${title.toLowerCase()}`
+        }))
+    };
+    fs.writeFileSync(path.join(args.out, 'things-config.json'), JSON.stringify(config, null, 2));
+    fs.writeFileSync(path.join(args.out, 'TDD.json'), JSON.stringify({ things: tds }, null, 2));
+    console.log(`Wrote things-config.json and TDD.json (${tds.length} Things) to ${args.out}`);
+}
+
+const fleet = planFleet(count, parseMix(args.mix));
+const servient = new Servient();
+servient.addServer(new HttpServer({ port: port }));
+
+servient.start().then(async (WoT) => {
+    const started = Date.now();
+    const tds = [];
+    for (const device of fleet) {
+        tds.push(await exposeDevice(WoT, device));
+    }
+    console.log(`Exposed ${tds.length} Things on http://${args.host}:${port} in ${Date.now() - started} ms`);
+
+    writeListings(fleet, tds);
+    serveDirectory(tds);
+
+    let last = { ...stats };
+    setInterval(() => {
+        const rates = Object.fromEntries(Object.keys(stats).map(k => [k, (stats[k] - last[k]) / 10]));
+        console.log(`📊 events/s=${rates.events} actions/s=${rates.actions} reads/s=${rates.reads}`);
+        last = { ...stats };
+    }, 10000);
+});
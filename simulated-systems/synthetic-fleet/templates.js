@@ -0,0 +1,138 @@
+// Device templates for the synthetic fleet, modelled on smart-home/devices/*.js.
+// Each template describes the TD affordances of one device kind and, for event sources,
+// how often the simulator emits (random delay between minDelay and maxDelay ms, as in
+// the hand-written simulators).
+
+const eventSource = (title, description, startAction, stopAction, event) => ({
+    title,
+    description,
+    properties: {},
+    actions: {
+        [startAction]: { description: `Start the ${title.toLowerCase()} simulation` },
+        [stopAction]: { description: `Stop the ${title.toLowerCase()} simulation` }
+    },
+    events: { [event.name]: event.affordance },
+    emitter: { event: event.name, data: event.data, minDelay: 5000, maxDelay: 15000 },
+    startAction,
+    stopAction
+});
+
+export const TEMPLATES = {
+    motionSensor: eventSource("MotionSensor", "Simulated motion sensor device", "startMotion", "stopMotion", {
+        name: "motionDetected",
+        affordance: {
+            title: "Motion detected",
+            description: "An event made when motion is detected",
+            data: { type: "null" }
+        },
+        data: () => null
+    }),
+    doorBell: eventSource("DoorBell", "Simulated doorbell that emits bellRung events", "startBell", "stopBell", {
+        name: "bellRung",
+        affordance: { title: "Bell rung", description: "The bell was rung", data: { type: "null" } },
+        data: () => null
+    }),
+    alarm: eventSource("Alarm", "Simulated alarm that emits alarmRinging events", "startAlarm", "stopAlarm", {
+        name: "alarmRinging",
+        affordance: { title: "Alarm Ringing", data: { type: "null" } },
+        data: () => null
+    }),
+    washingMachine: eventSource("WashingMachine", "A simulated washing machine device", "startCycle", "stopCycle", {
+        name: "finishedCycle",
+        affordance: {
+            title: "Wash cycle complete",
+            description: "Sends a notification at the end of a wash cycle",
+            data: { type: "object" }
+        },
+        data: () => ({ message: "Wash cycle finished!", timestamp: new Date().toISOString() })
+    }),
+    temperatureSensor: {
+        title: "TemperatureSensor",
+        description: "Simulated room temperature sensor",
+        properties: {
+            temperature: { type: "number", description: "Current temperature in degrees C", readOnly: true }
+        },
+        actions: {},
+        events: {
+            temperatureChanged: {
+                title: "Temperature changed",
+                description: "Emitted with every new temperature reading",
+                data: { type: "number" }
+            }
+        },
+        emitter: { event: "temperatureChanged", property: "temperature", minDelay: 5000, maxDelay: 15000 }
+    },
+    heater: {
+        title: "Heater",
+        description: "Simulated heater device",
+        properties: {},
+        actions: {
+            startHeater: {
+                title: "Start heater",
+                description: "Starts the heater at the given temperature for the given time",
+                input: {
+                    type: "object",
+                    properties: {
+                        temperature: { type: "integer", description: "The temperature in degrees C to set for this heater" },
+                        timeHeating: { type: "integer", description: "The number of minutes to continue heat for" }
+                    }
+                }
+            }
+        },
+        events: {}
+    },
+    light: {
+        title: "Light",
+        description: "Simulated room light device",
+        properties: {},
+        actions: {
+            lightOn: { title: "Turn light on", description: "Turns the light on" },
+            lightOff: { title: "Turn light off", description: "Turns the light off" }
+        },
+        events: {}
+    },
+    leds: {
+        title: "LEDs",
+        description: "A simulated LEDs device",
+        properties: {},
+        actions: {
+            blink: { title: "Blink LEDs", description: "Blinks the LEDs", output: { type: "string" } },
+            LEDsOn: { title: "Turn LEDs on", description: "Turns on the LEDs" },
+            LEDsOff: { title: "Turn LEDs off", description: "Turns off the LEDs" }
+        },
+        events: {}
+    },
+    speaker: {
+        title: "Speaker",
+        description: "Simulated speaker device",
+        properties: {},
+        actions: {
+            setVolume: {
+                title: "Set volume",
+                description: "Sets the volume of this speaker",
+                input: {
+                    type: "object",
+                    properties: {
+                        percentage: { type: "integer", description: "The volume percentage to set this speaker to" }
+                    }
+                },
+                output: { type: "integer" }
+            },
+            getVolume: { title: "Get volume", description: "Gets the volume of this speaker", output: { type: "integer" } }
+        },
+        events: {}
+    }
+};
+
+// Default fleet mix: roughly one event source per actuator, like the smart home
+export const DEFAULT_MIX = {
+    motionSensor: 3,
+    doorBell: 1,
+    alarm: 1,
+    washingMachine: 1,
+    temperatureSensor: 2,
+    heater: 1,
+    light: 3,
+    leds: 1,
+    speaker: 1
+};
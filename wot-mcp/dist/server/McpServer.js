@@ -14,6 +14,9 @@ import { InMemoryEventStore } from '@modelcontextprotocol/sdk/examples/shared/in
 import { SubscribeRequestSchema, UnsubscribeRequestSchema } from '@modelcontextprotocol/sdk/types.js';
 import { EventBuffer } from './EventBuffer.js';
 import { logger } from '../utils/Logger.js';
+const tdFormatSchema = z.enum(['full', 'minified', 'affordances', 'base'])
+    .optional()
+    .describe("Projection of the result: 'full' (default), 'minified', 'affordances' (schemas without forms + base URL) or 'base' (base URL only)");
 export class McpServer {
     config;
     eventBuffer;
@@ -87,18 +90,16 @@ export class McpServer {
         // Tool: list_devices
         server.registerTool("list_devices", {
             description: "List all available devices and their capabilities (properties, actions, events). Use this to discover what you can do.",
-            inputSchema: z.object({})
-        }, async () => {
-            const removeForms = (schema) => {
-                if (!schema || typeof schema !== 'object')
-                    return schema;
-                // Remove protocol binding fields that are irrelevant to the LLM
-                const { forms, op, href, contentType, 'htv:methodName': method, subprotocol, ...rest } = schema;
-                return rest;
-            };
+            inputSchema: z.object({
+                format: tdFormatSchema
+            })
+        }, async (args) => {
+            const format = args?.format ?? 'full';
+            const withBase = format === 'affordances' || format === 'base';
             const devices = Array.from(this.things.values()).map(thing => ({
                 id: thing.id,
                 title: thing.title,
+                ...(withBase ? { base: this.extractBaseUrl(thing) } : {}),
                 actions: thing.actions.map(a => a.wotName),
                 events: thing.events.map(e => e.wotName),
                 properties: thing.properties.map(p => p.wotName)
@@ -106,7 +107,7 @@ export class McpServer {
             return {
                 content: [{
                         type: 'text',
-                        text: JSON.stringify(devices, null, 2)
+                        text: this.serializeForFormat(devices, format)
                     }]
             };
         });
@@ -195,24 +196,21 @@ export class McpServer {
                 };
             }
         });
-        // NEW TOOL: get_thing_description
+        // Tool: get_thing_description
         server.registerTool("get_thing_description", {
-            description: "Retrieve the complete Thing Description (TD) for a device, including all affordance details, forms, and protocol bindings. Use this when you need to generate workflows or understand the exact HTTP endpoints.",
+            description: "Retrieve the Thing Description (TD) for a device, including all affordance details, forms, and protocol bindings. Use format 'affordances' when generating workflows to get the schemas and the device base URL without forms.",
             inputSchema: z.object({
-                device_id: z.string().describe("The ID of the device")
+                device_id: z.string().describe("The ID of the device"),
+                format: tdFormatSchema
             })
         }, async (args) => {
             try {
-                const thing = this.things.get(args.device_id);
-                if (!thing)
-                    throw new Error(`Device '${args.device_id}' not found.`);
-                if (!thing.originalTd) {
-                    throw new Error(`Thing Description not available for '${args.device_id}'.`);
-                }
+                const format = args.format ?? 'full';
+                const thing = this.getThingWithTd(args.device_id);
                 return {
                     content: [{
                             type: 'text',
-                            text: JSON.stringify(thing.originalTd, null, 2)
+                            text: this.serializeForFormat(this.projectThingDescription(thing, format), format)
                         }]
                 };
             }
@@ -226,6 +224,123 @@ export class McpServer {
                 };
             }
         });
+        // Tool: get_thing_descriptions (batched variant)
+        server.registerTool("get_thing_descriptions", {
+            description: "Retrieve the Thing Descriptions of several devices in one call. Returns an object keyed by device ID. Prefer this over repeated get_thing_description calls.",
+            inputSchema: z.object({
+                device_ids: z.array(z.string()).describe("The IDs of the devices"),
+                format: tdFormatSchema
+            })
+        }, async (args) => {
+            const format = args.format ?? 'full';
+            const descriptions = {};
+            const errors = {};
+            for (const deviceId of args.device_ids ?? []) {
+                try {
+                    descriptions[deviceId] = this.projectThingDescription(this.getThingWithTd(deviceId), format);
+                }
+                catch (error) {
+                    errors[deviceId] = error.message || String(error);
+                }
+            }
+            if (Object.keys(descriptions).length === 0) {
+                return {
+                    isError: true,
+                    content: [{
+                            type: 'text',
+                            text: `Error: ${JSON.stringify(errors)}`
+                        }]
+                };
+            }
+            const result = Object.keys(errors).length > 0 ? { ...descriptions, errors } : descriptions;
+            return {
+                content: [{
+                        type: 'text',
+                        text: this.serializeForFormat(result, format)
+                    }]
+            };
+        });
+    }
+    /**
+     * Look up a registered thing that still has its original TD
+     */
+    getThingWithTd(deviceId) {
+        const thing = this.things.get(deviceId);
+        if (!thing)
+            throw new Error(`Device '${deviceId}' not found.`);
+        if (!thing.originalTd) {
+            throw new Error(`Thing Description not available for '${deviceId}'.`);
+        }
+        return thing;
+    }
+    /**
+     * Apply a TdFormat projection to a thing's original TD
+     */
+    projectThingDescription(thing, format) {
+        const td = thing.originalTd;
+        if (format === 'base') {
+            return { id: thing.id, title: thing.title, base: this.extractBaseUrl(thing) };
+        }
+        if (format === 'affordances') {
+            const project = (affordances) => {
+                if (!affordances)
+                    return undefined;
+                const projected = {};
+                for (const [name, affordance] of Object.entries(affordances)) {
+                    projected[name] = this.stripBindings(affordance);
+                }
+                return projected;
+            };
+            return {
+                id: thing.id,
+                title: thing.title,
+                description: td.description,
+                base: this.extractBaseUrl(thing),
+                properties: project(td.properties),
+                actions: project(td.actions),
+                events: project(td.events)
+            };
+        }
+        return td;
+    }
+    /**
+     * Remove protocol binding fields and default-valued flags from an affordance
+     */
+    stripBindings(affordance) {
+        if (!affordance || typeof affordance !== 'object')
+            return affordance;
+        // Remove protocol binding fields that are irrelevant to the LLM
+        const { forms, op, href, contentType, 'htv:methodName': method, subprotocol, ...rest } = affordance;
+        for (const flag of ['readOnly', 'writeOnly', 'observable', 'safe', 'idempotent']) {
+            if (rest[flag] === false)
+                delete rest[flag];
+        }
+        return rest;
+    }
+    /**
+     * Derive the device root URL (used as tdLink) from the TD base or its forms.
+     * e.g. http://host:8082/washingmachine/events/finishedCycle -> http://host:8082/washingmachine
+     */
+    extractBaseUrl(thing) {
+        const base = thing.originalTd?.base;
+        if (typeof base === 'string' && base) {
+            return base.replace(/\/$/, '');
+        }
+        const affordances = [...thing.properties, ...thing.actions, ...thing.events];
+        for (const affordance of affordances) {
+            for (const form of affordance.affordance?.forms ?? []) {
+                const match = form.href.match(/^(.*?)\/(properties|actions|events)(\/|$)/);
+                if (match)
+                    return match[1];
+            }
+        }
+        return undefined;
+    }
+    /**
+     * Serialize a tool result; only the 'full' format is pretty-printed
+     */
+    serializeForFormat(value, format) {
+        return format === 'full' ? JSON.stringify(value, null, 2) : JSON.stringify(value);
     }
     /**
      * Set up handlers for resource subscription requests on a specific server